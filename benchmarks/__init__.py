@@ -0,0 +1,4 @@
+# -*- coding: utf-8 -*-
+
+""" Benchmarks for huh; run with "python -m benchmarks" from the repository root.
+"""
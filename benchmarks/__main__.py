@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+
+""" Benchmark suite: times the hot paths of huh and stores the results per git commit.
+
+    python -m benchmarks                      run everything, save benchmarks/results/<commit>.json
+    python -m benchmarks --only huquq_scalar  run some (comma separated)
+    python -m benchmarks --compare abc1234    also print the change against a saved run
+
+    Each benchmark is run --repeat times and the best time is kept (as timeit does), since
+    slower runs are noise from the rest of the system rather than the code.
+"""
+
+# Standard library
+import argparse
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import os
+from pathlib import Path
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+
+ROOT = Path(__file__).resolve().parent.parent
+RESULTS = Path(__file__).resolve().parent / "results"
+BENCHMARKS = {}
+
+def benchmark(ops: int):
+    """ Register a benchmark: a function of a scratch directory returning the callable to time, which does ops operations. """
+    def register(fn):
+        BENCHMARKS[fn.__name__] = (fn, ops)
+        return fn
+    return register
+
+
+@benchmark(ops=5)
+def cli_startup_price(tmp: Path):
+    """ Cold start of a process for a run with a user price (no sun, no network). """
+    env = dict(os.environ, HUH_CACHE_DIR=str(tmp), PYTHONPATH=str(ROOT))
+    cmd = [sys.executable, "-m", "huh", "5000", "-p", "usd,2000,oz", "-f", str(ROOT / "huh.ini")]
+    def run():
+        for _ in range(5):
+            subprocess.run(cmd, env=env, cwd=tmp, check=True, stdout=subprocess.DEVNULL)
+    return run
+
+
+@benchmark(ops=100_000)
+def huquq_scalar(tmp: Path):
+    from huh.huquq import Huququllah
+
+    rng = random.Random(19)
+    rows = [ (rng.uniform(0, 1e6), rng.uniform(10, 5000)) for _ in range(100_000) ]
+    def run():
+        for wealth, price in rows:
+            Huququllah(wealth, price)
+    return run
+
+
+@benchmark(ops=1_000_000)
+def huquq_batch(tmp: Path):
+    from huh.huquq import HuququllahBatch
+
+    rng = random.Random(19)
+    wealth = [ rng.uniform(0, 1e6) for _ in range(1_000_000) ]
+    return lambda: HuququllahBatch(wealth, 2412.37)
+
+
+@benchmark(ops=100_000)
+def huquq_batch_exact(tmp: Path):
+    from huh.huquq import HuququllahBatch
+
+    rng = random.Random(19)
+    wealth = [ round(rng.uniform(0, 1e6), 2) for _ in range(100_000) ]
+    return lambda: HuququllahBatch(wealth, 2412.37, exact=True)
+
+
+@benchmark(ops=100)
+def nearest_time_list(tmp: Path):
+    """ Linear nearestTime over a year of per-minute MetalPrice points. """
+    from huh.metal import MetalPrice
+    from huh.spacetime import nearestTime
+
+    points = [ MetalPrice(2000.0 + i % 100, i * 60_000) for i in range(525_600) ]
+    targets = random.Random(19).sample(range(0, 525_600 * 60_000), 100)
+    def run():
+        for target in targets:
+            nearestTime(target, points)
+    return run
+
+
+@benchmark(ops=100_000)
+def nearest_time_series(tmp: Path):
+    """ Bisection over the same points held in a MetalPriceSeries. """
+    from huh.metal import MetalPriceSeries
+
+    series = MetalPriceSeries(range(0, 525_600 * 60_000, 60_000), ( 2000.0 + i % 100 for i in range(525_600) ))
+    targets = [ random.Random(19).randrange(0, 525_600 * 60_000) for _ in range(100_000) ]
+    def run():
+        for target in targets:
+            series.nearest(target)
+    return run
+
+
+@benchmark(ops=525_600)
+def chart_parse_stream(tmp: Path):
+    """ A year of per-minute gold.org chart points parsed in 64 KiB chunks, as fetchGoldOrg reads them. """
+    from huh.metal import ChartParser, MetalPriceSeries
+
+    body = json.dumps({"chartData": {"USD": [ [i * 60_000, 2000.0 + i % 97] for i in range(525_600) ]}}).encode()
+    def run():
+        parser, series = ChartParser(), MetalPriceSeries()
+        for i in range(0, len(body), 64 * 1024):
+            series.extend(parser.feed(body[i:i + 64 * 1024]))
+        series.extend(parser.close())
+    return run
+
+
+def _records(n: int) -> list:
+    now = datetime.now()
+    return [ [now, now, 1713555000000, "2412.37", "oz", "USD", "gold.org", f"{1000 + i}.00", "189.96"] for i in range(n) ]
+
+
+@benchmark(ops=1_000)
+def record_csv_single(tmp: Path):
+    """ One record per call, as the CLI writes them. """
+    from huh.huquq import record
+
+    pkgs = _records(1_000)
+    def run():
+        for pkg in pkgs:
+            record(pkg, tmp / "single.csv")
+    return run
+
+
+@benchmark(ops=100_000)
+def record_csv_many(tmp: Path):
+    from huh.huquq import recordMany
+
+    pkgs = _records(100_000)
+    return lambda: recordMany(pkgs, tmp / "many.csv")
+
+
+@benchmark(ops=100_000)
+def record_ledger_many(tmp: Path):
+    from huh.huquq import recordMany
+
+    pkgs = _records(100_000)
+    return lambda: recordMany(pkgs, tmp / "many.sqlite")
+
+
+class _StubPrices(BaseHTTPRequestHandler):
+    """ Answers every request with a gold.org style chart of per-minute prices for the requested window. """
+
+    protocol_version = "HTTP/1.1"
+    wbufsize = -1   # send headers and body together (flushed after each request)
+
+    def do_GET(self):
+        start, end = ( int(t) for t in self.path.rsplit("/", 1)[1].split(",") )
+        currency = self.path.split("/")[2]
+        data = json.dumps({"chartData": {currency: [ [ts, 2000.0 + ts % 97] for ts in range(start - start % 60_000, end, 60_000) ]}}).encode()
+        self.send_response(200)
+        self.send_header("content-type", "application/json")
+        self.send_header("content-length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+@benchmark(ops=200)
+def metal_price_stub(tmp: Path):
+    """ metal_price end to end (registry, pooled transport, parsing, nearest) against a local server; no cache or history. """
+    from huh.metal import httpGet, metal_price, MetalPriceSeries, Provider, ProviderRegistry
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StubPrices)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}"
+
+    class Stub(Provider):
+        name = "stub"
+
+        def fetch(self, times, currency="USD", timeout=5.0):
+            chart = httpGet(f"{url}/chart/{currency}/{times[0]},{times[1]}", timeout=timeout).json()['chartData']
+            return MetalPriceSeries.fromPoints(chart[currency], currency, source=self.name)
+
+    registry = ProviderRegistry([Stub()])
+    targets = [ datetime(2020, 4, 20, 18, 0).replace(day=1 + i % 28, minute=i % 60) for i in range(200) ]
+    def run():
+        for target in targets:
+            metal_price(target, cache=False, history=False, registry=registry)
+    return run
+
+
+@benchmark(ops=200)
+def serve_huquq(tmp: Path):
+    """ Requests to a running service over one keep-alive connection, with a user price. """
+    from huh.metal import session
+    from huh.server import Service, serve
+
+    server = serve(Service(cache=False, history=False), port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/huquq?wealth=10000&price=2412.37&weight=oz"
+    client = session(url)
+    def run():
+        for _ in range(200):
+            client.get(url).raise_for_status()
+    return run
+
+
+def commit() -> str:
+    """ Short hash of the checked out commit, marked dirty when tracked files have changed """
+    try:
+        sha = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "diff", "--quiet", "HEAD"], cwd=ROOT).returncode != 0
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return f"{sha}-dirty" if dirty else sha
+
+
+def run(names, repeat: int=3) -> dict:
+    """ Time the benchmarks.
+
+    Returns:
+        dict: name -> {"seconds": best time, "ops": operations, "rate": operations per second}
+    """
+
+    results = {}
+    for name in names:
+        fn, ops = BENCHMARKS[name]
+        with tempfile.TemporaryDirectory() as tmp:
+            timed = fn(Path(tmp))
+            times = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                timed()
+                times.append(time.perf_counter() - start)
+
+        best = min(times)
+        results[name] = {"seconds": best, "ops": ops, "rate": ops / best}
+        print(f"{name:24} {best:10.4f} s {ops / best:14,.0f} ops/s")
+
+    return results
+
+
+def compare(results: dict, baseline: dict):
+    """ Print the change in time of each benchmark against a baseline run (positive is slower). """
+    print(f"\nAgainst {baseline['commit']} ({baseline['date']}):")
+    for name, result in results.items():
+        if name in baseline['results']:
+            change = result['seconds'] / baseline['results'][name]['seconds'] - 1
+            print(f"{name:24} {change:+8.1%}{'  <- slower' if change > 0.1 else ''}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Time the hot paths of huh and save the results per commit.")
+    parser.add_argument('--only', type=str, default=None, help=f'Comma separated benchmarks to run: {", ".join(BENCHMARKS)}.')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs of each benchmark; the best is kept.')
+    parser.add_argument('--compare', type=str, default=None, help='Commit (or result file) to compare against.')
+    parser.add_argument('--results', type=str, default=str(RESULTS), help='Directory of saved results.')
+    parser.add_argument('--no-save', action='store_true', help='Do not save the results.')
+    args = parser.parse_args(argv)
+
+    names = [ n.strip() for n in args.only.split(",") ] if args.only else list(BENCHMARKS)
+    if unknown := [ n for n in names if n not in BENCHMARKS ]:
+        parser.error(f"Unknown benchmark: {', '.join(unknown)}")
+
+    sys.path.insert(0, str(ROOT))
+    results = {"commit": commit(), "date": datetime.now().isoformat(timespec="seconds"),
+               "python": platform.python_version(), "machine": platform.machine(), "results": run(names, args.repeat)}
+
+    if not args.no_save:
+        folder = Path(args.results)
+        folder.mkdir(parents=True, exist_ok=True)
+        (file := folder / f"{results['commit']}.json").write_text(json.dumps(results, indent=2))
+        print(f"\nSaved to {file}")
+
+    if args.compare:
+        baseline = Path(args.compare) if Path(args.compare).is_file() else Path(args.results) / f"{args.compare}.json"
+        compare(results['results'], json.loads(baseline.read_text()))
+
+
+if __name__ == '__main__':
+    main()
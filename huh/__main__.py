@@ -6,87 +6,405 @@
 """
 
 # Standard library
+import atexit
 import sys
 from datetime import datetime
 from pathlib import Path
-import ssl
-import logging
 
 # Local imports
 from .__init__ import __title__
-from .settings import arguments, Configuration
-from .huquq import Huququllah, HuququLabels, record
-from .metal import metal_price, MetalPrice
+from .settings import arguments, backfillArguments, exportRecordArguments, importPricesArguments, importRatesArguments, prefetchArguments, reportArguments, serveArguments, solarTableArguments, sweepArguments, Configuration
+from .huquq import cents, Huququllah, HuququLabels, record, recordMany
+from .metal import metal_price, MetalPrice, REGISTRY
+from .cache import PriceCache, KeyValueCache
+from .history import PriceHistory
+from . import timing
 import huh.spacetime as st
 
 def floatFmt(*args):
-    return [ f'{round(x, 2):.2f}' for x in args ]
+    return [ f'{cents(x):.2f}' for x in args ]
 
-def mp_wrapper(tt, usrPrice=None, curr=None):
+def mp_wrapper(tt, usrPrice=None, curr=None, cache=None, history=None):
     if usrPrice:
         curr, prc, unt = usrPrice.split(",")
         val = MetalPrice(price=float(prc), currency=curr, weight=unt.lower(), source="user")
     elif curr:
-        val = metal_price(tt, curr)
+        val = metal_price(tt, curr, cache=cache, history=history)
     else:
-        val = metal_price(tt)
+        val = metal_price(tt, cache=cache, history=history)
     
     return val
 
 
+def setup(args):
+    """ Load the configuration and prepare the caches shared by every command.
+
+    Returns:
+        tuple: (configuration, PriceCache, PriceHistory); caches are None for the defaults, False when disabled
+    """
+    configFile = args.filename if args.filename else "./huh.ini"
+    cfg = Configuration(configFile).conf
+    userPrice = getattr(args, 'price', None) and not record_file(cfg, args)     # the fiscal time is still worked out to be recorded
+
+    cache = history = False if args.no_cache else None
+    if cfg and cfg.has_section('CACHE') and not args.no_cache:
+        cache = PriceCache(cfg['CACHE'].get('file'), cfg['CACHE'].getfloat('ttl', PriceCache.LIVE_TTL))
+        history = PriceHistory(cfg['CACHE']['history']) if cfg.has_option('CACHE', 'history') else None
+    if not args.no_cache and not userPrice:
+        try:
+            cacheFile = cache.file if cache else None
+            gazetteer = KeyValueCache("gazetteer", cacheFile)
+            st.setSolarCache(KeyValueCache("solar", cacheFile))
+            st.setGeocodeCache(KeyValueCache("geocode", cacheFile), gazetteer)
+        except OSError:
+            gazetteer = None
+
+        if gazetteer and cfg and cfg['LOCATION'].get('gazetteer'):
+            try:
+                st.importGazetteer(cfg['LOCATION']['gazetteer'], gazetteer)
+            except (OSError, KeyError, ValueError) as e:
+                print(f"[WARN] Unable to import gazetteer: {e}")
+
+    if cfg and cfg.has_section('PROVIDERS'):
+        for name in cfg['PROVIDERS']:
+            if name == 'strategy':
+                if (strategy := cfg['PROVIDERS']['strategy'].lower()) not in REGISTRY.STRATEGIES:
+                    raise ValueError(f'[PROVIDERS] > strategy value is invalid: "{strategy}"')
+                REGISTRY.strategy = strategy
+            else:
+                REGISTRY.enable(name, cfg['PROVIDERS'].getboolean(name))
+
+    if cfg and cfg.has_option('CACHE', 'solartable') and not userPrice:
+        from .solartable import SolarTable
+        try:
+            st.setSolarTable(SolarTable(cfg['CACHE']['solartable']))
+        except (OSError, ValueError) as e:
+            print(f"[WARN] Unable to open solar table: {e}")
+
+    return cfg, cache, history
+
+
+def record_file(cfg, args) -> Path:
+    """ File the run is recorded in (from the configuration, else --output), or None when nothing is recorded. """
+    if cfg:
+        f = Path(cfg['RECORD']['file']) if 'file' in cfg['RECORD'] else None
+    else:
+        f = Path(args.output) if getattr(args, 'output', None) else None
+    return f if f and f.parent.is_dir() else None
+
+
+def fiscal_time(cfg) -> datetime:
+    """ Date and time for the price search: the configured fiscal moment, or sunset on 04-20 at Bahjí without a configuration. """
+    if not cfg:
+        # dateTmp = datetime.strptime(, "%m-%d")
+        dateTmp = st.setAndFixFiscalDate("04-20")
+        timeTmp = st.getSolarTime(date=dateTmp)
+        return datetime.combine(dateTmp, timeTmp.time())
+
+    # Determine time period for when gold prices should be gathered
+    cfg_loc = cfg['LOCATION']
+    address = f"{cfg_loc['city']} {cfg_loc['state']} {cfg_loc['country']}"
+    return st.fiscalTarget(cfg['FISCAL']['date'], cfg['FISCAL']['time'], address, cfg_loc['latitude'], cfg_loc['longitude'])
+
+
+def instrument(args):
+    """ Start the --timings recorder and the --profile profiler; both report when the process exits. """
+    if args.timings:
+        timings = timing.start()
+        atexit.register(lambda: print(timings.json() if args.timings == "json" else timings.report(), file=sys.stderr))
+
+    if args.profile:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+        atexit.register(lambda: (profiler.disable(), profiler.dump_stats(args.profile)))
+
+
+def fx_converter(cfg):
+    """ Currency converter with the rate table from the configuration (or the user cache directory). """
+    from .fx import Converter, RateTable
+
+    rates = cfg['CACHE'].get('rates') if cfg and cfg.has_section('CACHE') else None
+    return Converter(RateTable(rates))
+
+
+def cfg_options(cfg, args) -> dict:
+    """ Fiscal date, time, location and currency from the configuration, overridden by the arguments. """
+    options = {}
+    if cfg:
+        cfg_loc = cfg['LOCATION']
+        options.update(date=cfg['FISCAL']['date'], time=cfg['FISCAL']['time'],
+            address=f"{cfg_loc['city']} {cfg_loc['state']} {cfg_loc['country']}", lat=cfg_loc['latitude'], lon=cfg_loc['longitude'],
+            currency=cfg['HUQUQ'].get('currency', "USD"))
+    if getattr(args, 'curr', None):
+        options['currency'] = args.curr.upper()
+
+    return options
+
+
+def batch_main(args, cfg, cache, history):
+    """ Stream every row of the batch file through the calculation. """
+    from .batch import Batch, readRows, writeRows
+
+    options = cfg_options(cfg, args)
+    options.update(basic=args.basic, cache=cache, history=history, exact=args.exact, converter=fx_converter(cfg))
+    if args.price:
+        options['price'] = mp_wrapper(None, args.price)
+
+    rows = Batch(**options).run(readRows(args.batch))
+    if cfg and 'file' in cfg['RECORD'] and (f:= Path(cfg['RECORD']['file'])).parent.is_dir():
+        pkgs = []
+        rows = batch_records(rows, pkgs)
+        writeRows(rows, args.output)
+        # Every result of the batch is recorded in a single write (one transaction for a ledger)
+        recordMany(pkgs, f)
+    else:
+        writeRows(rows, args.output)
+
+
+def batch_records(rows, pkgs: list):
+    """ Pass the batch results through, collecting each as a record. """
+    for row in rows:
+        pkgs.append([datetime.now(), row['target time'], row['gold price date']] + floatFmt(row['gold price'])
+                    + [row['weight'], row['price currency'], row['price source']] + floatFmt(row['wealth'], row['payable']))
+        yield row
+
+
+def export_record_main(argv):
+    """ Write the records of a ledger back out in the CSV record layout. """
+    from .ledger import Ledger
+
+    args = exportRecordArguments(argv)
+    ledger = Ledger(args.ledger)
+    print(f"Exported {ledger.export(args.output)} records to {args.output}")
+    ledger.close()
+
+
+def backfill_main(argv):
+    """ Calculate every fiscal year in a range at every location, in one run. """
+    from .backfill import backfill, checkFiscal, readWealth, FIELDS
+    from .batch import writeRows
+
+    args = backfillArguments(argv)
+    try:
+        cfg, cache, history = setup(args)
+        options = cfg_options(cfg, args)
+        checkFiscal(options.get('date', "04-20"), options.get('time', "sunset"))
+    except ValueError as e:
+        print(e)
+        sys.exit(-1)
+
+    if args.locations:
+        locations = st.readLocations(args.locations)
+    else:
+        locations = [{ 'name': "configured location", 'latitude': options.get('lat', 32.943608), 'longitude': options.get('lon', 35.091979) }]
+
+    wealth = readWealth(args.wealth) if args.wealth else None
+    rows = backfill(options.get('date', "04-20"), options.get('time', "sunset"), locations, args.from_year, args.to_year,
+                    options.get('currency', "USD"), args.amount, wealth, cache, history, args.workers, args.processes, args.exact,
+                    fx_converter(cfg))
+    writeRows(rows, args.output, FIELDS)
+
+
+def solar_table_main(argv):
+    """ Write a precomputed solar event table for the given locations and years. """
+    from .solartable import generateSolarTable
+
+    args = solarTableArguments(argv)
+    locations = st.readLocations(args.locations)
+    days = generateSolarTable(args.output, [ (l['latitude'], l['longitude']) for l in locations ], args.from_year, args.to_year)
+    print(f"Wrote {days} days of solar events for {len(locations)} location(s) to {args.output}")
+
+
+def import_rates_main(argv):
+    """ Bulk import exchange rates into the local rate table. """
+    from .fx import RateTable
+
+    args = importRatesArguments(argv)
+    table = RateTable(args.rates)
+    for file in args.files:
+        print(f"Imported {table.importFile(file)} rates from {file}")
+
+
+def import_prices_main(argv):
+    """ Bulk import historical gold prices into the local price history. """
+    args = importPricesArguments(argv)
+    history = PriceHistory(args.history)
+    for file in args.files:
+        print(f"Imported {history.importFile(file, args.curr, args.weight)} prices from {file}")
+
+
+def report_main(argv):
+    """ Summarize record files by group and date range. """
+    from .report import report, writeReport
+
+    args = reportArguments(argv)
+    by = [ g.strip().lower() for g in args.by.split(",") if g.strip() ]
+    try:
+        groups = report(args.files, by, args.start, args.end, args.on)
+    except (OSError, ValueError) as e:
+        print(e)
+        sys.exit(-1)
+
+    writeReport(groups, by, args.output)
+
+
+def serve_main(argv):
+    """ Serve calculations over HTTP/JSON with the configuration, caches and sessions kept warm. """
+    from .server import Service, serve
+
+    args = serveArguments(argv)
+    try:
+        cfg, cache, history = setup(args)
+    except ValueError as e:
+        print(e)
+        sys.exit(-1)
+
+    server = serve(Service(cache=cache, history=history, **cfg_options(cfg, args)), args.host, args.port)
+    print(f"Serving {__title__} on http://{args.host}:{server.server_port} (Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+def prefetch_main(argv):
+    """ Store gold prices around the upcoming fiscal moments of every location. """
+    from .prefetch import Prefetcher
+
+    args = prefetchArguments(argv)
+    try:
+        cfg, cache, history = setup(args)
+    except ValueError as e:
+        print(e)
+        sys.exit(-1)
+
+    options = cfg_options(cfg, args)
+    if args.locations:
+        locations = st.readLocations(args.locations)
+    else:
+        locations = [{ 'name': "configured location", 'address': options.get('address'),
+                       'latitude': options.get('lat', 32.943608), 'longitude': options.get('lon', 35.091979) }]
+
+    currencies = args.curr.split(",") if args.curr else [options.get('currency', "USD")]
+    prefetcher = Prefetcher(options.get('date', "04-20"), options.get('time', "sunset"), locations, currencies,
+                            history or PriceHistory(), args.interval, forever=not args.list)
+    try:
+        for moment, loc in prefetcher.plan():
+            print(f"{loc.get('name', 'location')}: {moment}")
+        if not args.list:
+            prefetcher.run()
+    except ValueError as e:
+        print(e)
+        sys.exit(-1)
+    except KeyboardInterrupt:
+        pass
+
+
+def sweep_main(argv):
+    """ Grid of wealth and gold prices, or the exact unit breakpoints within it. """
+    import csv
+    from .sweep import columns, parseRange, priceBreakpoints, sweep, validate, wealthBreakpoints, writeCsv, writeNpy
+
+    args = sweepArguments(argv)
+    try:
+        wealth, price = parseRange(args.wealth), parseRange(args.price)
+        weight = args.weight.lower()
+        validate(wealth, price, weight)
+        grid = sweep(wealth, price, weight) if args.output or not args.breakpoints else None
+    except ValueError as e:
+        print(e)
+        sys.exit(-1)
+
+    if grid is not None:
+        if args.output and args.output.lower().endswith(".npy"):
+            writeNpy(columns(grid), args.output)
+        elif args.output or not args.breakpoints:
+            writeCsv(columns(grid), args.output)
+
+    if args.breakpoints:
+        csvwriter = csv.writer(sys.stdout)
+        csvwriter.writerow(["varies", "fixed", "units", "threshold"])
+        for p, k, w in wealthBreakpoints(price, wealth[0], wealth[-1], weight):
+            csvwriter.writerow(["wealth", p, k, w])
+        for w, k, p in priceBreakpoints(wealth, price[0], price[-1], weight):
+            csvwriter.writerow(["price", w, k, p])
+
+
+COMMANDS = {
+    'backfill': backfill_main,
+    'export-record': export_record_main,
+    'import-prices': import_prices_main,
+    'import-rates': import_rates_main,
+    'prefetch': prefetch_main,
+    'report': report_main,
+    'serve': serve_main,
+    'solar-table': solar_table_main,
+    'sweep': sweep_main,
+}
+
 # Run
 def main():
+    if len(sys.argv) > 1 and sys.argv[1] in COMMANDS:
+        COMMANDS[sys.argv[1]](sys.argv[2:])
+        return
+
+    args = arguments()
+    instrument(args)
     try:
-        args = arguments()
-        configFile = args.filename if args.filename else "./huh.ini"
-        cfg = Configuration(configFile).conf
+        with timing.span("setup"):
+            cfg, cache, history = setup(args)
     except ValueError as e:
         print(e)
         sys.exit(-1)
-    
-    if not cfg:
-        # dateTmp = datetime.strptime(, "%m-%d")
-        dateTmp = st.setAndFixFiscalDate("04-20")
-        timeTmp = st.getSolarTime(date=dateTmp)
-        target_time = datetime.combine(dateTmp, timeTmp.time())
 
+    if args.batch:
+        batch_main(args, cfg, cache, history)
+        return
+
+    recordFile = record_file(cfg, args)
+    if args.price:
+        # A user provided price needs neither the sun nor the network; the fiscal time is only worked out to be recorded
+        target_time = None
+        if recordFile:
+            with timing.span("fiscal time"):
+                target_time = fiscal_time(cfg)
         target_curr = args.curr.upper() if args.curr else None
-        m = mp_wrapper(target_time, args.price, target_curr)
+        m = mp_wrapper(target_time, args.price)
 
     else:
-        # Determine time period for when gold prices should be gathered
-        cfg_loc = cfg['LOCATION']
-        fiscalDate, fiscalTime = st.setAndFixFiscalDate(cfg['FISCAL']['date']), cfg['FISCAL']['time']
-
-        if (period:= fiscalTime.lower().rstrip()) in st.getSunPeriodTerms():
-            address = f"{cfg_loc['city']} {cfg_loc['state']} {cfg_loc['country']}"      
-            timeTmp = st.getSolarTime(address, cfg_loc['latitude'], cfg_loc['longitude'], period, fiscalDate)
-            target_time = datetime.combine(fiscalDate, timeTmp.time())
-        elif fiscalTime.lower().rstrip() == 'now':
-            target_time = datetime.now()
-        else:
-            target_time = datetime.combine(fiscalDate, datetime.strptime(fiscalTime, "%H:%M").time())
+        with timing.span("fiscal time"):
+            target_time = fiscal_time(cfg)
 
         # Fetch the price of gold
-        tmpCurr = cfg['HUQUQ']['currency'].upper() if 'currency' in cfg['HUQUQ'] else "USD"
-        target_curr = args.curr.upper() if args.curr else tmpCurr
-        m = mp_wrapper(target_time, args.price, target_curr)
+        if cfg:
+            tmpCurr = cfg['HUQUQ']['currency'].upper() if 'currency' in cfg['HUQUQ'] else "USD"
+            target_curr = args.curr.upper() if args.curr else tmpCurr
+        else:
+            target_curr = args.curr.upper() if args.curr else None
+        with timing.span("gold price"):
+            m = mp_wrapper(target_time, args.price, target_curr, cache, history)
 
     if not m:
         print("Unable to obtain gold price. Bye.")
         sys.exit(-1)
 
     # Check if metal curr matches amount currency (default currency in config) and if not convert
-    # if m.currency != target_curr:
-    # m.price, m.currency = convert_price(m.price, m.currency, target_curr)
+    if target_curr and m.currency.upper() != target_curr:
+        try:
+            with timing.span("convert currency"):
+                m = fx_converter(cfg).convert(m, target_curr)
+        except LookupError as e:
+            print(f"{e} Amounts are in {m.currency}.")
 
     # Calculate tax
-    huq = Huququllah(args.amount, m.price, m.weight, m.currency)
+    with timing.span("calculate"):
+        huq = Huququllah(args.amount, m.price, m.weight, m.currency, exact=args.exact)
 
-    if args.basic:
-        huq.basic = args.basic
-        huq._remainder()
-        huq._payable()
+        if args.basic:
+            huq.basic = args.basic
+            huq._remainder()
+            huq._payable()
     
     # Full output
     if args.detail:
@@ -106,14 +424,8 @@ def main():
     # Create record
     headers = ["recorded date", "gold price retrieved date", "gold price", "weight", "currency", "price source", "wealth", "payable"]
     pkg = [datetime.now(), target_time, m.timestamp] + floatFmt(m.price)+ [m.weight, m.currency, m.source] + floatFmt(huq.wealth, huq.payable)
-    if cfg:
-        if 'file' in cfg['RECORD']:
-            if (f:= Path(cfg['RECORD']['file'])).parent.is_dir():
-                record(pkg, f)
-    else:
-        if args.output:
-            if (f:= Path(args.output)).parent.is_dir():
-                record(pkg, f)
+    if recordFile:
+        record(pkg, recordFile)
 
 """ Launch app """
 if __name__ == '__main__':
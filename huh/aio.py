@@ -0,0 +1,273 @@
+# -*- coding: utf-8 -*-
+
+""" Asyncio API: gold prices, geocoding and calculations without blocking the event loop.
+
+    The prices are fetched with aiohttp and the addresses geocoded with geopy's aiohttp
+    adapter, so one event loop can serve many calculations at once:
+
+        from huh import aio
+
+        huq, m = await aio.async_huququllah(10000, address="Haifa Haifa Israel")
+
+    Every call takes a timeout (seconds for each request) and prices take a deadline (seconds
+    for all providers together); cancelling the calling task cancels the requests in flight.
+    aiohttp is imported on first use; the rest of huh does not need it.
+"""
+
+# Standard library
+import asyncio
+from contextlib import asynccontextmanager
+import datetime
+import sqlite3
+import time
+
+# 3rd Party Library
+from .cache import PriceCache
+from .history import PriceHistory
+from .huquq import Huququllah
+from .metal import (BROWSER, CHUNK, DEADLINE, GOLDORG_URL, GOLDPRICE_URL, REGISTRY, TIMEOUT, TOLERANCE, ChartReader,
+                    GoldOrg, GoldPriceOrg, MetalPrice, _cached, _choose, _fetchErrors, _forTarget, _fromHistory, _store, goldPriceNowData)
+from . import spacetime as st
+from .timing import span
+
+
+@asynccontextmanager
+async def clientSession(session=None):
+    """ The given aiohttp session, or a new one closed on exit """
+
+    if session is not None:
+        yield session
+        return
+
+    import aiohttp
+    async with aiohttp.ClientSession() as s:
+        yield s
+
+
+async def getJson(session, url: str, headers: dict=None, timeout: float=TIMEOUT):
+    """ GET a url and decode its JSON body (whatever the content type).
+
+    Raises:
+        aiohttp.ClientError: connection failure or error status
+        asyncio.TimeoutError: no complete answer within the timeout
+    """
+
+    import aiohttp
+    async with session.get(url, headers=headers, timeout=aiohttp.ClientTimeout(total=timeout)) as res:
+        res.raise_for_status()
+        return await res.json(content_type=None)
+
+
+async def fetchGoldPriceNow(session, currency: str="USD", timeout: float=TIMEOUT) -> list:
+    """ Current gold and silver price from goldprice.org (see metal.fetchGoldPriceNow) """
+
+    results = await getJson(session, GOLDPRICE_URL.format(currency=currency), BROWSER, timeout)
+    if results and not results.get('items'):
+        results = await getJson(session, GOLDPRICE_URL.format(currency="USD"), BROWSER, timeout)
+    return goldPriceNowData(results)
+
+
+async def fetchGoldOrg(session, start, end, currency: str="USD", weight: str="oz", timeout: float=TIMEOUT):
+    """ Gold prices between the epochs from gold.org, parsed as the answer arrives (see metal.fetchGoldOrg) """
+
+    import aiohttp
+
+    chart = ChartReader(currency, weight)
+    url = GOLDORG_URL.format(currency=currency, weight=weight, start=start, end=end)
+    async with session.get(url, timeout=aiohttp.ClientTimeout(total=timeout)) as res:
+        res.raise_for_status()
+        async for chunk in res.content.iter_chunked(CHUNK):
+            chart.feed(chunk)
+    return chart.result()
+
+
+FETCHERS = {
+    GoldPriceOrg: lambda session, times, currency, timeout: fetchGoldPriceNow(session, currency, timeout),
+    GoldOrg: lambda session, times, currency, timeout: fetchGoldOrg(session, times[0], times[1], currency, timeout=timeout),
+}   # Providers without an async fetch here are called in a worker thread
+
+async def fetchProvider(session, provider, times, currency: str="USD", timeout: float=TIMEOUT) -> list:
+    """ Prices from one provider within the timeout, recording its latency and failures like a blocking call.
+
+    Raises:
+        asyncio.TimeoutError: no answer within the timeout
+    """
+
+    fetch = FETCHERS.get(type(provider))
+    start = time.perf_counter()
+    try:
+        with span(f"price api ({provider.name})"):
+            if fetch:
+                work = fetch(session, times, currency, timeout)
+            else:
+                work = asyncio.to_thread(provider.fetch, times, currency, timeout)
+            prices = await asyncio.wait_for(work, timeout)
+    except Exception:
+        provider._measure(time.perf_counter() - start, failed=True)
+        raise
+
+    provider._measure(time.perf_counter() - start, failed=False)
+    return prices
+
+
+async def fetchAll(session, providers, times, currency: str="USD", timeout: float=TIMEOUT, deadline: float=DEADLINE) -> dict:
+    """ Query every provider concurrently and collect whatever answers before the deadline.
+
+        A provider that fails, answers malformed data, times out, or misses the deadline is left out of the results
+        (and its request cancelled).
+
+    Returns:
+        dict: {provider: list of MetalPrice}
+    """
+
+    import aiohttp
+
+    errors = (*_fetchErrors(), aiohttp.ClientError, asyncio.TimeoutError)
+    tasks = { asyncio.ensure_future(fetchProvider(session, p, times, currency, timeout)): p for p in providers }
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=deadline)
+    finally:
+        pending = [ t for t in tasks if not t.done() ]
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    results = {}
+    for task, provider in tasks.items():
+        if task not in done:
+            continue
+        try:
+            results[provider] = task.result()
+        except errors as e:
+            print(f' [WARN] Skipping "{provider.name}": {e or type(e).__name__}')
+    return results
+
+
+async def async_metal_price(target, currency: str="USD", metal_type: str='au', timeout: float=TIMEOUT, deadline: float=DEADLINE,
+                            cache=None, history=None, registry=None, session=None) -> MetalPrice:
+    """ Gold (or silver) price nearest the target; the async counterpart of metal.metal_price.
+
+        The price history and cache are consulted the same way (in a worker thread, as SQLite
+        blocks), and fetched prices are added to them. Providers are always queried all at once (the registry's hedged strategy is
+        not used).
+
+    Args:
+        target (datetime):
+        currency (str):
+        metal_type (str):
+        timeout (float): seconds allowed for each provider
+        deadline (float): seconds allowed for all providers together
+        cache (PriceCache, optional): price cache to consult; defaults to the user cache, False disables it
+        history (PriceHistory, optional): price history to consult; defaults to the user history, False disables it
+        registry (ProviderRegistry, optional): providers to ask; defaults to REGISTRY
+        session (aiohttp.ClientSession, optional): session to use; by default one is opened for the call
+
+    Returns:
+        MetalPrice: Package with details regarding metal price (None if no provider answered)
+    """
+
+    times = st.timeRange(target)
+    registry = registry or REGISTRY
+    try:
+        cache = await asyncio.to_thread(PriceCache) if cache is None else cache
+        history = await asyncio.to_thread(PriceHistory) if history is None else history
+    except OSError:
+        cache, history = cache or False, history or False
+
+    epoch, now = st.datetimeToEpoch(target), st.datetimeToEpoch(datetime.datetime.now())
+    past = epoch + TOLERANCE < now
+
+    async with clientSession(session) as s:
+        async def resolve(providers, history):
+            results, missing = await asyncio.to_thread(_cached, providers, times, currency, cache)
+            if missing:
+                for provider, prices in (await fetchAll(s, missing, times, currency, timeout, deadline)).items():
+                    history = await asyncio.to_thread(_store, provider, prices, times, currency, cache, history)
+                    results[provider] = prices
+            return results
+
+        if metal_type in ("silver", "ag"):
+            results = await resolve(registry.ranked("ag"), False)
+            return next((p for prices in results.values() for p in prices if p.element == "ag"), None)
+
+        if history:
+            try:
+                if hit := await asyncio.to_thread(_fromHistory, history, epoch, currency, None if past else now):
+                    return hit
+            except sqlite3.Error:
+                history = False
+
+        providers = registry.ranked("au")
+        results = _forTarget(await resolve(providers, history), past)
+
+    return _choose(results, epoch, currency)
+
+
+async def async_address_to_latlong(address: str, timeout: float=TIMEOUT) -> list:
+    """ Latitude and longitude of an address; the async counterpart of spacetime.addressToLatLong.
+
+        The gazetteer and geocode cache are checked (in a worker thread) before Nominatim, and
+        Nominatim's answer is cached for next time.
+
+    Args:
+        address (str): Address format: "city state country"
+        timeout (float): seconds to wait on Nominatim
+
+    Raises:
+        ValueError: address is malformed, or Nominatim does not know it
+        geopy.exc.GeopyError: Nominatim could not be reached
+
+    Returns:
+        list: [lat: float, lon: float]
+    """
+
+    if hit := await asyncio.to_thread(st.cachedLatLong, address):
+        return hit
+
+    from geopy.adapters import AioHTTPAdapter
+    from geopy.geocoders import Nominatim
+
+    with span("geocode (nominatim)"):
+        async with Nominatim(user_agent=st.USER_AGENT, adapter_factory=AioHTTPAdapter, timeout=timeout) as geo:
+            loc = await geo.geocode(address)
+    if loc is None:
+        raise ValueError(f"Could not obtain location based on provided address: {address}")
+
+    latlon = [loc.latitude, loc.longitude]
+    await asyncio.to_thread(st.cacheLatLong, address, latlon)
+    return latlon
+
+
+async def async_huququllah(wealth: float, date: str="04-20", time: str="sunset", address: str=None, lat: float=32.943608, lon: float=35.091979,
+                           currency: str="USD", price: MetalPrice=None, exact: bool=False, timeout: float=TIMEOUT, deadline: float=DEADLINE,
+                           cache=None, history=None, registry=None, session=None) -> tuple:
+    """ Calculate Ḥuqúqu'lláh at the fiscal date and time, geocoding and fetching the gold price asynchronously.
+
+        The solar time is computed in a worker thread (the first lookup loads the timezone data).
+
+    Args:
+        wealth (float): wealth to calculate on
+        date (str): fiscal date "MM-DD" or "today"
+        time (str): period of the sun (e.g., sunset), "now", or "HH:MM" (24-hour)
+        address (str, optional): city, state, and country; geocoded instead of lat/lon
+        price (MetalPrice, optional): gold price to use instead of fetching one
+        exact (bool): calculate in decimal arithmetic (see huquq.Huququllah)
+
+    Raises:
+        ValueError: invalid address, date or time
+        LookupError: no gold price could be obtained
+
+    Returns:
+        tuple: (Huququllah, MetalPrice used)
+    """
+
+    if price is None:
+        if address:
+            lat, lon = await async_address_to_latlong(address, timeout)
+        target = await asyncio.to_thread(st.fiscalTarget, date, time, None, lat, lon)
+        price = await async_metal_price(target, currency, timeout=timeout, deadline=deadline, cache=cache, history=history, registry=registry, session=session)
+        if price is None:
+            raise LookupError("Unable to obtain gold price; use an offline price instead.")
+
+    return Huququllah(wealth, price.price, price.weight, price.currency, exact=exact), price
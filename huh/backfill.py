@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+
+""" Backfill: Ḥuqúqu'lláh for every fiscal year in a range, at many locations, in one run.
+
+    All fiscal instants are generated up front: solar times are computed in a process pool
+    (one task per location, each covering every year), and the prices are resolved in a
+    thread pool. Instants whose price windows overlap are resolved one after the other, so
+    the first fetch fills the price history and the rest are answered from it.
+"""
+
+# Standard library
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import csv
+import datetime
+import sys
+
+# 3rd Party Library
+from .huquq import cents, Huququllah
+from .metal import metal_price, TOLERANCE
+from .prefetch import fiscalMoment
+from . import spacetime as st
+from .timing import span
+
+
+FIELDS = ["year", "location", "latitude", "longitude", "target time", "gold price date", "gold price", "weight", "price currency", "price source", "basic", "wealth", "payable"]
+
+def _solarMoments(lat: float, lon: float, tz: str, date: str, period: str, years: list) -> list:
+    """ Fiscal moment (local, naive) of each year at one location; None where the sun never reaches the period.
+
+        Runs in a worker process, so it takes the timezone name rather than looking it up. Like
+        fiscalMoment, a year without the date (02-29) has no moment.
+    """
+
+    from astral import Observer, sun
+
+    observer, moments = Observer(lat, lon), []
+    for year in years:
+        try:
+            day = datetime.datetime.strptime(f"{year}-{date}", "%Y-%m-%d").date()
+            moments.append(datetime.datetime.combine(day, getattr(sun, period)(observer, date=day, tzinfo=tz).time()))
+        except ValueError:
+            moments.append(None)
+    return moments
+
+
+def checkFiscal(date: str, time: str):
+    """ Check that a fiscal date and time can be repeated every year.
+
+    Raises:
+        ValueError: date or time is relative ("today", "now") or malformed
+    """
+
+    if date.lower().strip() == "today" or time.lower().strip() == "now":
+        raise ValueError("Fiscal date and time must be fixed (not \"today\" or \"now\") to backfill years.")
+    try:
+        datetime.datetime.strptime(f"2000-{date}", "%Y-%m-%d")     # a leap year, so 02-29 is allowed
+        if time.lower().strip() not in st.getSunPeriodTerms():
+            datetime.datetime.strptime(time, "%H:%M")
+    except ValueError:
+        raise ValueError(f"Fiscal date must be MM-DD and time a period of the sun or HH:MM: {date} {time}")
+
+
+def fiscalInstants(date: str, time: str, locations: list, fromYear: int, toYear: int, processes: int=None) -> list:
+    """ Fiscal moment of every (year, location).
+
+    Args:
+        date (str): fiscal date "MM-DD"
+        time (str): period of the sun (e.g., sunset) or "HH:MM" (24-hour)
+        locations (list): dicts with name, latitude, longitude (see spacetime.readLocations)
+        fromYear (int): first year
+        toYear (int): last year (inclusive)
+        processes (int, optional): processes computing solar times (None: one per CPU, 0: compute in this process)
+
+    Raises:
+        ValueError: date or time cannot be repeated every year (see checkFiscal)
+
+    Returns:
+        list: (year, location, moment) tuples; moment is None where the sun never reaches the period
+    """
+
+    checkFiscal(date, time)
+    years = list(range(fromYear, toYear + 1))
+    period = time.lower().strip()
+
+    with span("fiscal time"):
+        if period not in st.getSunPeriodTerms() or len(locations) < 2 or processes == 0:
+            # Clock times and single locations are not worth a pool (nor are locations covered by a solar table)
+            def moments(loc):
+                result = []
+                for year in years:
+                    try:
+                        result.append(fiscalMoment(date, time, year, None, loc['latitude'], loc['longitude']))
+                    except ValueError:
+                        result.append(None)
+                return result
+            perLocation = [ moments(loc) for loc in locations ]
+        else:
+            with ProcessPoolExecutor(processes) as pool:
+                futures = [ pool.submit(_solarMoments, float(loc['latitude']), float(loc['longitude']),
+                                        st.timezoneAt(float(loc['latitude']), float(loc['longitude'])), date, period, years)
+                            for loc in locations ]
+                perLocation = [ f.result() for f in futures ]
+
+    return [ (year, loc, moment) for loc, moments in zip(locations, perLocation) for year, moment in zip(years, moments) ]
+
+
+def clusters(targets) -> list:
+    """ Group sorted distinct targets whose price windows overlap (within twice the tolerance of the previous). """
+    groups = []
+    for target in sorted(set(targets)):
+        if groups and (target - groups[-1][-1]) <= datetime.timedelta(milliseconds=2 * TOLERANCE):
+            groups[-1].append(target)
+        else:
+            groups.append([target])
+    return groups
+
+
+def resolvePrices(targets, currency: str="USD", cache=None, history=None, workers: int=8) -> dict:
+    """ Gold price of every distinct target, clusters in parallel and the targets of a cluster in order.
+
+    Returns:
+        dict: target -> MetalPrice (or None)
+    """
+
+    def resolve(group):
+        return { target: metal_price(target, currency, cache=cache, history=history) for target in group }
+
+    prices = {}
+    with span("gold price"), ThreadPoolExecutor(workers) as pool:
+        for resolved in pool.map(resolve, clusters(targets)):
+            prices.update(resolved)
+    return prices
+
+
+def readWealth(file) -> dict:
+    """ Wealth per year (and optionally per location) from a CSV with the columns year, wealth and optionally location.
+
+    Returns:
+        dict: (year, location name or None) -> wealth
+    """
+
+    wealth = {}
+    with open(file, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            row = { k.strip().lower(): (v or "").strip() for k, v in row.items() if k }
+            wealth[(int(row['year']), row.get('location') or None)] = float(row['wealth'])
+    return wealth
+
+
+def backfill(date: str, time: str, locations: list, fromYear: int, toYear: int, currency: str="USD", amount: float=None,
+             wealth: dict=None, cache=None, history=None, workers: int=8, processes: int=None, exact: bool=False, converter=None):
+    """ Calculate every (year, location) in the range.
+
+    Args:
+        amount (float, optional): wealth of every year and location
+        wealth (dict, optional): (year, location name or None) -> wealth, from readWealth; overrides amount
+        workers (int): threads resolving prices
+        processes (int, optional): processes computing solar times (see fiscalInstants)
+        converter (fx.Converter, optional): converts prices quoted in another currency to the currency
+
+    Yields:
+        dict: result row with the FIELDS keys (wealth and payable empty without a wealth)
+    """
+
+    now = datetime.datetime.now()
+    instants = []
+    for year, loc, moment in fiscalInstants(date, time, locations, fromYear, toYear, processes):
+        if moment is None:
+            print(f"[WARN] {year} {loc['name']}: no {time} on {date}; skipped.", file=sys.stderr)
+        elif moment <= now:
+            instants.append((year, loc, moment))
+    prices = resolvePrices([ moment for _, _, moment in instants ], currency, cache, history, workers)
+
+    for year, loc, moment in instants:
+        if not (m := prices.get(moment)):
+            print(f"[WARN] {year} {loc['name']}: unable to obtain gold price; skipped.", file=sys.stderr)
+            continue
+
+        if converter and m.currency.upper() != currency.upper():
+            try:
+                m = converter.convert(m, currency)
+            except LookupError as e:
+                print(f"[WARN] {year} {loc['name']}: {e} Calculated in {m.currency}.", file=sys.stderr)
+
+        w = (wealth or {}).get((year, loc['name']), (wealth or {}).get((year, None), amount))
+        huq = Huququllah(w or 0.0, m.price, m.weight, m.currency, exact=exact)
+        yield {
+            "year": year,
+            "location": loc['name'],
+            "latitude": loc['latitude'],
+            "longitude": loc['longitude'],
+            "target time": moment,
+            "gold price date": m.timestamp,
+            "gold price": round(m.price, 2),
+            "weight": m.weight,
+            "price currency": m.currency,
+            "price source": m.source,
+            "basic": cents(huq.basic),
+            "wealth": "" if w is None else cents(huq.wealth),
+            "payable": "" if w is None else cents(huq.payable),
+        }
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+
+""" Batch mode: calculate Ḥuqúqu'lláh for many wealth entries streamed from a CSV or JSONL file.
+"""
+
+# Standard library
+import csv
+import json
+from pathlib import Path
+import sys
+
+# 3rd Party Library
+from .huquq import cents, Huququllah
+from .metal import metal_price, MetalPrice
+from . import spacetime as st
+
+
+FIELDS = ["wealth", "currency", "target time", "gold price date", "gold price", "weight", "price currency", "price source", "basic", "remainder", "payable"]
+
+def readRows(file):
+    """ Stream rows from a CSV (with header) or JSONL file.
+
+        Columns: wealth, and optionally currency, date, time, latitude, longitude, city, state, country.
+
+    Args:
+        file (str, Path): ".jsonl"/".ndjson" is read as JSON lines, anything else as CSV
+
+    Yields:
+        dict: row with lower-case keys
+    """
+
+    path = Path(file)
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.suffix.lower() in (".jsonl", ".ndjson"):
+            for line in f:
+                if line.strip():
+                    yield { k.strip().lower(): v for k, v in json.loads(line).items() }
+        else:
+            for row in csv.DictReader(f):
+                yield { k.strip().lower(): v for k, v in row.items() if k }
+
+
+def writeRows(rows, file=None, fields=FIELDS):
+    """ Stream result rows out as CSV or JSONL.
+
+    Args:
+        rows (iterable): dicts with the fields as keys
+        file (str, Path, optional): ".jsonl"/".ndjson" is written as JSON lines, anything else as CSV; stdout if None
+        fields (list): CSV columns
+    """
+
+    out = open(file, 'w', newline="", encoding="utf-8") if file else sys.stdout
+    try:
+        if file and Path(file).suffix.lower() in (".jsonl", ".ndjson"):
+            for row in rows:
+                out.write(json.dumps(row, default=str) + "\n")
+        else:
+            csvwriter = csv.DictWriter(out, fieldnames=fields)
+            csvwriter.writeheader()
+            for row in rows:
+                csvwriter.writerow(row)
+    finally:
+        if file:
+            out.close()
+
+
+class Batch():
+    """ Calculates many rows while resolving each distinct fiscal time and (time, currency) price only once.
+    """
+
+    def __init__(self, date: str="04-20", time: str="sunset", address: str=None, lat=32.943608, lon=35.091979,
+                 currency: str="USD", price: MetalPrice=None, basic: float=None, cache=None, history=None, exact: bool=False,
+                 converter=None):
+        self.date, self.time = date, time
+        self.address, self.lat, self.lon = address, lat, lon
+        self.currency = currency
+        self.userPrice = price
+        self.basic = basic
+        self.cache = cache
+        self.history = history
+        self.exact = exact
+        self.converter = converter
+
+        self._targets = {}
+        self._prices = {}
+
+    def target(self, row: dict):
+        """ Fiscal date and time for the row, falling back to the batch defaults. """
+
+        if row.get('latitude') or row.get('longitude') or row.get('city'):
+            address = f"{row.get('city') or ''} {row.get('state') or ''} {row.get('country') or ''}"
+            loc = (address, row.get('latitude') or "", row.get('longitude') or "")
+        else:
+            loc = (self.address, self.lat, self.lon)
+
+        key = (row.get('date') or self.date, row.get('time') or self.time) + loc
+        if key not in self._targets:
+            self._targets[key] = st.fiscalTarget(*key)
+
+        return self._targets[key]
+
+    def price(self, target, currency: str) -> MetalPrice:
+        """ Gold price nearest the target time; fetched once per (target, currency). """
+
+        if self.userPrice:
+            return self.userPrice
+
+        key = (target, currency)
+        if key not in self._prices:
+            self._prices[key] = metal_price(target, currency, cache=self.cache, history=self.history)
+
+        return self._prices[key]
+
+    def run(self, rows):
+        """ Calculate Ḥuqúqu'lláh for every row.
+
+        Args:
+            rows (iterable): dicts from readRows
+
+        Yields:
+            dict: result row with the FIELDS keys
+        """
+
+        for n, row in enumerate(rows, 1):
+            currency = (row.get('currency') or self.currency).upper()
+            target = None if self.userPrice else self.target(row)
+            m = self.price(target, currency)
+
+            if not m:
+                print(f"[WARN] Row {n}: unable to obtain gold price; skipped.", file=sys.stderr)
+                continue
+
+            if self.converter and m.currency.upper() != currency:
+                try:
+                    m = self.converter.convert(m, currency)
+                except LookupError as e:
+                    print(f"[WARN] Row {n}: {e} Calculated in {m.currency}.", file=sys.stderr)
+
+            wealth = row['wealth'] if self.exact else float(row['wealth'])
+            huq = Huququllah(wealth, m.price, m.weight, m.currency, exact=self.exact)
+            if self.basic:
+                huq.basic = self.basic
+                huq._remainder()
+                huq._payable()
+
+            yield {
+                "wealth": cents(huq.wealth),
+                "currency": currency,
+                "target time": target,
+                "gold price date": m.timestamp,
+                "gold price": round(m.price, 2),
+                "weight": m.weight,
+                "price currency": m.currency,
+                "price source": m.source,
+                "basic": cents(huq.basic),
+                "remainder": cents(huq.remainder),
+                "payable": cents(huq.payable),
+            }
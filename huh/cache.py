@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+
+""" Local, on-disk cache for data that is slow to fetch (e.g., gold prices).
+"""
+
+# Standard library
+import json
+import os
+from pathlib import Path
+import sqlite3
+import sys
+import threading
+import time
+
+
+def cacheDir() -> Path:
+    """ Directory where cached data is kept.
+
+        Uses HUH_CACHE_DIR if set, otherwise the platform's user cache directory.
+
+    Returns:
+        Path: cache directory (created if missing)
+    """
+
+    if env := os.environ.get("HUH_CACHE_DIR"):
+        path = Path(env)
+    elif sys.platform.startswith("win"):
+        path = Path(os.environ.get("LOCALAPPDATA", Path.home())) / "huh"
+    else:
+        path = Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache")) / "huh"
+
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+class PriceCache():
+    """ SQLite cache of price responses keyed by (source, currency, weight, time window).
+
+        Historical windows never change once the market has moved past them, so they never
+        expire. Quotes for "now" (window of None, or a window that reaches into the recent
+        past) are only trusted for a short time-to-live.
+    """
+
+    LIVE_TTL = 60               # seconds a "now" quote stays fresh
+    SETTLE = 60 * 60 * 1000     # milliseconds before a window is considered historical
+
+    def __init__(self, file=None, ttl: float=LIVE_TTL):
+        self.file = Path(file) if file else cacheDir() / "cache.sqlite"
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._db = None
+
+    def _connect(self):
+        if self._db is None:
+            self._db = sqlite3.connect(self.file, check_same_thread=False)
+            self._db.execute("""CREATE TABLE IF NOT EXISTS prices (
+                source TEXT, currency TEXT, weight TEXT, start INTEGER, end INTEGER,
+                fetched REAL, payload TEXT,
+                PRIMARY KEY (source, currency, weight, start, end))""")
+        return self._db
+
+    @classmethod
+    def windowKey(cls, window) -> tuple:
+        """ Historical windows keep their exact range; live windows are bucketed by the minute.
+
+        Returns:
+            tuple: ((start, end), live)
+        """
+        if window is None:
+            return (0, 0), True
+        elif window[1] > time.time() * 1e3 - cls.SETTLE:
+            return (int(window[0]) // 60000 * 60000, 0), True
+        return (int(window[0]), int(window[1])), False
+
+    def get(self, source: str, currency: str, weight: str, window=None):
+        """ Look up a cached response.
+
+        Args:
+            source (str): name of the price source
+            currency (str): currency requested from the source
+            weight (str): weight unit requested from the source
+            window (tuple, optional): epoch range (start, end); None for "now" quotes
+
+        Returns:
+            list: cached records (dicts), or None when missing or expired
+        """
+
+        (start, end), live = self.windowKey(window)
+        try:
+            with self._lock:
+                row = self._connect().execute(
+                    "SELECT fetched, payload FROM prices WHERE source=? AND currency=? AND weight=? AND start=? AND end=?",
+                    (source, currency, weight, start, end)).fetchone()
+        except sqlite3.Error:
+            return None
+
+        if not row or (live and time.time() - row[0] > self.ttl):
+            return None
+
+        return json.loads(row[1])
+
+    def put(self, source: str, currency: str, weight: str, window, records: list):
+        """ Store a response; failures to write are ignored since the cache is only an optimization.
+
+        Args:
+            source (str): name of the price source
+            currency (str): currency requested from the source
+            weight (str): weight unit requested from the source
+            window (tuple): epoch range (start, end); None for "now" quotes
+            records (list): JSON-serializable records (dicts)
+        """
+
+        (start, end), _ = self.windowKey(window)
+        try:
+            with self._lock:
+                db = self._connect()
+                db.execute("INSERT OR REPLACE INTO prices VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (source, currency, weight, start, end, time.time(), json.dumps(records)))
+                db.commit()
+        except sqlite3.Error:
+            pass
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+class KeyValueCache():
+    """ SQLite cache of JSON values that never expire (e.g., solar times, geocoded addresses).
+
+        Values are kept in their own namespace so unrelated lookups can share one file.
+    """
+
+    def __init__(self, namespace: str, file=None):
+        self.namespace = namespace
+        self.file = Path(file) if file else cacheDir() / "cache.sqlite"
+        self._lock = threading.Lock()
+        self._db = None
+
+    def _connect(self):
+        if self._db is None:
+            self._db = sqlite3.connect(self.file, check_same_thread=False)
+            self._db.execute("""CREATE TABLE IF NOT EXISTS kv (
+                namespace TEXT, key TEXT, value TEXT, PRIMARY KEY (namespace, key))""")
+        return self._db
+
+    def get(self, key: str):
+        """ Cached value for the key, or None """
+        try:
+            with self._lock:
+                row = self._connect().execute("SELECT value FROM kv WHERE namespace=? AND key=?", (self.namespace, key)).fetchone()
+        except sqlite3.Error:
+            return None
+
+        return json.loads(row[0]) if row else None
+
+    def put(self, key: str, value):
+        """ Store a JSON-serializable value; failures to write are ignored. """
+        try:
+            with self._lock:
+                db = self._connect()
+                db.execute("INSERT OR REPLACE INTO kv VALUES (?, ?, ?)", (self.namespace, key, json.dumps(value)))
+                db.commit()
+        except sqlite3.Error:
+            pass
+
+    def putMany(self, items):
+        """ Store many (key, value) pairs in one transaction; failures to write are ignored. """
+        try:
+            with self._lock:
+                db = self._connect()
+                db.executemany("INSERT OR REPLACE INTO kv VALUES (?, ?, ?)",
+                    ((self.namespace, key, json.dumps(value)) for key, value in items))
+                db.commit()
+        except sqlite3.Error:
+            pass
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+
+""" Single flight: identical price fetches that overlap are made only once.
+
+    A fetch is keyed by (source, currency, weight, window), the window bucketed as in the
+    price cache. Within a process the first caller of a key owns its flight, and callers that
+    join while it is in flight share its answer. Across processes the owners race for a lock
+    on the key (a byte range of a lock file next to the price cache): the winner leads,
+    fetching and writing the answer to the cache before unlocking; the others wait for the
+    lock and then read the cache (fetching themselves only if the leader got nothing).
+"""
+
+# Standard library
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+import os
+from pathlib import Path
+import sys
+import threading
+import time
+import zlib
+
+
+POLL = 0.02             # seconds between attempts on a lock held by another process
+OFFSETS = 2 ** 31 - 1   # keys are locked at their hash modulo this
+
+class LockFile():
+    """ Exclusive advisory locks on single bytes of one file, shared by every process that opens it
+        (fcntl.lockf on POSIX, msvcrt.locking on Windows).
+
+        The file stays open for the life of the process, since POSIX drops every lock a process
+        holds on a file as soon as it closes any descriptor of it. Locks are per process: callers
+        in one process must not lock the same byte twice (SingleFlight makes sure of it).
+    """
+
+    def __init__(self, file):
+        self.file = Path(file)
+        self._fd = None
+        self._lock = threading.Lock()
+
+    def _open(self) -> int:
+        if self._fd is None:
+            self._fd = os.open(self.file, os.O_RDWR | os.O_CREAT, 0o666)
+        return self._fd
+
+    def acquire(self, offset: int) -> bool:
+        """ Lock the byte at offset without waiting; False if another process holds it. """
+        with self._lock:
+            fd = self._open()
+            try:
+                if sys.platform.startswith("win"):
+                    import msvcrt
+                    os.lseek(fd, offset, os.SEEK_SET)
+                    msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+                else:
+                    import fcntl
+                    fcntl.lockf(fd, fcntl.LOCK_EX | fcntl.LOCK_NB, 1, offset)
+            except OSError:
+                return False
+        return True
+
+    def release(self, offset: int):
+        with self._lock:
+            if sys.platform.startswith("win"):
+                import msvcrt
+                os.lseek(self._fd, offset, os.SEEK_SET)
+                msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+            else:
+                import fcntl
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, 1, offset)
+
+
+_lockFiles = {}
+_lockFilesLock = threading.Lock()
+
+def lockFile(cache) -> LockFile:
+    """ Lock file shared by the processes using the price cache (None if it has no file, or the file cannot be opened) """
+
+    if not (file := getattr(cache, "file", None)):
+        return None
+
+    file = Path(file).with_name("flights.lock")
+    with _lockFilesLock:
+        if file not in _lockFiles:
+            lock = LockFile(file)
+            try:
+                lock._open()
+            except OSError:
+                return None
+            _lockFiles[file] = lock
+        return _lockFiles[file]
+
+
+class Flight():
+    """ A caller's place in the flight of a key.
+
+        owner   first caller of the key in this process; it answers the others with finish
+        leader  owner that fetches: it holds the key's lock (or no lock file is used)
+    """
+
+    def __init__(self, flights, key, future: Future, owner: bool, leader: bool=False, lock: LockFile=None):
+        self.flights, self.key, self.future = flights, key, future
+        self.owner, self.leader, self.lock = owner, leader, lock
+        self.offset = zlib.crc32(repr(key).encode()) % OFFSETS
+
+    def wait(self, timeout: float) -> bool:
+        """ Owner only: wait for another process's leader to unlock, taking the lead (so the cache should now
+            hold its answer); False if it is still fetching after the timeout.
+        """
+
+        stop = time.perf_counter() + timeout
+        while not (acquired := self.lock.acquire(self.offset)) and time.perf_counter() < stop:
+            time.sleep(POLL)
+        self.leader = acquired
+        return acquired
+
+    def result(self, timeout: float):
+        """ Answer of the owner (None if it had none, or is not done within the timeout) """
+        try:
+            return self.future.result(max(timeout, 0))
+        except FutureTimeout:
+            return None
+
+    def finish(self, answer):
+        """ Owner only: unlock and hand the answer to the callers that joined """
+
+        self.flights._end(self.key)
+        if self.leader and self.lock:
+            self.lock.release(self.offset)
+        self.future.set_result(answer)
+
+
+class SingleFlight():
+    """ Flights in progress in this process, by key """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+
+    def join(self, key, lock: LockFile=None) -> Flight:
+        """ Join the flight of a key, owning it if there is none yet.
+
+        Args:
+            key (tuple): what is fetched, e.g. (source, currency, weight, window)
+            lock (LockFile, optional): file to elect a leader among processes; without one the owner always leads
+
+        Returns:
+            Flight: the caller's place; an owner must call finish, even if it fails
+        """
+
+        with self._lock:
+            if (future := self._flights.get(key)) is not None:
+                return Flight(self, key, future, owner=False)
+            future = self._flights[key] = Future()
+
+        flight = Flight(self, key, future, owner=True, lock=lock)
+        flight.leader = lock is None or lock.acquire(flight.offset)
+        return flight
+
+    def _end(self, key):
+        with self._lock:
+            self._flights.pop(key, None)
+
+
+FLIGHTS = SingleFlight()
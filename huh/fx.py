@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+
+""" Currency conversion of metal prices with a local table of exchange rates.
+
+    Rates are read from the table (filled by importing files, or by refreshing from the
+    provider through the shared HTTP transport) and memoized per currency pair and day, so a
+    batch over many currencies needs one lookup per distinct pair and day.
+"""
+
+# Standard library
+import calendar
+import csv
+from dataclasses import replace
+import datetime
+import json
+from pathlib import Path
+import sqlite3
+import sys
+import threading
+
+# 3rd Party Library
+from .cache import cacheDir
+from .history import nearestRow, parseTimestamp
+from .metal import httpGet, MetalPrice, TIMEOUT, _fetchErrors
+
+
+PROVIDER = "https://api.frankfurter.app"    # European Central Bank reference rates (daily, business days)
+SOURCE = "frankfurter.app"
+BUCKET = 24 * 60 * 60 * 1000                # milliseconds; rates are memoized per pair and day
+TOLERANCE = 4 * BUCKET                      # a stored rate may be this far from the price (weekends, holidays)
+
+class ErrorExchangeRate(LookupError):
+    """ Exception class for a currency pair without a usable rate. """
+
+
+def _epoch(day: str) -> int:
+    """ Epoch (milliseconds) of midnight UTC on the ISO date """
+    return calendar.timegm(datetime.date.fromisoformat(day).timetuple()) * 1000
+
+
+class RateTable():
+    """ SQLite store of exchange rates (1 base = rate quote) indexed by (base, quote, timestamp).
+    """
+
+    def __init__(self, file=None):
+        self.file = Path(file) if file else cacheDir() / "rates.sqlite"
+        self._lock = threading.Lock()
+        self._db = None
+
+    def _connect(self):
+        if self._db is None:
+            self._db = sqlite3.connect(self.file, check_same_thread=False)
+            self._db.execute("""CREATE TABLE IF NOT EXISTS rates (
+                base TEXT, quote TEXT, timestamp INTEGER, rate REAL, source TEXT,
+                PRIMARY KEY (base, quote, timestamp)) WITHOUT ROWID""")
+        return self._db
+
+    def addRows(self, rows) -> int:
+        """ Store (base, quote, timestamp, rate, source) tuples in one transaction. """
+        with self._lock:
+            db = self._connect()
+            count = db.total_changes
+            db.executemany("INSERT OR REPLACE INTO rates VALUES (?, ?, ?, ?, ?)", rows)
+            db.commit()
+            return db.total_changes - count
+
+    def importFile(self, file, source: str="import") -> int:
+        """ Bulk import exchange rates.
+
+            JSON: {"base": "USD", "date": "2024-04-19", "rates": {"CAD": 1.37, ...}}, or a list of those
+                  (the provider's response format)
+            CSV:  columns base, quote, timestamp (epoch ms or ISO date & time), rate, and optionally source
+
+        Returns:
+            int: number of rates stored
+        """
+
+        path = Path(file)
+        if path.suffix.lower() == ".json":
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+            return self.addRows(row for day in (data if isinstance(data, list) else [data]) for row in self._rows(day, source))
+
+        def parse(row):
+            return (row['base'].upper(), row['quote'].upper(), parseTimestamp(row['timestamp']), float(row['rate']), row.get('source') or source)
+
+        with open(path, newline="", encoding="utf-8") as f:
+            return self.addRows(parse(row) for row in csv.DictReader(f))
+
+    @staticmethod
+    def _rows(day: dict, source: str):
+        ts = _epoch(day['date'])
+        return ( (day['base'].upper(), quote.upper(), ts, float(rate), source) for quote, rate in day['rates'].items() )
+
+    def refresh(self, base: str, date: datetime.date=None, timeout: float=TIMEOUT) -> int:
+        """ Fetch the rates of the base currency on the date (latest if None) from the provider.
+
+        Returns:
+            int: number of rates stored
+        """
+
+        url = f"{PROVIDER}/{date.isoformat() if date else 'latest'}"
+        day = httpGet(url, params={"from": base.upper()}, timeout=timeout).json()
+        return self.addRows(self._rows(day, SOURCE))
+
+    def nearest(self, base: str, quote: str, target: int):
+        """ Rate closest in time to the target (epoch ms).
+
+        Returns:
+            tuple: (timestamp, rate), or None if nothing is stored for the pair
+        """
+
+        with self._lock:
+            return nearestRow(self._connect(), "rates", "timestamp, rate", "base=? AND quote=?", (base.upper(), quote.upper()), target)
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+class Converter():
+    """ Converts metal prices between currencies with the rates of a RateTable.
+    """
+
+    def __init__(self, table: RateTable=None, refresh: bool=True, timeout: float=TIMEOUT):
+        self.table = table if table is not None else RateTable()
+        self.refresh = refresh
+        self.timeout = timeout
+
+        self._lock = threading.Lock()
+        self._rates = {}            # (base, quote, day): rate, or None when there is none
+        self._refreshed = set()     # (base, date) already asked of the provider, whether it answered or not
+
+    def rate(self, base: str, quote: str, timestamp: int) -> float:
+        """ Rate (1 base = rate quote) near the timestamp; memoized per pair and day, as is the lack of one,
+            so the provider is asked at most once per base currency and day.
+
+        Raises:
+            ErrorExchangeRate: no rate within the tolerance, stored or from the provider
+
+        Returns:
+            float: exchange rate
+        """
+
+        base, quote = base.upper(), quote.upper()
+        if base == quote:
+            return 1.0
+
+        key = (base, quote, int(timestamp) // BUCKET)
+        with self._lock:
+            known, rate = key in self._rates, self._rates.get(key)
+
+        if not known:
+            rate = self._lookup(base, quote, timestamp)
+            if rate is None and self.refresh:
+                today = datetime.datetime.now(datetime.timezone.utc).date()
+                day = datetime.datetime.fromtimestamp(timestamp / 1000, datetime.timezone.utc).date()
+                date = None if day >= today else day
+                with self._lock:
+                    asked = (base, date) in self._refreshed
+                    self._refreshed.add((base, date))
+                if not asked:
+                    try:
+                        self.table.refresh(base, date, self.timeout)
+                    except _fetchErrors() as e:
+                        print(f"[WARN] Unable to refresh {base} exchange rates: {e}", file=sys.stderr)
+                    rate = self._lookup(base, quote, timestamp)
+
+            with self._lock:
+                self._rates[key] = rate
+
+        if rate is None:
+            raise ErrorExchangeRate(f"No exchange rate from {base} to {quote} near {datetime.datetime.fromtimestamp(timestamp / 1000)}.")
+        return rate
+
+    def _lookup(self, base: str, quote: str, timestamp: int):
+        """ Stored rate of the pair, or the inverse of its reverse """
+        for pair, invert in (((base, quote), False), ((quote, base), True)):
+            if (hit := self.table.nearest(*pair, timestamp)) and abs(hit[0] - timestamp) <= TOLERANCE:
+                return 1 / hit[1] if invert else hit[1]
+        return None
+
+    def convert(self, m: MetalPrice, currency: str) -> MetalPrice:
+        """ Metal price in the currency (at the rate nearest the price's timestamp) """
+        if m.currency.upper() == currency.upper():
+            return m
+        return replace(m, price=m.price * self.rate(m.currency, currency, m.timestamp), currency=currency.upper())
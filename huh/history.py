@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+
+""" Local store of historical gold prices, so past fiscal dates are answered without API calls.
+"""
+
+# Standard library
+from array import array
+import csv
+import datetime
+import json
+from pathlib import Path
+import sqlite3
+import threading
+
+# 3rd Party Library
+from .cache import cacheDir
+
+
+def parseTimestamp(text: str) -> int:
+    """ Epoch (milliseconds) of an imported timestamp: epoch ms, or an ISO date & time """
+    text = text.strip()
+    return int(float(text)) if text.replace(".", "", 1).isdigit() else int(datetime.datetime.fromisoformat(text).timestamp() * 1e3)
+
+
+def nearestRow(db, table: str, columns: str, where: str, params: tuple, target: int):
+    """ Row closest in time to the target (epoch ms) among the rows matching where; the caller holds the store's lock.
+
+        Two index seeks: the closest row at or before the target, and at or after it.
+
+    Returns:
+        tuple: the columns of the row (timestamp first), or None if no row matches
+    """
+
+    params = (*params, int(target))
+    before = db.execute(f"SELECT {columns} FROM {table} WHERE {where} AND timestamp<=? ORDER BY timestamp DESC LIMIT 1", params).fetchone()
+    after = db.execute(f"SELECT {columns} FROM {table} WHERE {where} AND timestamp>=? ORDER BY timestamp ASC LIMIT 1", params).fetchone()
+
+    found = [ row for row in (before, after) if row ]
+    return min(found, key=lambda row: abs(row[0] - target)) if found else None
+
+
+class PriceHistory():
+    """ SQLite store of gold prices indexed by (currency, weight, timestamp).
+
+        Nearest-timestamp lookups are two index seeks (the closest point at or before, and
+        at or after, the target), so they stay O(log n) however many years are imported.
+    """
+
+    def __init__(self, file=None):
+        self.file = Path(file) if file else cacheDir() / "history.sqlite"
+        self._lock = threading.Lock()
+        self._db = None
+
+    def _connect(self):
+        if self._db is None:
+            self._db = sqlite3.connect(self.file, check_same_thread=False)
+            self._db.execute("""CREATE TABLE IF NOT EXISTS history (
+                currency TEXT, weight TEXT, timestamp INTEGER, price REAL, source TEXT,
+                PRIMARY KEY (currency, weight, timestamp)) WITHOUT ROWID""")
+        return self._db
+
+    def add(self, prices) -> int:
+        """ Store gold prices in one transaction; silver and other elements are ignored.
+
+        Args:
+            prices (iterable): MetalPrice (or anything with price, timestamp, currency, weight, element, source)
+
+        Returns:
+            int: number of prices stored
+        """
+
+        if isinstance(getattr(prices, 'timestamps', None), array):
+            # MetalPriceSeries: read the columns directly instead of a view per point
+            if prices.element != "au":
+                return 0
+            return self.addRows((prices.currency.upper(), prices.weight, ts, price, prices.source) for ts, price in zip(prices.timestamps, prices.prices))
+
+        return self.addRows((p.currency.upper(), p.weight, int(p.timestamp), p.price, p.source) for p in prices if p.element == "au")
+
+    def addRows(self, rows) -> int:
+        """ Store (currency, weight, timestamp, price, source) tuples in one transaction. """
+        with self._lock:
+            db = self._connect()
+            count = db.total_changes
+            db.executemany("INSERT OR REPLACE INTO history VALUES (?, ?, ?, ?, ?)", rows)
+            db.commit()
+            return db.total_changes - count
+
+    def importFile(self, file, currency: str=None, weight: str="oz", source: str="import") -> int:
+        """ Bulk import a gold.org chart dump (JSON) or a CSV.
+
+            JSON: {"chartData": {"USD": [[epoch ms, price], ...], ...}}
+            CSV:  columns timestamp (epoch ms or ISO date & time), price, and optionally
+                  currency, weight, source (defaults from the arguments)
+
+        Args:
+            file (str, Path): file to import
+            currency (str, optional): currency for CSV rows without one (defaults to USD)
+            weight (str): weight for rows without one
+            source (str): source for rows without one
+
+        Returns:
+            int: number of prices stored
+        """
+
+        path = Path(file)
+        if path.suffix.lower() == ".json":
+            with open(path, encoding="utf-8") as f:
+                chart = json.load(f)['chartData']
+
+            rows = ( (curr.upper(), weight, int(ts), float(price), source)
+                     for curr, points in chart.items() if not currency or curr.upper() == currency.upper()
+                     for ts, price in points if price is not None )
+            return self.addRows(rows)
+
+        def parse(row):
+            return ((row.get('currency') or currency or "USD").upper(), row.get('weight') or weight, parseTimestamp(row['timestamp']),
+                    float(row['price']), row.get('source') or source)
+
+        with open(path, newline="", encoding="utf-8") as f:
+            return self.addRows(parse(row) for row in csv.DictReader(f))
+
+    def nearest(self, target: int, currency: str="USD", weight: str="oz"):
+        """ Price closest in time to the target.
+
+        Args:
+            target (int): epoch (milliseconds)
+            currency (str): currency of the price
+            weight (str): weight unit of the price
+
+        Returns:
+            tuple: (timestamp, price, source), or None if nothing is stored
+        """
+
+        with self._lock:
+            return nearestRow(self._connect(), "history", "timestamp, price, source", "currency=? AND weight=?", (currency.upper(), weight), target)
+
+    def range(self, start: int, end: int, currency: str="USD", weight: str="oz") -> list:
+        """ Prices between two epochs (milliseconds), inclusive, oldest first.
+
+        Returns:
+            list: (timestamp, price, source) tuples
+        """
+
+        with self._lock:
+            return self._connect().execute("""SELECT timestamp, price, source FROM history WHERE currency=? AND weight=?
+                AND timestamp BETWEEN ? AND ? ORDER BY timestamp""", (currency.upper(), weight, int(start), int(end))).fetchall()
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
@@ -4,12 +4,19 @@
 """
 
 # Standard library
+from array import array
 from dataclasses import dataclass, asdict
+from decimal import Context, Decimal, InvalidOperation, localcontext, ROUND_HALF_UP
+import operator
 import json
 from pathlib import Path
 import sys
 import csv
 
+# 3rd Party Library
+from .ledger import Ledger, isLedger
+from .timing import timed
+
 """
     Symbol Reasoning - DRAFT
 
@@ -26,6 +33,23 @@ import csv
 
 """
 
+# Exact mode: decimal arithmetic with enough precision that nothing is rounded before display
+EXACT = Context(prec=34, rounding=ROUND_HALF_UP)
+CENT = Decimal("0.01")
+
+def toDecimal(value) -> Decimal:
+    """ Decimal of a number as written (floats by their shortest repr, e.g., 0.19 -> Decimal('0.19')) """
+    if value is None or isinstance(value, Decimal):
+        return value
+    return Decimal(repr(value) if isinstance(value, float) else str(value))
+
+def cents(value):
+    """ Round to cents: half up for exact (Decimal) values, as round() does for floats """
+    if isinstance(value, Decimal):
+        return value.quantize(CENT, context=EXACT)
+    return round(value, 2)
+
+
 @dataclass
 class HuququLabels:
     default: str = "huquq"
@@ -61,9 +85,10 @@ class Huququllah:
     price: float = None
     weight: str = "toz"
 
-    def __init__(self, wealth=None, price=None, weight: str='toz', currency: str="USD"):
-        self.wealth = wealth
-        self.price = price
+    def __init__(self, wealth=None, price=None, weight: str='toz', currency: str="USD", exact: bool=False):
+        self.exact = exact
+        self.wealth = toDecimal(wealth) if exact else wealth
+        self.price = toDecimal(price) if exact else price
         self.weight = weight
         self.curr = currency
 
@@ -105,21 +130,32 @@ class Huququllah:
             raise ValueError("Provide gold price to calculate basic sum (equal to 19 mit͟hqáls of gold).")
             sys.exit(1)
 
-        if self.weight in ("troy oz", "t oz", "toz", "oz"):
-            factor = self._TROYOZ
-        elif self.weight in ("gram", "grams", "g"):
-            factor = self._GRAMS
-        else:
-            raise ValueError(f"Unrecognized weight provided: {self.weight}")
-            sys.exit(1)
-        
-        self.basic = self.price * factor
+        with localcontext(EXACT):
+            self.basic = self.price * self._weightFactor(self.weight, self.exact)
         return self.basic
 
+    @classmethod
+    def _weightFactor(cls, weight: str, exact: bool=False) -> float:
+        """ Amount of the weight unit that equals 19 mit͟hqáls of gold.
+
+        Raises:
+            ValueError: Not able to determine weight conversion from given unit
+        """
+
+        if weight in ("troy oz", "t oz", "toz", "oz"):
+            return toDecimal(cls._TROYOZ) if exact else cls._TROYOZ
+        elif weight in ("gram", "grams", "g"):
+            return toDecimal(cls._GRAMS) if exact else cls._GRAMS
+
+        raise ValueError(f"Unrecognized weight provided: {weight}")
+
     def _remainder(self) -> float:
+        if self.exact:
+            self.basic = toDecimal(self.basic)
         try:
-            self.remainder = self.wealth % self.basic
-        except ZeroDivisionError:
+            with localcontext(EXACT):
+                self.remainder = self.wealth % self.basic
+        except (ZeroDivisionError, InvalidOperation):
             print("Basic sum cannot be equal to zero.")
             sys.exit(-1)
 
@@ -142,26 +178,159 @@ class Huququllah:
             raise ValueError(f"Provide gold price first to find basic sum amount.")
 
         if self.wealth < self.basic:
-            self.payable = 0.00
+            self.payable = Decimal("0.00") if self.exact else 0.00
         else: 
-            self.payable = (self.wealth - self.remainder) * self._PERCENT
+            with localcontext(EXACT):
+                self.payable = (self.wealth - self.remainder) * (toDecimal(self._PERCENT) if self.exact else self._PERCENT)
         
         return self.payable
 
     def __str__(self):
         """ String representation of this object """
-        return f"${round(self.payable, 2):.2f}"
+        return f"${cents(self.payable):.2f}"
 
     def report(self, label="huquq"):
         print(f"Accrued wealth is {self.wealth // self.basic}x over the 19{HuququLabels.mithqal_unit} of gold.")
-        print(f"Amount of wealth that {HuququLabels(default=label)} will be payable on: ${round((self.wealth - self.remainder), 2):.2f}.")
+        print(f"Amount of wealth that {HuququLabels(default=label)} will be payable on: ${cents(self.wealth - self.remainder):.2f}.")
         print(" ~ ~ ~ ")
-        print(f"Basic: ${round(self.basic, 2):.2f} (equivalent to 19{HuququLabels.mithqal_unit} of gold)")
-        print(f"Remainder of wealth: ${round(self.remainder, 2):.2f} ({HuququLabels.huquq_diacritic_lower} not paid)")
-        print(f"Payable: ${round(self.payable, 2):.2f} {self.curr}\n")
+        print(f"Basic: ${cents(self.basic):.2f} (equivalent to 19{HuququLabels.mithqal_unit} of gold)")
+        print(f"Remainder of wealth: ${cents(self.remainder):.2f} ({HuququLabels.huquq_diacritic_lower} not paid)")
+        print(f"Payable: ${cents(self.payable):.2f} {self.curr}\n")
+
+
+class HuququllahBatch:
+    """ Ḥuqúqu'lláh for a whole column of wealth values in one vectorized pass.
+
+        Price and weight may be shared by every row or given per row. Uses NumPy when it is
+        installed and falls back to stdlib arrays; either way the results match Huququllah
+        row for row (same float operations in the same order).
+
+        Attributes (arrays, one element per row):
+            wealth, price, basic, remainder, payable, units (wealth // basic)
+
+        With exact, every row is calculated in decimal arithmetic (lists of Decimal) and
+        matches Huququllah(..., exact=True) row for row.
+    """
+
+    @timed("calculate (batch)")
+    def __init__(self, wealth, price=None, weight='toz', currency: str="USD", basic=None, exact: bool=False):
+        self.curr = currency
+        self.exact = exact
+        n = len(wealth)
+
+        if basic is None:
+            if price is None or (isinstance(price, (int, float)) and not price):
+                raise ValueError("Provide gold price to calculate basic sum (equal to 19 mit͟hqáls of gold).")
+
+            if isinstance(weight, str):
+                factor = Huququllah._weightFactor(weight)
+            else:
+                factor = [ Huququllah._weightFactor(w) for w in weight ]
+
+        if exact:
+            self._exact(wealth, price, factor if basic is None else None, basic, n)
+            return
+
+        try:
+            import numpy as np
+        except ImportError:
+            np = None
+
+        if np is not None:
+            self.wealth = np.asarray(wealth, dtype=np.float64)
+            if basic is None:
+                self.price = np.broadcast_to(np.asarray(price, dtype=np.float64), (n,))
+                self.basic = self.price * np.asarray(factor, dtype=np.float64)
+            else:
+                self.price = None
+                self.basic = np.broadcast_to(np.asarray(basic, dtype=np.float64), (n,))
+
+            if not self.basic.all():
+                raise ValueError("Basic sum cannot be equal to zero.")
+
+            self.remainder = np.mod(self.wealth, self.basic)
+            self.payable = np.where(self.wealth < self.basic, 0.0, (self.wealth - self.remainder) * Huququllah._PERCENT)
+            self.units = np.floor_divide(self.wealth, self.basic)
+        else:
+            self.wealth = array('d', wealth)
+            if basic is None:
+                self.price = array('d', price) if hasattr(price, '__len__') else array('d', [price]) * n
+                factors = array('d', factor) if not isinstance(factor, float) else array('d', [factor]) * n
+                self.basic = array('d', map(operator.mul, self.price, factors))
+            else:
+                self.price = None
+                self.basic = array('d', basic) if hasattr(basic, '__len__') else array('d', [basic]) * n
+
+            if not all(self.basic):
+                raise ValueError("Basic sum cannot be equal to zero.")
+
+            self.remainder = array('d', map(operator.mod, self.wealth, self.basic))
+            self.payable = array('d', ( 0.0 if w < b else (w - r) * Huququllah._PERCENT for w, b, r in zip(self.wealth, self.basic, self.remainder) ))
+            self.units = array('d', map(operator.floordiv, self.wealth, self.basic))
+
+    def _exact(self, wealth, price, factor, basic, n):
+        """ Decimal path; each distinct price, weight factor and basic sum is converted only once. """
+
+        def column(values):
+            if isinstance(values, (int, float, str, Decimal)):
+                return [toDecimal(values)] * n
+            converted = {}
+            return [ converted[v] if v in converted else converted.setdefault(v, toDecimal(v)) for v in values ]
+
+        with localcontext(EXACT):
+            self.wealth = column(wealth)
+            if basic is None:
+                self.price = column(price)
+                self.basic = list(map(operator.mul, self.price, column(factor)))
+            else:
+                self.price = None
+                self.basic = column(basic)
+
+            if not all(self.basic):
+                raise ValueError("Basic sum cannot be equal to zero.")
+
+            percent, zero = toDecimal(Huququllah._PERCENT), Decimal("0.00")
+            self.remainder = list(map(operator.mod, self.wealth, self.basic))
+            self.payable = [ zero if w < b else (w - r) * percent for w, b, r in zip(self.wealth, self.basic, self.remainder) ]
+            self.units = list(map(operator.floordiv, self.wealth, self.basic))
+
+    def __len__(self):
+        return len(self.wealth)
+
+    def total(self) -> float:
+        """ Sum of the payable amounts (a Decimal when exact) """
+        if self.exact:
+            with localcontext(EXACT):
+                return sum(self.payable, Decimal(0))
+        return float(sum(self.payable))
 
 
 def record(pkg, file=Path("huququllah_record.csv")):
+    recordMany([pkg], file)
+
+@timed("record")
+def recordMany(pkgs, file=Path("huququllah_record.csv")) -> int:
+    """ Append records to the record file: a ledger (.db/.sqlite/.sqlite3) in one transaction, otherwise a CSV file opened once.
+
+    Args:
+        pkgs (iterable): records (recorded date, target time, gold price date, gold price, weight, currency, price source, wealth, payable)
+        file (str, Path): record file
+
+    Returns:
+        int: number of records added
+    """
+
+    if isLedger(file):
+        ledger = Ledger(file)
+        try:
+            return ledger.recordMany(pkgs)
+        finally:
+            ledger.close()
+
+    count = 0
     with open(file, 'a+', newline="") as csvfile:
         csvwriter = csv.writer(csvfile)
-        csvwriter.writerow(pkg)
\ No newline at end of file
+        for pkg in pkgs:
+            csvwriter.writerow(pkg)
+            count += 1
+    return count
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+
+""" Indexed record ledger (SQLite), an alternative to appending to the CSV record file.
+"""
+
+# Standard library
+import csv
+from pathlib import Path
+import sqlite3
+
+
+SUFFIXES = (".db", ".sqlite", ".sqlite3")
+COLUMNS = ("recorded", "target", "price_timestamp", "price", "weight", "currency", "source", "wealth", "payable")
+MONEY = ("price", "wealth", "payable")
+
+def isLedger(file) -> bool:
+    """ Record files with a database extension are ledgers; anything else is CSV """
+    return Path(file).suffix.lower() in SUFFIXES
+
+
+class Ledger():
+    """ Records kept in SQLite (write-ahead logging), indexed on recorded date, fiscal target time and currency.
+
+        Rows have the same fields, in the same order, as the CSV record file.
+    """
+
+    def __init__(self, file):
+        self.file = Path(file)
+        self._db = sqlite3.connect(self.file)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(f"CREATE TABLE IF NOT EXISTS records ({', '.join(COLUMNS)})")
+        for column in ("recorded", "target", "currency"):
+            self._db.execute(f"CREATE INDEX IF NOT EXISTS records_{column} ON records ({column})")
+        self._db.commit()
+
+    def record(self, pkg: list):
+        """ Add one record """
+        self.recordMany([pkg])
+
+    def recordMany(self, pkgs) -> int:
+        """ Add many records in a single transaction.
+
+        Args:
+            pkgs (iterable): records in the CSV layout (see COLUMNS)
+
+        Returns:
+            int: number of records added
+        """
+
+        marks = ", ".join("?" * len(COLUMNS))
+        with self._db:
+            count = self._db.total_changes
+            self._db.executemany(f"INSERT INTO records VALUES ({marks})", (tuple(self._value(v) for v in pkg) for pkg in pkgs))
+            return self._db.total_changes - count
+
+    @staticmethod
+    def _value(value):
+        """ Numbers formatted as text (e.g., '2000.00') are stored as numbers; dates and names as text """
+        if isinstance(value, (int, float)) or value is None:
+            return value
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return str(value)
+
+    def rows(self, start: str=None, end: str=None, column: str="recorded"):
+        """ Stream records, optionally only those with the column between start and end (inclusive).
+
+        Yields:
+            tuple: record in the CSV layout
+        """
+
+        if column not in ("recorded", "target"):
+            raise ValueError(f"Can only filter on recorded or target, not: {column}")
+
+        where, args = [], []
+        if start:
+            where.append(f"{column} >= ?")
+            args.append(str(start))
+        if end:
+            where.append(f"{column} <= ?")
+            args.append(str(end))
+
+        query = f"SELECT {', '.join(COLUMNS)} FROM records"
+        if where:
+            query += " WHERE " + " AND ".join(where)
+        yield from self._db.execute(query + f" ORDER BY {column}", args)
+
+    def export(self, file) -> int:
+        """ Write every record to a CSV file in the record file layout.
+
+        Returns:
+            int: number of records written
+        """
+
+        count = 0
+        with open(file, 'w', newline="") as csvfile:
+            csvwriter = csv.writer(csvfile)
+            for row in self.rows():
+                csvwriter.writerow([ f'{round(v, 2):.2f}' if c in MONEY and isinstance(v, float) else ("" if v is None else v)
+                                     for c, v in zip(COLUMNS, row) ])
+                count += 1
+
+        return count
+
+    def close(self):
+        self._db.close()
@@ -1,17 +1,28 @@
-
 # -*- coding: utf-8 -*-
 
 """ Metal price for gold and silver.
 """
 
 # Standard library
-from dataclasses import dataclass
+from array import array
+from bisect import bisect_left, bisect_right
+import codecs
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from dataclasses import dataclass, asdict, field
 import datetime
-import requests
-import sys
+import json
+import re
+import sqlite3
+import threading
+import time
+from urllib.parse import urlsplit
 
 # 3rd Party Library
-from .spacetime import nearestTime, timeRange
+from .cache import PriceCache
+from .flight import FLIGHTS, lockFile
+from .history import PriceHistory
+from .spacetime import datetimeToEpoch, nearestTime, timeRange
+from .timing import span
 
 
 class ErrorMetalData(Exception):
@@ -29,7 +40,7 @@ class MetalPrice:
     """
 
     price: float = 0.00
-    timestamp: int = datetime.datetime.now().timestamp()
+    timestamp: int = field(default_factory=lambda: int(time.time() * 1000))    # epoch milliseconds, when created
     currency: str = 'USD'
     weight: str = "oz"
     element: str = "au"
@@ -39,31 +50,256 @@ class MetalPrice:
         return f"${round(self.price, 2):.2f}/{self.weight} {self.currency}"
 
 
+class MetalPriceSeries:
+    """ Compact series of prices from one source: parallel arrays of timestamps (sorted) and prices,
+        with the currency, weight, element and source shared by every point.
+
+        Iterating, indexing, nearest and range hand out MetalPrice views of the points.
+    """
+
+    __slots__ = ("timestamps", "prices", "currency", "weight", "element", "source")
+
+    def __init__(self, timestamps=(), prices=(), currency: str='USD', weight: str="oz", element: str="au", source: str=None):
+        self.timestamps = array('q', timestamps)
+        self.prices = array('d', prices)
+        self.currency, self.weight, self.element, self.source = currency, weight, element, source
+
+        if len(self.timestamps) != len(self.prices):
+            raise ValueError("Timestamps and prices must be the same length.")
+        self._sort(0)
+
+    def _sort(self, start: int):
+        """ Sort the points by time if any from start on is out of order """
+        ts = self.timestamps
+        if any(a > b for a, b in zip(ts[max(start - 1, 0):], ts[max(start, 1):])):
+            order = sorted(range(len(ts)), key=ts.__getitem__)
+            self.timestamps = array('q', (ts[i] for i in order))
+            self.prices = array('d', (self.prices[i] for i in order))
+
+    @classmethod
+    def fromPoints(cls, points, currency: str='USD', weight: str="oz", element: str="au", source: str=None, digits: int=2):
+        """ Series from [timestamp, price] pairs (e.g., gold.org chart data), prices rounded to digits. """
+        series = cls(currency=currency, weight=weight, element=element, source=source)
+        series.extend(points, digits)
+        return series
+
+    def extend(self, points, digits: int=2):
+        """ Add [timestamp, price] pairs, prices rounded to digits; pairs without a price (null) are skipped.
+
+        Raises:
+            ValueError: a point is not a pair of numbers
+        """
+
+        start = len(self.timestamps)
+        try:
+            for ts, price in points:
+                if price is None:
+                    continue
+                self.timestamps.append(int(ts))
+                self.prices.append(round(price, digits))
+        except TypeError as e:
+            raise ValueError(f"Malformed point: {e}")
+        finally:
+            del self.timestamps[len(self.prices):]     # drop a half-added point
+        self._sort(start)
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def __getitem__(self, i: int) -> MetalPrice:
+        return MetalPrice(self.prices[i], self.timestamps[i], self.currency, self.weight, self.element, self.source)
+
+    def __iter__(self):
+        for ts, price in zip(self.timestamps, self.prices):
+            yield MetalPrice(price, ts, self.currency, self.weight, self.element, self.source)
+
+    def nearest(self, target) -> MetalPrice:
+        """ Price closest in time to the target (datetime or epoch ms); None if the series is empty. """
+
+        if isinstance(target, datetime.datetime):
+            target = datetimeToEpoch(target)
+        if not self.timestamps:
+            return None
+
+        i = bisect_left(self.timestamps, target)
+        if i == len(self.timestamps) or (i and target - self.timestamps[i - 1] <= self.timestamps[i] - target):
+            i -= 1
+        return self[i]
+
+    def range(self, start, end) -> "MetalPriceSeries":
+        """ Points from start to end (epoch ms, inclusive) as a new series. """
+        i, j = bisect_left(self.timestamps, start), bisect_right(self.timestamps, end)
+        return MetalPriceSeries(self.timestamps[i:j], self.prices[i:j], self.currency, self.weight, self.element, self.source)
+
+
+""" Shared transport for the price providers
+"""
+TIMEOUT = 5.0       # seconds allowed for each source
+DEADLINE = 8.0      # seconds allowed for all sources together
+TOLERANCE = 45 * 60 * 1000  # milliseconds a stored historical price may be from the target
+RETRIES = 3         # attempts after the first on refused connections and 5xx responses (never on timeouts)
+BACKOFF = 0.3       # seconds; doubled on each retry, plus up to this much random jitter
+GOLDPRICE_URL = "https://data-asg.goldprice.org/dbXRates/{currency}"
+GOLDORG_URL = "https://fsapi.gold.org/api/goldprice/v11/chart/price/{currency}/{weight}/{start},{end}"
+CHUNK = 64 * 1024   # bytes read at a time from streamed answers
+BROWSER = {'user-agent': 'Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:120.0) Gecko/20100101 Firefox/120.0'}
+FRESH = PriceCache.LIVE_TTL * 1000  # milliseconds a stored price may be farther from a target near now than a quote fetched now
+
+_sessions = {}
+_sessionsLock = threading.Lock()
+
+def session(url: str) -> "requests.Session":
+    """ Pooled session for the host of the url, so connections (and TLS handshakes) are reused.
+
+    Args:
+        url (str): any url on the host
+
+    Returns:
+        requests.Session: keep-alive session with bounded retries and gzip accepted
+    """
+
+    # Imported here so that runs with a user provided price never load requests
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+    from urllib3.util.retry import Retry
+
+    class NoTimeoutRetry(Retry):
+        """ Retry that gives up on a connect timeout, as another attempt would wait the whole timeout again """
+
+        def increment(self, method=None, url=None, response=None, error=None, _pool=None, _stacktrace=None):
+            if isinstance(error, ConnectTimeoutError) and not isinstance(error, NewConnectionError):
+                return Retry.increment(self.new(total=0), method, url, response, error, _pool, _stacktrace)
+            return super().increment(method, url, response, error, _pool, _stacktrace)
+
+    host = urlsplit(url).netloc
+    with _sessionsLock:
+        if (s := _sessions.get(host)) is None:
+            # Read timeouts are not retried either (read=False), so timeout bounds each source rather than each attempt
+            retry = NoTimeoutRetry(total=RETRIES, read=False, backoff_factor=BACKOFF, backoff_jitter=BACKOFF,
+                                   status_forcelist=(500, 502, 503, 504), allowed_methods=("GET",))
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=8, max_retries=retry)
+
+            s = requests.Session()
+            s.mount("http://", adapter)
+            s.mount("https://", adapter)
+            s.headers.update({'accept-encoding': 'gzip, deflate'})
+            _sessions[host] = s
+
+    return s
+
+def httpGet(url: str, headers: dict=None, timeout: float=TIMEOUT, **kwargs) -> "requests.Response":
+    """ GET through the pooled session of the host.
+
+    Raises:
+        requests.RequestException: connection failed, retries ran out, or error status
+
+    Returns:
+        requests.Response: successful response
+    """
+
+    res = session(url).get(url, headers=headers, timeout=timeout, **kwargs)
+    res.raise_for_status()
+    return res
+
+
 """ Functions that make API calls to get metal price
 """
-def metal_price(target, currency: str="USD", metal_type: str='au') -> MetalPrice:
+
+def metal_price(target, currency: str="USD", metal_type: str='au', timeout: float=TIMEOUT, deadline: float=DEADLINE, cache=None, history=None, registry=None) -> MetalPrice:
     """ Checks a couple apis and gives metal price nearest target date
 
-        Only one source is checked for silver price.
+        The target is first looked up in the local price history (for a target near now, only a
+        price about as close to it as a quote fetched now will do, such as a prefetched one);
+        prices fetched from the apis are added to it. Providers with a fresh entry in the local price cache
+        are not fetched again. The rest are fetched with the registry's strategy: all at
+        once (a run waits for the slowest provider that answers, or the deadline) or hedged.
+        Quotes of providers that only quote "now" are ignored for past targets unless nothing
+        else answers; all of it within the one deadline.
 
     Args:
         target (datetime): 
         currency (str): 
         metal_type (str): 
+        timeout (float): seconds allowed for each provider
+        deadline (float): seconds allowed for all providers together
+        cache (PriceCache, optional): price cache to consult; defaults to the user cache, False disables it
+        history (PriceHistory, optional): price history to consult; defaults to the user history, False disables it
+        registry (ProviderRegistry, optional): providers to ask; defaults to REGISTRY
 
     Returns:
         MetalPrice: Package with details regarding metal price
     """
     
     times = timeRange(target)
-    fgpn = fetchGoldPriceNow(currency)
-    fgo = fetchGoldOrg(times[0], times[1], currency)
-    prices = fgpn + fgo # And any other additional API calls
+    registry = registry or REGISTRY
+    try:
+        cache = PriceCache() if cache is None else cache
+        history = PriceHistory() if history is None else history
+    except OSError:
+        cache, history = cache or False, history or False
+
+    epoch, now = datetimeToEpoch(target), datetimeToEpoch(datetime.datetime.now())
+    past = epoch + TOLERANCE < now
+
+    if metal_type in ("silver", "ag"):
+        results = _resolve(registry, registry.ranked("ag"), times, currency, timeout, deadline, cache, False)
+        return next((p for prices in results.values() for p in prices if p.element == "ag"), None)
+
+    if history:
+        try:
+            if hit := _fromHistory(history, epoch, currency, None if past else now):
+                return hit
+        except sqlite3.Error:
+            history = False
+
+    providers = registry.ranked("au")
+    if past and registry.strategy == "hedged":
+        # A hedged fetch stops at the first answer, so live providers are only asked (in the time left) when the others had nothing
+        stop = time.perf_counter() + deadline
+        results = _resolve(registry, [ p for p in providers if not p.live ], times, currency, timeout, deadline, cache, history)
+        if not any(results.values()) and (remaining := stop - time.perf_counter()) > 0:
+            results = _resolve(registry, [ p for p in providers if p.live ], times, currency, timeout, remaining, cache, history)
+    else:
+        results = _forTarget(_resolve(registry, providers, times, currency, timeout, deadline, cache, history), past)
+
+    return _choose(results, epoch, currency)
+
+
+def _forTarget(results: dict, past: bool) -> dict:
+    """ Results that may answer the target: for a past one, live providers' "now" quotes only count when no other provider had prices """
+    if not past:
+        return results
+    return { p: prices for p, prices in results.items() if not p.live and prices } or { p: prices for p, prices in results.items() if p.live }
+
+
+def _fromHistory(history, epoch: int, currency: str, now: int=None) -> MetalPrice:
+    """ Stored gold price within TOLERANCE of the epoch, or None.
+
+        For a target that is not past yet (now given, in epoch ms), the price must also be within
+        FRESH of being as close to the target as a quote fetched now would be.
+    """
 
-    if metal_type in ("silver", "ag") and fgpn[1].element == "ag":
-        return fgpn[1]
+    tolerance = TOLERANCE if now is None else min(TOLERANCE, abs(now - epoch) + FRESH)
+    with span("price history"):
+        hit = history.nearest(epoch, currency)
+    if hit and abs(hit[0] - epoch) <= tolerance:
+        return MetalPrice(hit[1], hit[0], currency, "oz", source=hit[2])
+    return None
 
-    n = nearestTime(target, prices)
+
+def _choose(results: dict, epoch: int, currency: str) -> MetalPrice:
+    """ Gold price nearest the epoch among the providers' results (recording each provider's freshness) """
+
+    nearest = []
+    for provider, provider_prices in results.items():
+        if gold := _nearestGold(provider_prices, epoch):
+            provider.measureFreshness(abs(gold.timestamp - epoch))
+            nearest.append(gold)
+    if not nearest:
+        return None
+
+    n = nearestTime(epoch, nearest)
 
     if n.currency != currency:
         print(f'Failed to obtain gold price in {currency} from "{n.source}"; switched to {n.currency}.')
@@ -71,11 +307,152 @@ def metal_price(target, currency: str="USD", metal_type: str='au') -> MetalPrice
     return n
 
 
-def fetchGoldPriceNow(currency: str="USD"):
+def _nearestGold(prices, epoch: int) -> MetalPrice:
+    """ Gold price of one provider closest to the epoch; series are searched by bisection. """
+    if isinstance(prices, MetalPriceSeries):
+        return prices.nearest(epoch) if prices.element == "au" else None
+    gold = [ p for p in prices if p.element == "au" ]
+    return nearestTime(epoch, gold) if gold else None
+
+
+def _resolve(registry, providers, times, currency, timeout, deadline, cache, history) -> dict:
+    """ Prices from each provider: from the cache when fresh, otherwise fetched (and then cached and stored).
+
+        Fetches are single flight (see flight.py): a provider already being fetched for the window,
+        in this process or in another one using the same cache, is not fetched again.
+    """
+
+    results, missing = _cached(providers, times, currency, cache)
+    if not missing:
+        return results
+
+    stop = time.perf_counter() + deadline
+    lock = lockFile(cache) if cache else None
+    flights = { p: FLIGHTS.join((p.name, currency, "oz", PriceCache.windowKey(None if p.live else times)[0]), lock) for p in missing }
+
+    def fetch(leading):
+        # A leader that just finished may have cached the answer already
+        nonlocal history
+        shared, leading = _cached(leading, times, currency, cache) if lock else ({}, leading)
+        results.update(shared)
+        if leading and (remaining := stop - time.perf_counter()) > 0:
+            for provider, prices in registry.fetch(leading, times, currency, timeout, remaining).items():
+                history = _store(provider, prices, times, currency, cache, history)
+                results[provider] = prices
+
+    try:
+        fetch([ p for p, f in flights.items() if f.leader ])
+        fetch([ p for p, f in flights.items() if f.owner and not f.leader and f.wait(stop - time.perf_counter()) ])
+    finally:
+        for provider, f in flights.items():
+            if f.owner:
+                f.finish(results.get(provider))
+
+    for provider, f in flights.items():
+        if not f.owner and (prices := f.result(stop - time.perf_counter())):
+            results[provider] = prices
+
+    return results
+
+
+def _cached(providers, times, currency, cache) -> tuple:
+    """ Prices of the providers with a fresh cache entry, and the providers without one.
+
+    Returns:
+        tuple: ({provider: list of MetalPrice}, [provider])
+    """
+
+    results, missing = {}, []
+    for provider in providers:
+        window = None if provider.live else times
+        with span("price cache"):
+            hit = cache.get(provider.name, currency, "oz", window) if cache else None
+        if hit is not None:
+            results[provider] = [ MetalPrice(**p) for p in hit ]
+        else:
+            missing.append(provider)
+    return results, missing
+
+
+def _store(provider, prices, times, currency, cache, history):
+    """ Cache a provider's fetched prices and add them to the history; returns the history (False once it fails). """
+
+    if cache:
+        cache.put(provider.name, currency, "oz", None if provider.live else times, [ asdict(p) for p in prices ])
+    if history:
+        try:
+            history.add(prices)
+        except sqlite3.Error:
+            history = False
+    return history
+
+
+def fetchAll(sources, times, currency: str="USD", timeout: float=TIMEOUT, deadline: float=DEADLINE) -> dict:
+    """ Query every source concurrently and collect whatever answers before the deadline.
+
+        A source that raises, times out, or misses the deadline is left out of the results.
+
+    Args:
+        sources (list): providers (or functions) called with (times, currency, timeout)
+        times (tuple): epoch range (start, end) from timeRange
+        currency (str): currency to request
+        timeout (float): seconds allowed for each source
+        deadline (float): seconds allowed for all sources together
+
+    Returns:
+        dict: {source: list of MetalPrice}
+    """
+
+    errors = _fetchErrors()
+    futures = { background(source, times, currency, timeout): source for source in sources }
+    done, _ = wait(futures, timeout=deadline)
+
+    results = {}
+    for future in done:
+        try:
+            results[futures[future]] = future.result()
+        except errors as e:
+            source = futures[future]
+            print(f' [WARN] Skipping "{getattr(source, "name", None) or source.__name__}": {e}')
+
+    return results
+
+
+def background(fn, *args) -> Future:
+    """ Call fn(*args) on a daemon thread.
+
+        Unlike concurrent.futures workers, which are joined when the interpreter exits, a daemon
+        thread stuck in a request past the deadline does not keep the process running.
+
+    Returns:
+        Future: result (or exception) of the call
+    """
+
+    future = Future()
+
+    def run():
+        future.set_running_or_notify_cancel()
+        try:
+            future.set_result(fn(*args))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, name=f"fetch {getattr(fn, 'name', None) or getattr(fn, '__name__', fn)}", daemon=True).start()
+    return future
+
+
+def _fetchErrors() -> tuple:
+    """ Exceptions that mean a source failed (rather than a bug), so it is skipped """
+    from requests import RequestException
+    return (ErrorMetalData, RequestException, ValueError, KeyError, IndexError, TypeError)
+
+
+def fetchGoldPriceNow(currency: str="USD", timeout: float=TIMEOUT):
     """ Fetch current gold price from goldprice.org
 
     Args:
-        None
+        currency (str): currency to request
+        timeout (float): seconds to wait on the server
 
     Raises:
         ErrorAcquireMetalData: When failed to retrieve metal data
@@ -85,55 +462,415 @@ def fetchGoldPriceNow(currency: str="USD"):
     """
 
     site = "goldprice.org"
-    url = f"https://data-asg.goldprice.org/dbXRates/{currency}"
-
-    headers = {
-        'user-agent': 'Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:120.0) Gecko/20100101 Firefox/120.0'
-    }
-
-    results = requests.get(url, headers=headers).json()   
+    results = httpGet(GOLDPRICE_URL.format(currency=currency), headers=BROWSER, timeout=timeout).json()
     if not results:
         raise ErrorAcquireMetalData(f" [ERROR] No data retrieved from {site}")
-        sys.exit(-1)
     elif not results['items']:
-        url = f"https://data-asg.goldprice.org/dbXRates/USD"
-        results = requests.get(url, headers=headers).json()
+        results = httpGet(GOLDPRICE_URL.format(currency="USD"), headers=BROWSER, timeout=timeout).json()
 
-        if not results:
-            raise ErrorAcquireMetalData(f" [ERROR] No data retrieved from {site}")
-            return []
-            # sys.exit(-1)
+    return goldPriceNowData(results, site)
 
-    data = [
-        MetalPrice(round(results['items'][0]['xauPrice'], 2), results['tsj'], results['items'][0]['curr'], source=site),
-        MetalPrice(round(results['items'][0]['xagPrice'], 2), results['tsj'], results['items'][0]['curr'], element='ag', source=site)
-    ]
 
-    return data
+def goldPriceNowData(results: dict, site: str="goldprice.org") -> list:
+    """ Gold and silver MetalPrice from a goldprice.org answer (shared by the blocking and async fetches)
 
-def fetchGoldOrg(start, end, currency: str="USD", weight: str="oz"):
-    
-    site = "gold.org"
-    url = f"https://fsapi.gold.org/api/goldprice/v11/chart/price/{currency}/{weight}/{start},{end}"
+    Raises:
+        ErrorAcquireMetalData: When the answer has no prices, or not in the expected shape
+    """
 
-    res = requests.get(url).json()
-    if not res:
+    if not isinstance(results, dict) or not results.get('items'):
         raise ErrorAcquireMetalData(f" [ERROR] No data retrieved from {site}")
-    
-    if currency.upper() == (curr:= list(res['chartData'].keys())[0].upper()):
-        curr = currency
 
     try:
-        if len(curr) != 3:
-            raise ValueError("Unable to get correct currency key.")
+        item = results['items'][0]
+        return [
+            MetalPrice(round(item['xauPrice'], 2), results['tsj'], item['curr'], source=site),
+            MetalPrice(round(item['xagPrice'], 2), results['tsj'], item['curr'], element='ag', source=site)
+        ]
+    except (KeyError, IndexError, TypeError) as e:
+        raise ErrorAcquireMetalData(f" [ERROR] Unexpected answer from {site}: {e!r}")
+
+def fetchGoldOrg(start, end, currency: str="USD", weight: str="oz", timeout: float=TIMEOUT):
+    """ Fetch gold prices between the epochs from gold.org; the answer is parsed as it arrives (see ChartParser).
+
+    Raises:
+        ErrorAcquireMetalData: When no data is retrieved
+        ErrorMetalDataConvert: When the answer has no chart data
+
+    Returns:
+        MetalPriceSeries: prices (an empty list if the answer's currency or points are unusable)
+    """
+
+    chart = ChartReader(currency, weight)
+    with httpGet(GOLDORG_URL.format(currency=currency, weight=weight, start=start, end=end), timeout=timeout, stream=True) as res:
+        for chunk in res.iter_content(CHUNK):
+            chart.feed(chunk)
+    return chart.result()
+
+
+def chartSeries(series: MetalPriceSeries, key: str, currency: str="USD"):
+    """ Series of a gold.org chart in the currency of its key (the requested spelling if they only differ in case).
+
+    Returns:
+        MetalPriceSeries: the series, or an empty list if the key is not a currency
+    """
+
+    series.currency = currency if key.upper() == currency.upper() else key
+    return series if len(series.currency) == 3 else []
+
+
+class ChartReader():
+    """ A gold.org chart answer read into a MetalPriceSeries as it arrives (shared by the blocking and async fetches).
+
+        The transport feeds every chunk of the body, then asks for the result. The rest of a
+        complete answer is still fed, but dropped rather than buffered, so the connection is reused.
+    """
+
+    def __init__(self, currency: str="USD", weight: str="oz", site: str="gold.org"):
+        self.currency = currency
+        self.parser, self.series = ChartParser(site), MetalPriceSeries(weight=weight, source=site)
+        self._unusable = False      # a point could not be read as a price
+
+    def feed(self, chunk: bytes):
+        if self._unusable:
+            return
+        try:
+            self.series.extend(self.parser.feed(chunk))
+        except ValueError:
+            self._unusable = True
+
+    def result(self):
+        """ Series of the whole answer.
+
+        Raises:
+            ErrorAcquireMetalData: When the answer is empty
+            ErrorMetalDataConvert: When the answer has no chart data
+
+        Returns:
+            MetalPriceSeries: prices (an empty list if the answer's currency or points are unusable)
+        """
+
+        if self._unusable:
+            return []
+        try:
+            self.series.extend(self.parser.close())
+        except ValueError:
+            return []
+        return chartSeries(self.series, self.parser.key, self.currency)
+
+
+class ChartParser():
+    """ Incremental parser of a gold.org chart answer: {"chartData": {"USD": [[timestamp, price], ...]}, ...}
 
-        data = [ MetalPrice(round(el[1], 2), el[0], curr, weight, source=site) for el in res['chartData'][curr] ]
-    except ValueError as e:
-        # print(e)
-        return []
-    except KeyError as e:
-        print(" [ERROR] Issue with JSON key.")
-        sys.exit(-1)
+        Bytes are fed as they arrive and the points of the first chartData series come back as
+        soon as they are complete, so the body is never held whole nor parsed into a tree. The
+        rest of the answer is scanned past. Only the unparsed tail of the input is buffered
+        (all of it if the answer is malformed, until close reports it).
+    """
+
+    STEPS = ('"chartData"', ":", "{", "key", ":", "[", "points")
+    _JSON = json.JSONDecoder()
+    _END = re.compile(r"\]\s*\]")
+
+    def __init__(self, site: str="gold.org"):
+        self.site = site
+        self.key = None             # currency key of the series, once read
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self._buf, self._pos = "", 0
+        self._step = 0
+        self._head = ""             # first characters of the answer (to tell an empty one)
+
+    @property
+    def done(self) -> bool:
+        """ The series is complete (the rest of the answer can be dropped) """
+        return self._step == len(self.STEPS)
+
+    def feed(self, chunk: bytes, final: bool=False) -> list:
+        """ Parse the next bytes of the answer.
+
+        Returns:
+            list: [timestamp, price] points completed by the bytes
+        """
+
+        if self.done:
+            return []
+
+        text = self._decoder.decode(chunk, final)
+        if len(self._head) < 8:
+            self._head += "".join(text.split())[:8]
+        self._buf, self._pos = self._buf[self._pos:] + text, 0
+        return self._parse()
+
+    def close(self) -> list:
+        """ End of the answer.
+
+        Raises:
+            ErrorAcquireMetalData: When the answer is empty
+            ErrorMetalDataConvert: When the answer has no complete chart series
+
+        Returns:
+            list: [timestamp, price] points completed by the end
+        """
+
+        points = self.feed(b"", final=True)
+        if self.done:
+            return points
+        if self._step == 0 and self._head in ("", "{}", "[]", "null"):
+            raise ErrorAcquireMetalData(f" [ERROR] No data retrieved from {self.site}")
+        raise ErrorMetalDataConvert(f" [ERROR] Issue with JSON key from {self.site}: no complete {self.STEPS[self._step]} in chartData")
+
+    def _char(self) -> str:
+        """ Next character after any whitespace ("" when more input is needed) """
+        buf, pos = self._buf, self._pos
+        while pos < len(buf) and buf[pos] in " \t\r\n":
+            pos += 1
+        self._pos = pos
+        return buf[pos] if pos < len(buf) else ""
+
+    def _value(self):
+        """ Next JSON value (a string or an array, which are closed, so never cut short); self if more input is needed """
+        try:
+            value, self._pos = self._JSON.raw_decode(self._buf, self._pos)
+        except json.JSONDecodeError:
+            return self
+        return value
+
+    def _points(self) -> list:
+        """ Complete points from the buffer, leaving the position on the "]" of the series if it was reached """
+
+        buf, pos = self._buf, self._pos
+        if end := self._END.search(buf, pos):
+            last = end.start()
+        elif (last := buf.rfind("]", pos)) < 0:
+            return []
+        try:
+            points = json.loads("[" + buf[pos:last + 1].lstrip(", \t\r\n") + "]")
+        except json.JSONDecodeError as e:
+            raise ErrorMetalDataConvert(f" [ERROR] Issue with JSON key from {self.site}: malformed chartData point: {e}")
+        self._pos = end.end() - 1 if end else last + 1
+        return points
+
+    def _parse(self) -> list:
+        points = []
+        while self._step < len(self.STEPS):
+            step = self.STEPS[self._step]
+
+            if step == '"chartData"':
+                i = self._buf.find(step, self._pos)
+                if i < 0:
+                    self._pos = max(self._pos, len(self._buf) - len(step) + 1)     # keep what could be the start of the key
+                    break
+                self._pos = i + len(step)
+            elif step == "key":
+                if not (c := self._char()):
+                    break
+                if c != '"':
+                    raise ErrorMetalDataConvert(f" [ERROR] Issue with JSON key from {self.site}: no currency in chartData")
+                if (key := self._value()) is self:
+                    break
+                self.key = key
+            elif step == "points":
+                # Points hold no brackets, so every "]" closes a point until two in a row close the series;
+                # the complete points in the buffer are decoded together.
+                if not (c := self._char()):
+                    break
+                if c == "]":
+                    self._pos += 1
+                elif batch := self._points():
+                    points += batch
+                    continue
+                else:
+                    break
+            else:
+                if not (c := self._char()):
+                    break
+                if c != step:
+                    raise ErrorMetalDataConvert(f" [ERROR] Issue with JSON key from {self.site}: expected {step!r} in chartData, found {c!r}")
+                self._pos += 1
+
+            self._step += 1
+
+        if self.done:
+            self._buf, self._pos = "", 0
+        return points
+
+
+""" Price providers queried by metal_price
+"""
+@dataclass
+class ProviderStats:
+    """ Running (exponentially weighted) measurements of a provider """
+
+    calls: int = 0
+    latency: float = None       # seconds
+    errorRate: float = 0.0      # 0 (never fails) to 1 (always fails)
+    freshness: float = None     # milliseconds between the target and the provider's nearest price
+    lastFailure: float = 0.0    # epoch seconds
+
+
+class Provider():
+    """ A source of metal prices. Subclass, implement fetch, and register an instance with REGISTRY.
+
+        Calling the provider fetches and records latency and failures in its stats.
+    """
+
+    name = None
+    live = False                # only quotes "now", whatever window is asked for
+    elements = ("au",)
 
-    return data
+    ALPHA = 0.3                 # weight of the newest measurement
+
+    def __init__(self):
+        self.stats = ProviderStats()
+        self._lock = threading.Lock()
+
+    def fetch(self, times, currency: str="USD", timeout: float=TIMEOUT) -> list:
+        """ Prices for the epoch range (start, end) in the currency.
+
+        Returns:
+            list: MetalPrice
+        """
+        raise NotImplementedError
+
+    def __call__(self, times, currency: str="USD", timeout: float=TIMEOUT) -> list:
+        start = time.perf_counter()
+        try:
+            with span(f"price api ({self.name})"):
+                prices = self.fetch(times, currency, timeout)
+        except Exception:
+            self._measure(time.perf_counter() - start, failed=True)
+            raise
+
+        self._measure(time.perf_counter() - start, failed=False)
+        return prices
+
+    def _measure(self, latency: float, failed: bool):
+        with self._lock:
+            s = self.stats
+            s.calls += 1
+            s.latency = latency if s.latency is None else (1 - self.ALPHA) * s.latency + self.ALPHA * latency
+            s.errorRate = (1 - self.ALPHA) * s.errorRate + self.ALPHA * failed
+            if failed:
+                s.lastFailure = time.time()
+
+    def measureFreshness(self, distance: float):
+        with self._lock:
+            s = self.stats
+            s.freshness = distance if s.freshness is None else (1 - self.ALPHA) * s.freshness + self.ALPHA * distance
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.name})"
+
+
+class GoldPriceOrg(Provider):
+    name = "goldprice.org"
+    live = True
+    elements = ("au", "ag")
+
+    def fetch(self, times, currency: str="USD", timeout: float=TIMEOUT) -> list:
+        return fetchGoldPriceNow(currency, timeout)
+
+
+class GoldOrg(Provider):
+    name = "gold.org"
+
+    def fetch(self, times, currency: str="USD", timeout: float=TIMEOUT) -> list:
+        return fetchGoldOrg(times[0], times[1], currency, timeout=timeout)
+
+
+class ProviderRegistry():
+    """ Registered providers, ranked by health, freshness and latency.
+
+        Strategies:
+            parallel    ask every provider at once and wait for all (or the deadline)
+            hedged      ask the best provider; only fire the next one if it is slower than
+                        usual (its typical latency times HEDGE_FACTOR) or fails
+    """
 
+    STRATEGIES = ("parallel", "hedged")
+    MAX_ERROR_RATE = 0.5        # providers failing more often are dropped...
+    COOLDOWN = 300              # ...until this many seconds after their last failure
+    MIN_CALLS = 3               # calls before a provider can be judged unhealthy
+    HEDGE_FACTOR = 2.0
+    HEDGE_DELAY = 1.0           # seconds, when the provider's latency is not known yet
+
+    def __init__(self, providers=(), strategy: str="parallel"):
+        self._providers = {}
+        self._enabled = {}
+        self.strategy = strategy
+        for provider in providers:
+            self.register(provider)
+
+    def register(self, provider: Provider, enabled: bool=True):
+        self._providers[provider.name] = provider
+        self._enabled[provider.name] = enabled
+
+    def enable(self, name: str, enabled: bool=True):
+        if name not in self._providers:
+            raise ValueError(f"Unknown price provider: {name}")
+        self._enabled[name] = enabled
+
+    def get(self, name: str) -> Provider:
+        return self._providers[name]
+
+    @property
+    def names(self) -> list:
+        return list(self._providers)
+
+    def healthy(self, provider: Provider) -> bool:
+        s = provider.stats
+        return s.calls < self.MIN_CALLS or s.errorRate <= self.MAX_ERROR_RATE or time.time() - s.lastFailure > self.COOLDOWN
+
+    def ranked(self, element: str="au") -> list:
+        """ Enabled providers of the element, best first; unhealthy ones are dropped (unless none are healthy). """
+
+        candidates = [ p for name, p in self._providers.items() if self._enabled[name] and element in p.elements ]
+        healthy = [ p for p in candidates if self.healthy(p) ] or candidates
+        return sorted(healthy, key=lambda p: (p.stats.errorRate > self.MAX_ERROR_RATE / 2,
+                                              (p.stats.freshness or 0) > TOLERANCE,
+                                              p.stats.latency or 0))
+
+    def fetch(self, providers: list, times, currency: str="USD", timeout: float=TIMEOUT, deadline: float=DEADLINE, strategy: str=None) -> dict:
+        """ Fetch from the providers with the strategy (defaults to the registry's).
+
+        Returns:
+            dict: {provider: list of MetalPrice}
+        """
+
+        if (strategy or self.strategy) == "hedged":
+            return self.fetchHedged(providers, times, currency, timeout, deadline)
+        return fetchAll(providers, times, currency, timeout, deadline)
+
+    def fetchHedged(self, providers: list, times, currency: str="USD", timeout: float=TIMEOUT, deadline: float=DEADLINE) -> dict:
+        """ Ask providers in order, firing the next only when the current one is slow or fails.
+
+        Returns:
+            dict: {provider: list of MetalPrice} with the first provider(s) to answer with prices
+        """
+
+        errors = _fetchErrors()
+        stop = time.perf_counter() + deadline
+        queue, futures, results = list(providers), {}, {}
+
+        while (queue or futures) and not results and (remaining := stop - time.perf_counter()) > 0:
+            if queue:
+                provider = queue.pop(0)
+                futures[background(provider, times, currency, timeout)] = provider
+                latency = provider.stats.latency
+                patience = min(latency * self.HEDGE_FACTOR if latency else self.HEDGE_DELAY, remaining) if queue else remaining
+            else:
+                patience = remaining
+
+            done, _ = wait(futures, timeout=patience, return_when=FIRST_COMPLETED)
+            for future in done:
+                provider = futures.pop(future)
+                try:
+                    if prices := future.result():
+                        results[provider] = prices
+                except errors as e:
+                    print(f' [WARN] Skipping "{provider.name}": {e}')
+
+        return results
+
+
+REGISTRY = ProviderRegistry([GoldPriceOrg(), GoldOrg()]) # And any other additional API calls
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+
+""" Background prefetcher: store gold prices around the upcoming fiscal moments as they happen.
+
+    Around each fiscal moment (e.g., sunset on 04-20 at every configured location) the
+    current price is polled throughout the window metal_price searches, and once the window
+    has closed the full chart for it is fetched. Everything goes into the price history, so
+    later calculations for that moment read local data instead of racing the APIs.
+"""
+
+# Standard library
+import datetime
+import sched
+import sys
+from time import sleep, time as epochNow
+
+# 3rd Party Library
+from .history import PriceHistory
+from .metal import fetchGoldOrg, fetchGoldPriceNow, TOLERANCE
+from . import spacetime as st
+
+
+WINDOW = datetime.timedelta(milliseconds=TOLERANCE)    # either side of the moment, as searched by metal_price
+SETTLE = datetime.timedelta(minutes=15)                # wait for the chart data to be published after the window
+
+def fiscalMoment(date: str, time: str, year: int, address: str=None, lat=32.943608, lon=35.091979) -> datetime.datetime:
+    """ Fiscal date and time in the given year (same convention as spacetime.fiscalTarget).
+
+    Args:
+        date (str): fiscal date "MM-DD"
+        time (str): period of the sun (e.g., sunset) or "HH:MM" (24-hour)
+        year (int): year of the moment
+        address (str, optional): city, state, and country if no latitude/longitude provided
+        lat (float): latitude
+        lon (float): longitude
+
+    Raises:
+        ValueError: date or time is relative ("today", "now") and cannot be scheduled
+
+    Returns:
+        datetime: moment (local, naive)
+    """
+
+    if date.lower() == "today" or time.lower().strip() == "now":
+        raise ValueError("Fiscal date and time must be fixed (not \"today\" or \"now\") to be scheduled.")
+
+    day = datetime.datetime.strptime(f"{year}-{date}", "%Y-%m-%d").date()
+    if (period:= time.lower().strip()) in st.getSunPeriodTerms():
+        return datetime.datetime.combine(day, st.getSolarTime(address, lat, lon, period, day).time())
+
+    return datetime.datetime.combine(day, datetime.datetime.strptime(time, "%H:%M").time())
+
+
+def upcomingFiscalMoments(date: str, time: str, locations: list, after: datetime.datetime=None) -> list:
+    """ Next fiscal moment for every location whose window has not closed yet.
+
+    Args:
+        date (str): fiscal date "MM-DD"
+        time (str): period of the sun or "HH:MM"
+        locations (list): dicts with latitude, longitude (and optionally address, name)
+        after (datetime, optional): defaults to now
+
+    Returns:
+        list: (moment, location) tuples, soonest first
+    """
+
+    after = after or datetime.datetime.now()
+    moments = []
+    for loc in locations:
+        for year in (after.year, after.year + 1):
+            moment = fiscalMoment(date, time, year, loc.get('address'), loc['latitude'], loc['longitude'])
+            if moment + WINDOW > after:
+                moments.append((moment, loc))
+                break
+
+    return sorted(moments, key=lambda m: m[0])
+
+
+class Prefetcher():
+    """ Schedules the polls and chart fetches for upcoming fiscal moments.
+    """
+
+    def __init__(self, date: str, time: str, locations: list, currencies=("USD",), history: PriceHistory=None,
+                 interval: float=300, forever: bool=True, fetchNow=fetchGoldPriceNow, fetchRange=fetchGoldOrg):
+        self.date, self.time = date, time
+        self.locations = locations
+        self.currencies = [ c.upper() for c in currencies ]
+        self.history = history if history is not None else PriceHistory()
+        self.interval = datetime.timedelta(seconds=interval)
+        self.forever = forever
+        self.fetchNow, self.fetchRange = fetchNow, fetchRange
+
+        self.scheduler = sched.scheduler(epochNow, sleep)
+
+    def plan(self, after: datetime.datetime=None) -> list:
+        """ Schedule every upcoming moment.
+
+        Returns:
+            list: (moment, location) tuples that were scheduled
+        """
+
+        moments = upcomingFiscalMoments(self.date, self.time, self.locations, after)
+        for moment, loc in moments:
+            self.schedule(moment, loc, after)
+        return moments
+
+    def schedule(self, moment: datetime.datetime, loc: dict, after: datetime.datetime=None):
+        now = after or datetime.datetime.now()
+        poll = max(moment - WINDOW, now)
+        while poll <= moment + WINDOW:
+            self.scheduler.enterabs(poll.timestamp(), 1, self.poll, (moment,))
+            poll += self.interval
+
+        self.scheduler.enterabs((moment + WINDOW + SETTLE).timestamp(), 0, self.settle, (moment, loc))
+
+    def poll(self, moment: datetime.datetime):
+        """ Store the current price while the window is open. """
+        for curr in self.currencies:
+            self._store(lambda: self.fetchNow(curr), f"current {curr} price near {moment}")
+
+    def settle(self, moment: datetime.datetime, loc: dict):
+        """ Store the full chart for the window once it has closed, then schedule next year's moment. """
+        start, end = st.datetimeToEpoch(moment - WINDOW), st.datetimeToEpoch(moment + WINDOW)
+        for curr in self.currencies:
+            self._store(lambda: self.fetchRange(start, end, curr), f"{curr} chart around {moment}")
+
+        if self.forever:
+            nextMoment = fiscalMoment(self.date, self.time, moment.year + 1, loc.get('address'), loc['latitude'], loc['longitude'])
+            self.schedule(nextMoment, loc)
+            print(f"Next prefetch for {loc.get('name', 'location')}: {nextMoment}")
+
+    def _store(self, fetch, label: str):
+        try:
+            stored = self.history.add(fetch())
+            print(f"Stored {stored} price(s): {label}")
+        except Exception as e:
+            # A failed fetch must not stop the scheduler; the next poll tries again
+            print(f"[WARN] Unable to prefetch {label}: {e}", file=sys.stderr)
+
+    def run(self):
+        """ Block, running the schedule until it is empty (never, when forever is set). """
+        self.scheduler.run()
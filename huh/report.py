@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+
+""" Summaries of the record files (CSV or ledger), streamed a record at a time so their size does not matter.
+"""
+
+# Standard library
+import csv
+from itertools import chain
+import sys
+
+# 3rd Party Library
+from .ledger import COLUMNS, Ledger, isLedger
+
+
+GROUPS = {
+    'year': lambda r, c: r[c][:4],
+    'month': lambda r, c: r[c][:7],
+    'day': lambda r, c: r[c][:10],
+    'currency': lambda r, c: r['currency'],
+    'source': lambda r, c: r['source'],
+    'weight': lambda r, c: r['weight'],
+}
+FIELDS = ["count", "wealth", "payable", "min gold price", "max gold price"]
+_LAST = "￿"    # sorts after any date, so an end date includes everything on (or within) it
+
+def readRecords(file, start: str=None, end: str=None, column: str="recorded"):
+    """ Stream the records of one file, filtered on the date column where the file is indexed.
+
+    Yields:
+        dict: record with the COLUMNS keys
+    """
+
+    if isLedger(file):
+        ledger = Ledger(file)
+        try:
+            for row in ledger.rows(start, end and end + _LAST, column):
+                yield dict(zip(COLUMNS, ( "" if v is None else str(v) for v in row )))
+        finally:
+            ledger.close()
+        return
+
+    with open(file, newline="") as csvfile:
+        for n, row in enumerate(csv.reader(csvfile), 1):
+            if len(row) != len(COLUMNS):
+                if row and not row[0].startswith("recorded"):
+                    print(f"[WARN] {file} line {n}: expected {len(COLUMNS)} fields, found {len(row)}; skipped.", file=sys.stderr)
+                continue
+            yield dict(zip(COLUMNS, row))
+
+
+def between(records, start: str=None, end: str=None, column: str="recorded"):
+    """ Keep records with the date column from start up to and including end (e.g., "2024" or "2024-04-20"). """
+    for r in records:
+        if (not start or r[column] >= start) and (not end or r[column][:len(end)] <= end):
+            yield r
+
+
+def aggregate(records, by=("year", "currency"), column: str="recorded") -> dict:
+    """ Group the records and fold each into its group's totals; memory grows with the groups, not the records.
+
+    Args:
+        records (iterable): dicts from readRecords
+        by (tuple): names from GROUPS
+        column (str): date column that year/month/day are taken from ("recorded" or "target")
+
+    Returns:
+        dict: group key (tuple) -> dict with the FIELDS keys
+    """
+
+    keys = [ GROUPS[g] for g in by ]
+    groups = {}
+    for r in records:
+        try:
+            price, wealth, payable = float(r['price']), float(r['wealth']), float(r['payable'])
+        except ValueError:
+            continue
+
+        key = tuple(k(r, column) for k in keys)
+        if (g := groups.get(key)) is None:
+            groups[key] = { "count": 1, "wealth": wealth, "payable": payable, "min gold price": price, "max gold price": price }
+        else:
+            g["count"] += 1
+            g["wealth"] += wealth
+            g["payable"] += payable
+            g["min gold price"] = min(g["min gold price"], price)
+            g["max gold price"] = max(g["max gold price"], price)
+
+    return groups
+
+
+def report(files, by=("year", "currency"), start: str=None, end: str=None, column: str="recorded") -> dict:
+    """ Summarize every record in the files between the dates.
+
+    Args:
+        files (list): record files (CSV, or ledgers ending in .db/.sqlite/.sqlite3)
+        by (tuple): names from GROUPS
+        start (str, optional): first date (inclusive), e.g. "2023-01-01"
+        end (str, optional): last date or prefix (inclusive), e.g. "2024"
+        column (str): date column to filter and group on ("recorded" or "target")
+
+    Raises:
+        ValueError: unknown group or column
+
+    Returns:
+        dict: group key (tuple) -> dict with the FIELDS keys
+    """
+
+    if unknown := [ g for g in by if g not in GROUPS ]:
+        raise ValueError(f"Unknown group: {', '.join(unknown)} (choose from {', '.join(GROUPS)})")
+    if column not in ("recorded", "target"):
+        raise ValueError(f"Can only filter on recorded or target, not: {column}")
+
+    records = chain.from_iterable(readRecords(f, start, end, column) for f in files)
+    return aggregate(between(records, start, end, column), by, column)
+
+
+def writeReport(groups: dict, by, file=None):
+    """ Write the groups as CSV, sorted by group; stdout if no file. """
+
+    out = open(file, 'w', newline="") if file else sys.stdout
+    try:
+        csvwriter = csv.writer(out)
+        csvwriter.writerow(list(by) + FIELDS)
+        for key in sorted(groups):
+            g = groups[key]
+            csvwriter.writerow(list(key) + [g["count"]] + [ f'{round(g[f], 2):.2f}' for f in FIELDS[1:] ])
+    finally:
+        if file:
+            out.close()
@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+
+""" Long-running HTTP/JSON service around Huququllah and metal_price.
+
+    Configuration, price cache, price history, timezone data and HTTP sessions are loaded
+    once and stay warm, so repeat calculations skip the cold start of a new process.
+
+    Endpoints (GET, parameters in the query string):
+        /huquq   wealth (required), currency, date, time, price & weight (user price), basic
+        /price   currency, date, time
+        /health
+"""
+
+# Standard library
+from dataclasses import asdict
+import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import math
+import threading
+from urllib.parse import urlsplit, parse_qs
+
+# 3rd Party Library
+from .cache import PriceCache
+from .huquq import Huququllah
+from .metal import metal_price, MetalPrice, TOLERANCE
+from . import spacetime as st
+
+
+class Service():
+    """ Calculations with fiscal times and gold prices memoized in memory.
+
+        Prices for past targets are kept for the life of the service; prices for targets
+        close to now are kept for the cache time-to-live.
+    """
+
+    def __init__(self, date: str="04-20", time: str="sunset", address: str=None, lat=32.943608, lon=35.091979,
+                 currency: str="USD", cache=None, history=None, ttl: float=PriceCache.LIVE_TTL):
+        self.date, self.time = date, time
+        self.address, self.lat, self.lon = address, lat, lon
+        self.currency = currency
+        self.cache, self.history = cache, history
+        self.ttl = ttl
+
+        self._lock = threading.Lock()
+        self._targets = {}
+        self._prices = {}
+
+    def target(self, date: str=None, time: str=None) -> datetime.datetime:
+        """ Fiscal date and time; memoized per day since "today" and the fiscal year move with it. """
+
+        date, time = date or self.date, time or self.time
+        if time.lower().strip() == 'now':
+            return datetime.datetime.now()
+
+        key = (datetime.date.today(), date, time)
+        with self._lock:
+            if key in self._targets:
+                return self._targets[key]
+
+        target = st.fiscalTarget(date, time, self.address, self.lat, self.lon)
+        with self._lock:
+            self._targets[key] = target
+        return target
+
+    def price(self, target: datetime.datetime, currency: str=None) -> MetalPrice:
+        """ Gold price nearest the target, from memory when still fresh. """
+
+        currency = (currency or self.currency).upper()
+        now = datetime.datetime.now()
+        key = (target, currency)
+
+        with self._lock:
+            expires, m = self._prices.get(key, (None, None))
+        if m and (expires is None or expires > now):
+            return m
+
+        m = metal_price(target, currency, cache=self.cache, history=self.history)
+        if m:
+            past = st.datetimeToEpoch(target) + TOLERANCE < st.datetimeToEpoch(now)
+            with self._lock:
+                self._prices[key] = (None if past else now + datetime.timedelta(seconds=self.ttl), m)
+        return m
+
+    def huquq(self, params: dict) -> dict:
+        """ Calculate Ḥuqúqu'lláh for the request parameters.
+
+        Raises:
+            ValueError: missing or invalid parameter
+            LookupError: no gold price could be obtained
+
+        Returns:
+            dict: calculation and the gold price used
+        """
+
+        if 'wealth' not in params:
+            raise ValueError("Missing parameter: wealth")
+
+        currency = (params.get('currency') or self.currency).upper()
+        basic = _positive(params, 'basic') if params.get('basic') else None
+        if params.get('price'):
+            m = MetalPrice(_positive(params, 'price'), currency=currency, weight=params.get('weight', "toz").lower(), source="user")
+        else:
+            m = self.priceInfo(params, currency)
+
+        huq = Huququllah(float(params['wealth']), m.price, m.weight, m.currency)
+        if basic:
+            huq.basic = basic
+            huq._remainder()
+            huq._payable()
+
+        return {
+            "wealth": huq.wealth,
+            "currency": m.currency,
+            "basic": huq.basic,
+            "remainder": huq.remainder,
+            "payable": huq.payable,
+            "units": huq.wealth // huq.basic,
+            "gold price": asdict(m),
+        }
+
+    def priceInfo(self, params: dict, currency: str=None) -> MetalPrice:
+        m = self.price(self.target(params.get('date'), params.get('time')), currency or params.get('currency'))
+        if not m:
+            raise LookupError("Unable to obtain gold price.")
+        return m
+
+
+def _positive(params: dict, name: str) -> float:
+    """ Parameter as a finite number above zero.
+
+    Raises:
+        ValueError: not a number, or not above zero
+    """
+
+    value = float(params[name])
+    if not (0 < value < math.inf):
+        raise ValueError(f"Parameter {name} must be a number above zero: {params[name]}")
+    return value
+
+
+class Handler(BaseHTTPRequestHandler):
+    """ Routes requests to the Service of the server. """
+
+    protocol_version = "HTTP/1.1"
+    wbufsize = -1   # headers and body in one send; written separately, keep-alive clients wait out delayed ACKs (~40 ms)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        params = { k: v[-1] for k, v in parse_qs(url.query).items() }
+        service = self.server.service
+
+        try:
+            if url.path == "/huquq":
+                self._send(200, service.huquq(params))
+            elif url.path == "/price":
+                self._send(200, asdict(service.priceInfo(params)))
+            elif url.path == "/health":
+                self._send(200, {"status": "ok"})
+            else:
+                self._send(404, {"error": f"Unknown path: {url.path}"})
+        except ValueError as e:
+            self._send(400, {"error": str(e)})
+        except LookupError as e:
+            self._send(502, {"error": str(e)})
+        except (Exception, SystemExit) as e:
+            # Library code below still exits on some errors; answer instead of dropping the connection
+            self._send(500, {"error": f"{type(e).__name__}: {e}"})
+
+    def _send(self, status: int, body: dict):
+        data = json.dumps(body, default=str).encode()
+        self.send_response(status)
+        self.send_header("content-type", "application/json")
+        self.send_header("content-length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+def serve(service: Service, host: str="127.0.0.1", port: int=8019) -> ThreadingHTTPServer:
+    """ Create the server; each request is handled on its own thread.
+
+    Args:
+        service (Service): calculations to serve
+        host (str): address to listen on
+        port (int): port to listen on (0 picks a free port)
+
+    Returns:
+        ThreadingHTTPServer: call serve_forever() to start handling requests
+    """
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    server.service = service
+    return server
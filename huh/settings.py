@@ -111,28 +111,143 @@ class MetalPriceAction(argparse.Action):
 
         setattr(namespace, self.dest, values)
 
-def arguments():
+def _parser(describe: str, command: str=None) -> argparse.ArgumentParser:
     lic = f"""{__title__}  {__copyright__}  {", ".join(__author__)}.
                 This Source Code Form is subject to the terms of the Mozilla Public
                 License, v. 2.0. If a copy of the MPL was not distributed with this
                 file, You can obtain one at http://mozilla.org/MPL/2.0/."""
 
+    prog = 'python -m huh' if "__main__" in sys.argv[0] else Path(sys.argv[0]).name
+    if command:
+        prog = f"{prog} {command}"
+
+    return argparse.ArgumentParser(prog=prog, description=describe, epilog=lic)
+
+def arguments():
     describe = f'Help calculate the voluntary tax {HuququLabels.huquq_diacritic_upper} ("Right of God") by retrieving the price of gold and performing required operations. The program will output the gold price and any payable amount of {HuququLabels.huquq_diacritic_upper}.'
-    
-    if "__main__" in sys.argv[0]:
-        parser = argparse.ArgumentParser(prog='python -m huh', description=describe, epilog=lic)
-    else:
-        parser = argparse.ArgumentParser(description=describe, epilog=lic)
+    parser = _parser(describe)
 
-    parser.add_argument('amount', type=float, help=f'Amount of wealth or capital (after debts and expenses) to have {HuququLabels.huquq.capitalize()} calculated on.')
+    parser.add_argument('amount', type=float, nargs='?', default=None, help=f'Amount of wealth or capital (after debts and expenses) to have {HuququLabels.huquq.capitalize()} calculated on.')
+    parser.add_argument('-B', '--batch', type=str, default=None, help=f'Calculate every row of a CSV/JSONL file (columns: wealth, and optionally currency, date, time, latitude, longitude, city, state, country); results are written to --output or printed.')
     parser.add_argument('-b', '--basic', type=float, default=None, help=f'User can provide the basic unit equal to 19 {HuququLabels.mithqal}.')
     parser.add_argument('-c', '--curr', type=str, default=None, help=f'Convert currency (overrides configuration file).')
     parser.add_argument('-d', '--detail', action='store_true', help=f'Detailed information printed such as 19 {HuququLabels.mithqal} equivalent, remainder, dates & times of gold prices, etc.')
+    parser.add_argument('-e', '--exact', action='store_true', help=f'Calculate in exact decimal arithmetic instead of binary floating point (amounts are rounded to the cent only when shown).')
     parser.add_argument('-f', '--filename', type=str, default=None, help=f'Provide path and filename to configuration file.')
     parser.add_argument('-o', '--output', type=str, default=None, help=f'Record data from run in a CSV file; provide path and filename.')
+    parser.add_argument('-n', '--no-cache', action='store_true', help=f'Always fetch gold prices from the network instead of the local price cache.')
     parser.add_argument('-p', '--price', type=str, action=MetalPriceAction, default=None, help="User can provide the gold price in this exact format: '[currency],[price],[weight]'.")
+    parser.add_argument('-t', '--timings', type=str, nargs='?', const="text", choices=("text", "json"), default=None, help=f'Print how long each stage took (geocoding, timezone, solar time, price APIs, record, ...) to stderr, as a table or JSON.')
+    parser.add_argument('--profile', type=str, default=None, help=f'Write a cProfile dump of the run to this file (view with "python -m pstats FILE").')
+
+    args = parser.parse_args()
+    if args.amount is None and not args.batch:
+        parser.error("the following arguments are required: amount (or --batch)")
+
+    return args
+
+def exportRecordArguments(argv=None):
+    parser = _parser('Export the records of a ledger (record file ending in .db, .sqlite or .sqlite3) to a CSV file in the record file layout.', 'export-record')
+
+    parser.add_argument('ledger', type=str, help='Ledger file to export.')
+    parser.add_argument('-o', '--output', type=str, default="huququllah_record.csv", help='CSV file to write.')
+
+    return parser.parse_args(argv)
+
+def importPricesArguments(argv=None):
+    parser = _parser('Bulk import historical gold prices (gold.org chart JSON, or CSV with timestamp and price columns) into the local price history, which is checked before any API call.', 'import-prices')
+
+    parser.add_argument('files', type=str, nargs='+', help='JSON or CSV files to import.')
+    parser.add_argument('-c', '--curr', type=str, default=None, help='Only import this currency (JSON), or currency of rows without one (CSV).')
+    parser.add_argument('-w', '--weight', type=str, default="oz", help='Weight unit of the prices.')
+    parser.add_argument('--history', type=str, default=None, help='Price history file (defaults to the one in the user cache directory).')
+
+    return parser.parse_args(argv)
+
+def importRatesArguments(argv=None):
+    parser = _parser('Bulk import exchange rates (JSON as returned by the rate provider, or CSV with base, quote, timestamp and rate columns) into the local rate table used to convert gold prices.', 'import-rates')
+
+    parser.add_argument('files', type=str, nargs='+', help='JSON or CSV files to import.')
+    parser.add_argument('--rates', type=str, default=None, help='Rate table file (defaults to the one in the user cache directory).')
+
+    return parser.parse_args(argv)
+
+def backfillArguments(argv=None):
+    parser = _parser(f'Calculate {HuququLabels.huquq_diacritic_upper} for every fiscal year in a range at every location, in one run: fiscal times are computed in parallel processes and each distinct price window is fetched once.', 'backfill')
+    thisYear = datetime.now().year
+
+    parser.add_argument('--from-year', type=int, default=2010, help='First fiscal year.')
+    parser.add_argument('--to-year', type=int, default=thisYear, help='Last fiscal year.')
+    parser.add_argument('-l', '--locations', type=str, default=None, help='CSV file of locations (columns: latitude, longitude and/or city, state, country, and optionally name); defaults to the configured location.')
+    parser.add_argument('-a', '--amount', type=float, default=None, help='Wealth of every year and location.')
+    parser.add_argument('-w', '--wealth', type=str, default=None, help='CSV file of wealth per year (columns: year, wealth, and optionally location).')
+    parser.add_argument('-c', '--curr', type=str, default=None, help='Currency (overrides configuration file).')
+    parser.add_argument('-e', '--exact', action='store_true', help='Calculate in exact decimal arithmetic.')
+    parser.add_argument('-f', '--filename', type=str, default=None, help='Provide path and filename to configuration file.')
+    parser.add_argument('-j', '--workers', type=int, default=8, help='Threads resolving gold prices.')
+    parser.add_argument('--processes', type=int, default=None, help='Processes computing solar times (defaults to one per CPU; 0 computes them in this process, e.g., with a solar table).')
+    parser.add_argument('-n', '--no-cache', action='store_true', help='Do not use the local price cache and history.')
+    parser.add_argument('-o', '--output', type=str, default=None, help='Write the results to a CSV (or .jsonl) file instead of printing them.')
+
+    return parser.parse_args(argv)
+
+def prefetchArguments(argv=None):
+    parser = _parser('Compute the upcoming fiscal moments for every location and store gold prices around them as they happen, so later calculations read local data instead of the APIs. Runs until stopped.', 'prefetch')
+
+    parser.add_argument('-c', '--curr', type=str, default=None, help='Comma separated currencies to prefetch (defaults to the configured currency).')
+    parser.add_argument('-f', '--filename', type=str, default=None, help='Provide path and filename to configuration file.')
+    parser.add_argument('-i', '--interval', type=float, default=300, help='Seconds between price polls while a window is open.')
+    parser.add_argument('-l', '--locations', type=str, default=None, help='CSV file of locations (columns: latitude, longitude and/or city, state, country); defaults to the configured location.')
+    parser.add_argument('--list', action='store_true', help='Only list the upcoming fiscal moments.')
+
+    args = parser.parse_args(argv)
+    args.no_cache = False
+    return args
+
+def reportArguments(argv=None):
+    parser = _parser('Summarize record files (CSV or ledger) by group: count, total wealth, total payable, and lowest and highest gold price. Records are streamed, so files of any size can be summarized.', 'report')
+
+    parser.add_argument('files', type=str, nargs='+', help='Record files to summarize.')
+    parser.add_argument('--by', type=str, default="year,currency", help='Comma separated groups: year, month, day, currency, source, weight.')
+    parser.add_argument('--from', dest='start', type=str, default=None, help='First date to include (e.g., 2023 or 2023-04-20).')
+    parser.add_argument('--to', dest='end', type=str, default=None, help='Last date to include (e.g., 2024 or 2024-04-20).')
+    parser.add_argument('--on', type=str, choices=("recorded", "target"), default="recorded", help='Date to filter and group on: when the record was made or the fiscal target time.')
+    parser.add_argument('-o', '--output', type=str, default=None, help='Write the summary to a CSV file instead of printing it.')
+
+    return parser.parse_args(argv)
+
+def serveArguments(argv=None):
+    parser = _parser(f'Serve {HuququLabels.huquq_diacritic_upper} calculations and gold prices over HTTP/JSON, keeping the configuration, caches and connections warm between requests. Endpoints: /huquq?wealth=..., /price, /health.', 'serve')
+
+    parser.add_argument('--host', type=str, default="127.0.0.1", help='Address to listen on.')
+    parser.add_argument('--port', type=int, default=8019, help='Port to listen on (0 picks a free port).')
+    parser.add_argument('-c', '--curr', type=str, default=None, help='Default currency (overrides configuration file).')
+    parser.add_argument('-f', '--filename', type=str, default=None, help='Provide path and filename to configuration file.')
+    parser.add_argument('-n', '--no-cache', action='store_true', help='Do not use the local price cache and history.')
+
+    return parser.parse_args(argv)
+
+def sweepArguments(argv=None):
+    parser = _parser(f'Calculate {HuququLabels.huquq_diacritic_upper} over a grid of wealth and gold prices in one pass, and list exactly where the number of units (19 {HuququLabels.mithqal} of gold) goes up.', 'sweep')
+
+    parser.add_argument('--wealth', type=str, required=True, help='Wealth values as start:stop:step (stop included), or a single value.')
+    parser.add_argument('--price', type=str, required=True, help='Gold prices as start:stop:step (stop included), or a single value.')
+    parser.add_argument('--weight', type=str, default="toz", help='Weight unit of the gold prices (toz or g).')
+    parser.add_argument('-o', '--output', type=str, default=None, help='Write the grid to a CSV or .npy file instead of printing it.')
+    parser.add_argument('--breakpoints', action='store_true', help='Print the unit breakpoints (wealth for each price, and price for each wealth) instead of the grid.')
+
+    return parser.parse_args(argv)
+
+def solarTableArguments(argv=None):
+    parser = _parser('Precompute dawn, sunrise, noon, sunset and dusk for locations and years into a table file that fiscal-time lookups read instead of recomputing (set "solartable" under CACHE in the configuration file).', 'solar-table')
+
+    thisYear = datetime.now().year
+    parser.add_argument('locations', type=str, help='CSV file of locations (columns: latitude, longitude and/or city, state, country).')
+    parser.add_argument('--from-year', type=int, default=thisYear - 1, help='First year in the table.')
+    parser.add_argument('--to-year', type=int, default=thisYear + 1, help='Last year in the table.')
+    parser.add_argument('-o', '--output', type=str, default="solar.table", help='Table file to write.')
 
-    return parser.parse_args()
+    return parser.parse_args(argv)
 
 
 
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+
+""" Precomputed solar event tables, so fiscal times can be looked up instead of recomputed.
+
+    File layout (little-endian):
+        header      b"HUHSOLAR", version (H), locations (H), first year (H), years (H)
+        locations   latitude (d), longitude (d), timezone name (32s) for each location
+        events      for each location, each day from January 1 of the first year, and each
+                    period in SUN_PERIODS: microseconds since the epoch (q), or MISSING when
+                    the sun does not reach that position (e.g., polar summer)
+"""
+
+# Standard library
+import datetime
+import mmap
+import struct
+from zoneinfo import ZoneInfo
+
+# 3rd Party Library
+from .spacetime import SUN_PERIODS, timezoneAt
+
+
+MAGIC = b"HUHSOLAR"
+VERSION = 1
+MISSING = -2**63
+
+_HEADER = struct.Struct("<8sHHHH")
+_LOCATION = struct.Struct("<dd32s")
+_EVENTS = struct.Struct(f"<{len(SUN_PERIODS)}q")
+_EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+_MICROSECOND = datetime.timedelta(microseconds=1)
+
+
+def _days(firstYear: int, years: int) -> int:
+    return (datetime.date(firstYear + years, 1, 1) - datetime.date(firstYear, 1, 1)).days
+
+
+def generateSolarTable(file, locations, firstYear: int, lastYear: int) -> int:
+    """ Compute every solar event for the locations and years, and write them to a table file.
+
+    Args:
+        file (str, Path): table file to write
+        locations (list): (latitude, longitude) pairs
+        firstYear (int): first year covered
+        lastYear (int): last year covered (inclusive)
+
+    Returns:
+        int: number of days written for each location
+    """
+
+    from astral import Observer, sun
+
+    years = lastYear - firstYear + 1
+    days = _days(firstYear, years)
+    start = datetime.date(firstYear, 1, 1)
+
+    with open(file, 'wb') as f:
+        f.write(_HEADER.pack(MAGIC, VERSION, len(locations), firstYear, years))
+
+        zones = []
+        for lat, lon in locations:
+            zones.append(tz := timezoneAt(float(lat), float(lon)))
+            f.write(_LOCATION.pack(float(lat), float(lon), tz.encode()))
+
+        for (lat, lon), tz in zip(locations, zones):
+            observer = Observer(float(lat), float(lon))
+            for day in range(days):
+                date = start + datetime.timedelta(days=day)
+                events = []
+                for period in SUN_PERIODS:
+                    try:
+                        at = getattr(sun, period)(observer, date=date, tzinfo=tz)
+                        events.append((at - _EPOCH) // _MICROSECOND)
+                    except ValueError:
+                        events.append(MISSING)
+                f.write(_EVENTS.pack(*events))
+
+    return days
+
+
+class SolarTable():
+    """ Memory-mapped, read-only view of a table written by generateSolarTable.
+    """
+
+    def __init__(self, file):
+        self.file = file
+        with open(file, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, count, self.firstYear, self.years = _HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"Not a solar table (or unsupported version): {file}")
+
+        self.days = _days(self.firstYear, self.years)
+        self._start = datetime.date(self.firstYear, 1, 1)
+        self._locations, self._zones = {}, []
+        for i in range(count):
+            lat, lon, tz = _LOCATION.unpack_from(self._map, _HEADER.size + i * _LOCATION.size)
+            self._locations[(round(lat, 6), round(lon, 6))] = i
+            self._zones.append(ZoneInfo(tz.rstrip(b"\0").decode()))
+
+        self._data = _HEADER.size + count * _LOCATION.size
+
+    def covers(self, lat: float, lon: float, date: datetime.date) -> bool:
+        return (round(lat, 6), round(lon, 6)) in self._locations and 0 <= (date - self._start).days < self.days
+
+    def lookup(self, lat: float, lon: float, date: datetime.date, period: str):
+        """ Time of the solar event, or None when the table does not cover the request.
+
+        Raises:
+            ValueError: the sun does not reach that position on that date
+
+        Returns:
+            datetime: time of the event in the location's timezone
+        """
+
+        if not self.covers(lat, lon, date) or period not in SUN_PERIODS:
+            return None
+
+        i = self._locations[(round(lat, 6), round(lon, 6))]
+        offset = self._data + ((i * self.days + (date - self._start).days) * len(SUN_PERIODS) + SUN_PERIODS.index(period)) * 8
+        (value,) = struct.unpack_from("<q", self._map, offset)
+
+        if value == MISSING:
+            raise ValueError(f"The sun never reaches {period} on {date} at ({lat}, {lon}).")
+        return (_EPOCH + value * _MICROSECOND).astimezone(self._zones[i])
+
+    def close(self):
+        self._map.close()
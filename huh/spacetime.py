@@ -4,19 +4,75 @@
 """
 
 # Standard library
+import csv
 import datetime
+import os
+from functools import lru_cache
 import re
 import sys
 from typing import List
 
-# 3rd Party Library
-from astral import Observer, sun
-from geopy.geocoders import Nominatim
-from timezonefinder import TimezoneFinder
+# 3rd Party Library (astral, geopy, timezonefinder) is imported where used, so that runs
+# that never touch the sun or an address do not pay for loading it.
+from .timing import span, timed
+
+USER_AGENT = "mind-your-own-beeswax"    # Nominatim asks every application to identify itself
+SUN_PERIODS = ('dawn', 'sunrise', 'noon', 'sunset', 'dusk')    # same order as astral.sun.sun
+
+_geocodeCache, _gazetteer = None, None
+
+def setGeocodeCache(cache, gazetteer=None):
+    """ Resolve addresses locally before asking Nominatim.
+
+    Args:
+        cache (KeyValueCache): addresses geocoded by earlier runs, or None
+        gazetteer (KeyValueCache, optional): places loaded with importGazetteer; checked first
+    """
+
+    global _geocodeCache, _gazetteer
+    _geocodeCache, _gazetteer = cache, gazetteer
+
+
+def normalizeAddress(address: str) -> str:
+    """ Key for an address that ignores case, commas and extra spaces """
+    return " ".join(address.lower().replace(",", " ").split())
+
+
+def importGazetteer(file, gazetteer) -> int:
+    """ Load a CSV of places (columns: city, state, country, latitude, longitude) into the gazetteer.
+
+        Skipped when the same, unchanged file was already imported.
+
+    Args:
+        file (str, Path): CSV file
+        gazetteer (KeyValueCache): where places are kept
+
+    Returns:
+        int: number of places imported
+    """
+
+    stamp = [os.path.abspath(file), os.path.getmtime(file)]
+    if gazetteer.get("__source__") == stamp:
+        return 0
+
+    places = {}
+    with open(file, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            latlon = [float(row['latitude']), float(row['longitude'])]
+            places[normalizeAddress(f"{row['city']} {row.get('state') or ''} {row['country']}")] = latlon
+            places.setdefault(normalizeAddress(f"{row['city']} {row['country']}"), latlon)
+
+    places["__source__"] = stamp
+    gazetteer.putMany(places.items())
+    return len(places) - 1
+
 
 def addressToLatLong(address: str):
     """ Find the latitude and longitude when given an address.
 
+        The gazetteer and geocode cache (see setGeocodeCache) are checked before Nominatim,
+        and Nominatim's answer is cached for next time.
+
     Args:
         address (str): Address format: "city state country"
 
@@ -25,13 +81,17 @@ def addressToLatLong(address: str):
     """
 
     try:
-        if not re.fullmatch("([a-zA-Z.\- ]+) ([a-zA-Z.\- ]+) ([a-zA-Z.\- ]+)", address):
-            raise ValueError("No address provided or incorrect format address string: 'city state country'\n")
-            sys.exit(-1)
-        
-        geo = Nominatim(user_agent="mind-your-own-beeswax")
-        loc = geo.geocode(address)
-        return [loc.latitude, loc.longitude]
+        if hit := cachedLatLong(address):
+            return hit
+
+        with span("geocode (nominatim)"):
+            from geopy.geocoders import Nominatim
+            geo = Nominatim(user_agent=USER_AGENT)
+            loc = geo.geocode(address)
+        latlon = [loc.latitude, loc.longitude]
+
+        cacheLatLong(address, latlon)
+        return latlon
         
     except ValueError as e:
         print(e)
@@ -41,6 +101,32 @@ def addressToLatLong(address: str):
         sys.exit(1)
 
 
+def cachedLatLong(address: str):
+    """ Latitude and longitude of an address from the gazetteer or the geocode cache.
+
+    Raises:
+        ValueError: address is not in the format "city state country"
+
+    Returns:
+        list: [lat: float, lon: float], or None when the address is not known locally
+    """
+
+    if not address or not re.fullmatch(r"([a-zA-Z.\- ]+) ([a-zA-Z.\- ]+) ([a-zA-Z.\- ]+)", address):
+        raise ValueError("No address provided or incorrect format address string: 'city state country'\n")
+
+    key = normalizeAddress(address)
+    for cache in (_gazetteer, _geocodeCache):
+        if cache and (hit := cache.get(key)):
+            return hit
+    return None
+
+
+def cacheLatLong(address: str, latlon: list):
+    """ Remember a geocoded address in the geocode cache (if one is set) """
+    if _geocodeCache:
+        _geocodeCache.put(normalizeAddress(address), latlon)
+
+
 def getSunPeriodTerms() -> List[str]:
     """ Terminology that references the sun's position during different periods of the day.
 
@@ -48,13 +134,16 @@ def getSunPeriodTerms() -> List[str]:
         List[str]: different periods in the day
     """
 
-    options = (sun.sun(Observer(0, 0), date=datetime.date(1, 1, 1))).keys()
-    return [ opt for opt in options ]
+    return list(SUN_PERIODS)
 
 
-def getSolarTime(address: str=None, lat: float=32.943608, lon: float=35.091979, period: str='sunset', date: datetime=datetime.date.today()):
+def getSolarTime(address: str=None, lat: float=32.943608, lon: float=35.091979, period: str='sunset', date: datetime=None):
     """Calculates the time during the day when the sun is positioned at the specified period (e.g., noon).
 
+        Results are memoized per (lat, lon, date, period). A precomputed table (see
+        setSolarTable) is used when it covers the request, and results are kept on disk
+        too when a solar cache is set with setSolarCache.
+
     Args:
         lat (float): latitude
         lon (float): longitude
@@ -70,11 +159,75 @@ def getSolarTime(address: str=None, lat: float=32.943608, lon: float=35.091979,
         # print(">> lat, lon >>", lat, lon)
 
     try:
-        tz = TimezoneFinder().timezone_at(lat=float(lat), lng=float(lon))
-    except TypeError:
+        lat, lon = float(lat), float(lon)
+    except (TypeError, ValueError):
         print("Unable to cast latitude and longitude as float.")
+        sys.exit(1)
+
+    if date is None:
+        date = datetime.date.today()
+    elif isinstance(date, datetime.datetime):
+        date = date.date()
+
+    return _solarTime(lat, lon, date, period)
+
+
+_solarCache, _solarTable = None, None
+
+def setSolarTable(table):
+    """ Look up solar times in a precomputed table (see huh.solartable) when it covers the request.
 
-    s = sun.sun(Observer(lat, lon), date=date, tzinfo=tz)
+    Args:
+        table (SolarTable): memory-mapped table, or None to always compute
+    """
+
+    global _solarTable
+    _solarTable = table
+    _solarTime.cache_clear()        # answers memoized before are not from the new table
+
+
+def setSolarCache(cache):
+    """ Keep solar times on disk as well as in memory.
+
+    Args:
+        cache (KeyValueCache): on-disk cache, or None to only use memory
+    """
+
+    global _solarCache
+    _solarCache = cache
+    _solarTime.cache_clear()        # answers memoized before are not from the new cache
+
+
+@lru_cache(maxsize=None)
+def timezoneFinder():
+    """ Process-wide TimezoneFinder; its polygon data is only loaded once, on first use. """
+    from timezonefinder import TimezoneFinder
+    return TimezoneFinder()
+
+
+@lru_cache(maxsize=1024)
+@timed("timezone")
+def timezoneAt(lat: float, lon: float) -> str:
+    """ Name of the timezone at the coordinates (e.g., 'Asia/Jerusalem') """
+    return timezoneFinder().timezone_at(lat=lat, lng=lon)
+
+
+@lru_cache(maxsize=4096)
+def _solarTime(lat: float, lon: float, date: datetime.date, period: str) -> datetime.datetime:
+    if _solarTable and (hit := _solarTable.lookup(lat, lon, date, period)):
+        return hit
+
+    key = f"{lat},{lon},{date.isoformat()},{period}"
+    if _solarCache and (hit := _solarCache.get(key)):
+        return datetime.datetime.fromisoformat(hit)
+
+    tz = timezoneAt(lat, lon)
+    with span("solar time (astral)"):
+        from astral import Observer, sun
+        s = sun.sun(Observer(lat, lon), date=date, tzinfo=tz)
+
+    if _solarCache:
+        _solarCache.put(key, s[period].isoformat())
     return s[period]
 
 
@@ -157,3 +310,56 @@ def setAndFixFiscalDate(d):
     
     return d
 
+
+def fiscalTarget(date: str="04-20", time: str="sunset", address: str=None, lat: float=32.943608, lon: float=35.091979) -> datetime.datetime:
+    """ Date and time for which the gold price should be found.
+
+    Args:
+        date (str): fiscal date "MM-DD" or "today"
+        time (str): period of the sun (e.g., sunset), "now", or "HH:MM" (24-hour)
+        address (str, optional): city, state, and country if no latitude/longitude provided
+        lat (float): latitude
+        lon (float): longitude
+
+    Returns:
+        datetime: target date and time (local, naive)
+    """
+
+    fiscalDate = setAndFixFiscalDate(date)
+
+    if (period:= time.lower().rstrip()) in getSunPeriodTerms():
+        timeTmp = getSolarTime(address, lat, lon, period, fiscalDate)
+        return datetime.datetime.combine(fiscalDate, timeTmp.time())
+    elif period == 'now':
+        return datetime.datetime.now()
+    
+    return datetime.datetime.combine(fiscalDate, datetime.datetime.strptime(time, "%H:%M").time())
+
+
+def readLocations(file) -> List[dict]:
+    """ Locations from a CSV with the columns latitude, longitude and/or city, state, country.
+
+        Rows without coordinates are geocoded with addressToLatLong.
+
+    Args:
+        file (str, Path): CSV file
+
+    Returns:
+        List[dict]: {name: str, latitude: float, longitude: float}
+    """
+
+    locations = []
+    with open(file, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            row = { k.strip().lower(): (v or "").strip() for k, v in row.items() if k }
+            address = " ".join(row.get(k, "") for k in ('city', 'state', 'country'))
+
+            if row.get('latitude') and row.get('longitude'):
+                lat, lon = float(row['latitude']), float(row['longitude'])
+            else:
+                lat, lon = addressToLatLong(address)
+
+            name = row.get('name') or normalizeAddress(address).title() or f"{lat},{lon}"
+            locations.append({ 'name': name, 'latitude': lat, 'longitude': lon })
+
+    return locations
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+
+""" Sweeps: Ḥuqúqu'lláh over a grid of wealth and gold prices, and where the units flip.
+
+    The grid is calculated in one vectorized pass (HuququllahBatch). The unit breakpoints
+    need no grid at all: wealth reaches k units at exactly k * basic, and a price gives
+    k units of a wealth while it is at most wealth / (k * weight factor).
+"""
+
+# Standard library
+from array import array
+from decimal import Decimal, InvalidOperation, localcontext, ROUND_FLOOR
+from math import ceil, floor
+import struct
+import sys
+
+# 3rd Party Library
+from .huquq import EXACT, Huququllah, HuququllahBatch, toDecimal
+
+
+COLUMNS = ["wealth", "price", "basic", "remainder", "payable", "units"]
+_DOWN = EXACT.copy()
+_DOWN.rounding = ROUND_FLOOR    # price breakpoints are rounded down, so they still reach their units
+
+def parseRange(text: str) -> list:
+    """ Values of "start:stop:step" (stop included when on a step), or of a single value.
+
+    Raises:
+        ValueError: malformed range, or a step that is not positive
+    """
+
+    try:
+        parts = [ Decimal(p) for p in text.split(":") ]
+    except InvalidOperation:
+        raise ValueError(f"Range must be numbers, as start:stop:step or a single value: {text}")
+    if not all( p.is_finite() for p in parts ):
+        raise ValueError(f"Range must be finite numbers: {text}")
+    if len(parts) == 1:
+        return [float(parts[0])]
+    if len(parts) != 3 or parts[2] <= 0 or parts[1] < parts[0]:
+        raise ValueError(f"Range must be start:stop:step with a positive step and stop >= start: {text}")
+
+    start, stop, step = parts
+    return [ float(start + i * step) for i in range(int((stop - start) // step) + 1) ]
+
+
+def validate(wealth: list, price: list, weight: str="toz"):
+    """ Check the inputs of a sweep or its breakpoints before any work.
+
+    Raises:
+        ValueError: negative wealth, price not above zero, or unknown weight
+    """
+
+    Huququllah._weightFactor(weight)
+    if wealth[0] < 0:
+        raise ValueError(f"Wealth cannot be negative: {wealth[0]}")
+    if price[0] <= 0:
+        raise ValueError(f"Gold price must be above zero: {price[0]}")
+
+
+def sweep(wealth: list, price: list, weight: str="toz", currency: str="USD") -> HuququllahBatch:
+    """ Every (wealth, price) pair, wealth major: row i * len(price) + j is wealth[i] at price[j]. """
+
+    try:
+        import numpy as np
+    except ImportError:
+        return HuququllahBatch([ w for w in wealth for _ in price ], price * len(wealth), weight, currency)
+
+    return HuququllahBatch(np.repeat(np.asarray(wealth, dtype=np.float64), len(price)), np.tile(np.asarray(price, dtype=np.float64), len(wealth)), weight, currency)
+
+
+def wealthBreakpoints(price: list, low: float, high: float, weight: str="toz"):
+    """ Wealth at which each price's units go up, within [low, high].
+
+    Yields:
+        tuple: (price, units, wealth) with wealth exact (Decimal)
+    """
+
+    factor = toDecimal(Huququllah._weightFactor(weight))
+    low, high = toDecimal(low), toDecimal(high)
+    with localcontext(EXACT):
+        for p in price:
+            basic = toDecimal(p) * factor
+            for k in range(max(1, ceil(low / basic)), floor(high / basic) + 1):
+                yield (p, k, k * basic)
+
+
+def priceBreakpoints(wealth: list, low: float, high: float, weight: str="toz"):
+    """ Highest price at which each wealth still reaches a number of units, within [low, high].
+
+    Yields:
+        tuple: (wealth, units, price) with price to 34 digits, rounded down so it still reaches the units (Decimal)
+    """
+
+    factor = toDecimal(Huququllah._weightFactor(weight))
+    low, high = toDecimal(low), toDecimal(high)
+    with localcontext(EXACT):
+        for w in wealth:
+            w = toDecimal(w)
+            if not w:
+                continue
+            for k in range(max(1, ceil(w / (high * factor))), floor(w / (low * factor)) + 1):
+                yield (float(w), k, _DOWN.divide(w, k * factor))
+
+
+def columns(batch: HuququllahBatch) -> list:
+    """ The COLUMNS of a sweep as sequences of floats """
+    return [batch.wealth, batch.price, batch.basic, batch.remainder, batch.payable, batch.units]
+
+
+def writeCsv(cols: list, file=None):
+    """ Grid as CSV (COLUMNS), stdout if no file """
+    import csv
+
+    out = open(file, 'w', newline="") if file else sys.stdout
+    try:
+        csvwriter = csv.writer(out)
+        csvwriter.writerow(COLUMNS)
+        csvwriter.writerows(zip(*cols))
+    finally:
+        if file:
+            out.close()
+
+
+def writeNpy(cols: list, file):
+    """ Grid as a 2-D float64 NumPy array (one column per COLUMNS entry); written by hand when NumPy is not installed. """
+
+    try:
+        import numpy as np
+    except ImportError:
+        np = None
+
+    if np is not None:
+        np.save(file, np.column_stack([ np.asarray(c, dtype=np.float64) for c in cols ]))
+        return
+
+    rows = len(cols[0])
+    header = f"{{'descr': '<f8', 'fortran_order': False, 'shape': ({rows}, {len(cols)}), }}"
+    header += " " * (63 - (10 + len(header)) % 64) + "\n"     # pad so the data starts on a 64-byte boundary
+    data = array('d', ( float(v) for row in zip(*cols) for v in row ))
+    if sys.byteorder != "little":
+        data.byteswap()
+
+    with open(file, 'wb') as f:
+        f.write(b"\x93NUMPY\x01\x00" + struct.pack("<H", len(header)) + header.encode("latin1"))
+        f.write(data.tobytes())
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+
+""" Span timers for the stages of a run (geocoding, timezone, solar times, price APIs, records, ...).
+
+    Nothing is measured until a recorder is started, so the spans cost next to nothing otherwise.
+
+        from huh import timing
+
+        with timing.recording() as t:
+            huq = ...
+        print(t.report())       # or t.asdict() for JSON
+
+    Library code marks its stages with "with timing.span(name):" or the @timing.timed(name) decorator.
+"""
+
+# Standard library
+from contextlib import contextmanager
+from functools import wraps
+import json
+import threading
+from time import perf_counter
+
+
+class Timings():
+    """ Count, total and longest duration of every span name, in the order first seen.
+    """
+
+    def __init__(self):
+        self.started = perf_counter()
+        self.spans = {}
+        self._lock = threading.Lock()
+
+    def add(self, name: str, seconds: float):
+        with self._lock:
+            if (s := self.spans.get(name)) is None:
+                self.spans[name] = [1, seconds, seconds]
+            else:
+                s[0] += 1
+                s[1] += seconds
+                s[2] = max(s[2], seconds)
+
+    def asdict(self) -> dict:
+        """ Breakdown as JSON-serializable data (seconds) """
+        with self._lock:
+            spans = { name: {"count": c, "total": t, "max": m} for name, (c, t, m) in self.spans.items() }
+        return {"wall": perf_counter() - self.started, "spans": spans}
+
+    def report(self) -> str:
+        """ Breakdown as a table (milliseconds) """
+        data = self.asdict()
+        width = max([ len(n) for n in data['spans'] ] + [5])
+        lines = [f"{'stage':<{width}}  {'count':>5}  {'total ms':>10}  {'max ms':>10}"]
+        for name, s in data['spans'].items():
+            lines.append(f"{name:<{width}}  {s['count']:>5}  {s['total'] * 1e3:>10.1f}  {s['max'] * 1e3:>10.1f}")
+        lines.append(f"{'wall':<{width}}  {'':>5}  {data['wall'] * 1e3:>10.1f}")
+        return "\n".join(lines)
+
+    def json(self) -> str:
+        return json.dumps(self.asdict(), indent=2)
+
+
+_active = None
+
+class _Span():
+    __slots__ = ("timings", "name", "start")
+
+    def __init__(self, timings: Timings, name: str):
+        self.timings, self.name = timings, name
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.timings.add(self.name, perf_counter() - self.start)
+        return False
+
+
+class _NoSpan():
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NOSPAN = _NoSpan()
+
+def span(name: str):
+    """ Context manager timing a stage into the active recorder (if any) """
+    return _NOSPAN if _active is None else _Span(_active, name)
+
+
+def timed(name: str):
+    """ Decorator timing every call of a function as a stage """
+    def decorate(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _active is None:
+                return fn(*args, **kwargs)
+            with _Span(_active, name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def start() -> Timings:
+    """ Start recording spans (process wide, every thread) into a new Timings """
+    global _active
+    _active = Timings()
+    return _active
+
+
+def stop() -> Timings:
+    """ Stop recording; returns what was recorded (None if nothing was) """
+    global _active
+    timings, _active = _active, None
+    return timings
+
+
+def active() -> Timings:
+    return _active
+
+
+@contextmanager
+def recording():
+    """ Record the spans of the block """
+    timings = start()
+    try:
+        yield timings
+    finally:
+        stop()
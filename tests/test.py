@@ -1,35 +1,846 @@
-from huh.huquq import Huququllah
+import time
 from math import floor
 
+import pytest
+
+from huh.huquq import Huququllah
+
 def test_class_huquq():
-    h = Huququllah(metalPrice=1)
-    assert h.basic >= 0.0
-    assert h.unit == "Hq"
-    assert h.remainder == None
-    assert h.payable(0.00) == 0.00
+    h = Huququllah(0.0, 1.0)
+    assert h.basic == Huququllah._TROYOZ
+    assert h.remainder == 0.0
+    assert h.payable == 0.00
+    assert str(h) == "$0.00"
 
 def test_class_huquqlabel():
-    assert HuququLabels() == "huquq"
-    assert HuququLabels(default="nakhud_diacritic") == "nak͟hud"
+    from huh.huquq import HuququLabels
+
+    assert str(HuququLabels()) == "huququ'llah"
+    assert str(HuququLabels(default="nakhud_diacritic")) == "nak͟hud"
 
 def test_huquqllah_calc():
-    huq = Huququllah("1000", "500", "toz", "USD")
+    huq = Huququllah(1000.0, 500.0, "toz", "USD")
     assert floor(huq.basic) == 1112
     assert floor(huq.remainder) == 1000
     assert floor(huq.payable) == 0
 
-    huq = Huququllah("1200", "500", "toz", "USD")
+    huq = Huququllah(1200.0, 500.0, "toz", "USD")
     assert floor(huq.remainder) == 87
-    assert floor(huq.payable) == 0
+    assert floor(huq.payable) == 211
 
-    huq = Huququllah("2000", "500", "toz", "USD")
+    huq = Huququllah(2000.0, 500.0, "toz", "USD")
     assert floor(huq.remainder) == 887
     assert floor(huq.payable) == 211
 
 def test_huquqllah_calc_weights():
-    huq_troyoz = Huququllah("1500", "500", "toz", "USD")
-    huq_gram = Huququllah("1500", "16.08", "toz", "USD")
+    huq_troyoz = Huququllah(1500.0, 500.0, "toz", "USD")
+    huq_gram = Huququllah(1500.0, 16.08, "g", "USD")
 
     assert floor(huq_troyoz.basic) == floor(huq_gram.basic)
     assert floor(huq_troyoz.remainder) == floor(huq_gram.remainder)
     assert floor(huq_troyoz.payable) == floor(huq_gram.payable)
+
+def test_fetch_all_concurrent():
+    pytest.importorskip("requests")
+    from huh.metal import fetchAll, MetalPrice
+
+    def slow(times, currency, timeout):
+        time.sleep(0.3)
+        return [MetalPrice(1.0, times[0], currency, source="slow")]
+
+    def hung(times, currency, timeout):
+        time.sleep(2)
+        return [MetalPrice(2.0, times[0], currency, source="hung")]
+
+    start = time.perf_counter()
+    results = fetchAll([slow, slow, hung], (0, 1), "USD", timeout=1, deadline=0.6)
+    assert time.perf_counter() - start < 1
+    assert list(results) == [slow]
+
+def test_fetch_deadline_bounds_exit():
+    pytest.importorskip("requests")
+    import subprocess, sys
+
+    script = """if True:
+        import time
+        from huh.metal import MetalPrice, Provider, ProviderRegistry, fetchAll
+
+        class Hung(Provider):
+            name = "hung"
+
+            def fetch(self, times, currency="USD", timeout=1):
+                time.sleep(4)
+                return [MetalPrice(1.0, times[0], currency)]
+
+        assert fetchAll([Hung()], (0, 1), deadline=0.3) == {}
+        assert ProviderRegistry(strategy="hedged").fetchHedged([Hung()], (0, 1), deadline=0.3) == {}
+    """
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", script], check=True, timeout=10)
+    assert time.perf_counter() - start < 3          # a hung source is not joined at exit
+
+def test_fetch_all_skips_malformed():
+    pytest.importorskip("requests")
+    from huh.metal import ErrorAcquireMetalData, MetalPrice, Provider, fetchAll, goldPriceNowData
+
+    for answer in ({"items": [{}]}, {"items": [{"xauPrice": 1.0, "xagPrice": 1.0, "curr": "USD"}]}, {"items": "x"}, ["items"]):
+        with pytest.raises(ErrorAcquireMetalData):
+            goldPriceNowData(answer)
+
+    class Stub(Provider):
+        def __init__(self, name, error=None):
+            super().__init__()
+            self.name, self.error = name, error
+
+        def fetch(self, times, currency="USD", timeout=1):
+            if self.error:
+                raise self.error
+            return [MetalPrice(1.0, times[0], currency, source=self.name)]
+
+    good = Stub("good")
+    broken = [ Stub(type(e).__name__, e) for e in (KeyError("items"), IndexError("list index out of range"), TypeError("bad")) ]
+    assert list(fetchAll([*broken, good], (0, 1), "USD", timeout=1, deadline=1)) == [good]
+
+    import importlib.util
+    if importlib.util.find_spec("aiohttp"):
+        import asyncio
+        from huh import aio
+        assert list(asyncio.run(aio.fetchAll(None, [*broken, good], (0, 1), "USD", timeout=1, deadline=1))) == [good]
+        assert all( p.stats.errorRate > 0 for p in broken )
+
+def test_price_cache(tmp_path):
+    from huh.cache import PriceCache
+
+    cache = PriceCache(tmp_path / "cache.sqlite", ttl=0.2)
+    old = (1_000_000, 2_000_000)
+    cache.put("gold.org", "USD", "oz", old, [{"price": 1.0}])
+    cache.put("goldprice.org", "USD", "oz", None, [{"price": 2.0}])
+
+    assert cache.get("gold.org", "USD", "oz", old) == [{"price": 1.0}]
+    assert cache.get("gold.org", "CAD", "oz", old) is None
+    assert cache.get("goldprice.org", "USD", "oz") == [{"price": 2.0}]
+
+    time.sleep(0.3)
+    assert cache.get("goldprice.org", "USD", "oz") is None      # "now" quote expired
+    assert cache.get("gold.org", "USD", "oz", old) == [{"price": 1.0}]
+
+def test_http_get_pooled_retry():
+    pytest.importorskip("requests")
+    import gzip, json, threading
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from huh.metal import httpGet
+
+    seen = []
+    class Stub(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            seen.append(self.client_address)
+            if len(seen) == 1:
+                self.send_response(503)
+                self.send_header("content-length", "0")
+                self.end_headers()
+                return
+            body = gzip.compress(json.dumps({"ok": True}).encode())
+            self.send_response(200)
+            self.send_header("content-encoding", "gzip")
+            self.send_header("content-length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Stub)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/"
+    try:
+        assert httpGet(url).json() == {"ok": True}      # 503 is retried
+        assert httpGet(url).json() == {"ok": True}
+        assert len(seen) == 3
+        assert len(set(seen)) == 1                      # one keep-alive connection
+    finally:
+        server.shutdown()
+
+    import requests, socket
+    from urllib3.exceptions import ConnectTimeoutError, MaxRetryError
+    from huh.metal import session
+
+    silent, accepted = socket.socket(), []
+    silent.bind(("127.0.0.1", 0))
+    silent.listen(8)
+    threading.Thread(target=lambda: accepted.extend(iter(silent.accept, None)), daemon=True).start()
+    url = f"http://127.0.0.1:{silent.getsockname()[1]}/"
+    try:
+        start = time.perf_counter()
+        with pytest.raises(requests.Timeout):
+            httpGet(url, timeout=0.5)                   # a read timeout is not retried
+        assert time.perf_counter() - start < 1.0
+        assert len(accepted) == 1                       # on one connection
+    finally:
+        silent.close()
+
+    with pytest.raises(MaxRetryError):                  # nor is a connect timeout
+        session(url).get_adapter(url).max_retries.increment("GET", url, error=ConnectTimeoutError("timed out"))
+
+def test_batch_user_price(tmp_path):
+    pytest.importorskip("requests")
+    from huh.batch import Batch, readRows, writeRows
+    from huh.metal import MetalPrice
+
+    src = tmp_path / "ledger.csv"
+    src.write_text("wealth,currency\n1000,usd\n2000,usd\n")
+    out = tmp_path / "out.jsonl"
+
+    batch = Batch(price=MetalPrice(500.0, 0, "USD", "toz", source="user"), cache=False)
+    writeRows(batch.run(readRows(src)), out)
+
+    rows = list(readRows(out))
+    assert [ r["payable"] for r in rows ] == [0.0, round(Huququllah(2000.0, 500.0, "toz").payable, 2)]
+
+def test_record_ledger(tmp_path):
+    from datetime import datetime
+    from huh.huquq import recordMany
+    from huh.ledger import Ledger
+
+    pkgs = [ [datetime(2024, 4, 20, 12, i % 60), datetime(2024, 4, 19, 19, 30), 1713555000000, "2412.37", "oz", "USD", "gold.org", f"{1000 + i}.00", "0.00"]
+             for i in range(5000) ]
+    assert recordMany(pkgs, tmp_path / "record.sqlite") == 5000
+
+    ledger = Ledger(tmp_path / "record.sqlite")
+    assert len(list(ledger.rows("2024-04-20 12:10", "2024-04-20 12:10:59"))) == 5000 // 60 + (5000 % 60 > 10)
+    assert ledger.export(tmp_path / "record.csv") == 5000
+    ledger.close()
+
+    recordMany(pkgs, tmp_path / "appended.csv")
+    assert sorted((tmp_path / "record.csv").read_text().splitlines()) == sorted((tmp_path / "appended.csv").read_text().splitlines())
+
+def test_report(tmp_path):
+    from huh.huquq import recordMany
+    from huh.report import report
+
+    pkgs = [ [f"{2020 + i % 3}-04-20 12:00:00", "", 0, f"{1000 + i}.00", "oz", "USD" if i % 2 else "CAD", "user", "2000.00", f"{i}.00"]
+             for i in range(300) ]
+    recordMany(pkgs[:150], tmp_path / "record.csv")
+    recordMany(pkgs[150:], tmp_path / "record.sqlite")
+
+    groups = report([tmp_path / "record.csv", tmp_path / "record.sqlite"], ("year", "currency"), "2021", "2022")
+    assert set(groups) == {("2021", "CAD"), ("2021", "USD"), ("2022", "CAD"), ("2022", "USD")}
+
+    usd = [ p for i, p in enumerate(pkgs) if i % 3 == 1 and i % 2 ]
+    assert groups[("2021", "USD")]["count"] == len(usd)
+    assert groups[("2021", "USD")]["payable"] == sum(float(p[8]) for p in usd)
+    assert groups[("2021", "USD")]["min gold price"] == float(usd[0][3])
+    assert groups[("2021", "USD")]["max gold price"] == float(usd[-1][3])
+
+def test_huquqllah_batch_matches_scalar():
+    from huh.huquq import HuququllahBatch
+
+    wealth = [0.0, 1000.0, 1200.0, 2000.0, 123456.78]
+    prices = [500.0, 500.0, 16.08, 2412.37, 2412.37]
+    weights = ["toz", "toz", "g", "oz", "troy oz"]
+    batch = HuququllahBatch(wealth, prices, weights)
+
+    for i, w in enumerate(wealth):
+        huq = Huququllah(w, prices[i], weights[i])
+        assert (batch.basic[i], batch.remainder[i], batch.payable[i]) == (huq.basic, huq.remainder, huq.payable)
+        assert batch.units[i] == w // huq.basic
+
+    assert len(HuququllahBatch(wealth, 500.0)) == len(wealth)
+
+def test_huquqllah_exact_agrees_with_float():
+    import random
+    from decimal import Decimal
+    from huh.huquq import cents, HuququllahBatch
+
+    rng = random.Random(19)
+    wealth = [ round(rng.uniform(0, 2_000_000), 2) for _ in range(2000) ]
+    prices = [ round(rng.uniform(10, 5000), 2) for _ in range(2000) ]
+    weights = [ rng.choice(("toz", "g")) for _ in range(2000) ]
+    batch = HuququllahBatch(wealth, prices, weights, exact=True)
+
+    for i in range(len(wealth)):
+        fast, exact = Huququllah(wealth[i], prices[i], weights[i]), Huququllah(wealth[i], prices[i], weights[i], exact=True)
+        assert (batch.basic[i], batch.remainder[i], batch.payable[i]) == (exact.basic, exact.remainder, exact.payable)
+        assert exact.basic == Decimal(str(prices[i])) * Decimal(str(Huququllah._weightFactor(weights[i])))
+
+        # The float path agrees within rounding, except where a float error moves wealth across a unit boundary
+        if exact.wealth // exact.basic == fast.wealth // fast.basic:
+            assert abs(cents(exact.payable) - Decimal(str(cents(fast.payable)))) <= Decimal("0.01")
+
+    assert str(Huququllah(1000, 100, exact=True)) == "$169.07"
+    assert HuququllahBatch(wealth, prices, weights, exact=True).total() == sum(Huququllah(w, p, u, exact=True).payable for w, p, u in zip(wealth, prices, weights))
+
+def test_metal_price_series():
+    import random
+    import sys
+    from huh.metal import MetalPrice, MetalPriceSeries
+    from huh.spacetime import nearestTime
+
+    rng = random.Random(17)
+    points = sorted([ [rng.randrange(0, 10**9), rng.uniform(1000, 3000)] for _ in range(5000) ])
+    series = MetalPriceSeries.fromPoints(points, "CAD", source="gold.org")
+    views = list(series)
+    assert views[0] == MetalPrice(round(points[0][1], 2), points[0][0], "CAD", "oz", source="gold.org")
+
+    for target in [-5, 10**9 + 5] + [ rng.randrange(0, 10**9) for _ in range(200) ]:
+        assert series.nearest(target) == nearestTime(target, views)
+
+    window = series.range(10**8, 2 * 10**8)
+    assert list(window) == [ v for v in views if 10**8 <= v.timestamp <= 2 * 10**8 ]
+    assert sys.getsizeof(series.timestamps) + sys.getsizeof(series.prices) < sum(sys.getsizeof(v) + sys.getsizeof(v.__dict__) for v in views)
+
+    before = int(time.time() * 1000)
+    assert MetalPrice(2000.0).timestamp >= before
+
+def test_fx_convert_batch(tmp_path):
+    import datetime
+    from huh.batch import Batch
+    from huh.fx import Converter, RateTable
+    from huh.metal import MetalPrice
+
+    rates = tmp_path / "rates.csv"
+    rates.write_text("base,quote,timestamp,rate\nUSD,CAD,2024-04-19,1.375\nEUR,USD,2024-04-19,1.065\n")
+    table = RateTable(tmp_path / "rates.sqlite")
+    assert table.importFile(rates) == 2
+
+    lookups = []
+    nearest = table.nearest
+    table.nearest = lambda *args: lookups.append(args[:2]) or nearest(*args)
+    converter = Converter(table, refresh=False)
+
+    price = MetalPrice(2000.0, 1713528000000, "USD", "oz", source="user")
+    rows = [ {"wealth": "10000", "currency": curr} for curr in ("CAD", "EUR", "USD") * 50 ]
+    results = list(Batch(price=price, cache=False, converter=converter).run(rows))
+
+    assert [ r["price currency"] for r in results[:3] ] == ["CAD", "EUR", "USD"]
+    assert results[0]["gold price"] == round(2000.0 * 1.375, 2)
+    assert results[1]["gold price"] == round(2000.0 / 1.065, 2)
+    assert len(lookups) == 3    # USD/CAD, then USD/EUR and its reverse; every other row is memoized
+
+    with pytest.raises(LookupError):
+        converter.convert(price, "JPY")
+
+    refreshes = []
+    def refresh(base, date=None, timeout=None):
+        refreshes.append((base, date))
+        raise ValueError("provider down")
+
+    table.refresh = refresh
+    converter = Converter(table)
+    rows = [ {"wealth": "10000", "currency": curr} for curr in ("XAU", "JPY") * 25 ]
+    results = list(Batch(price=price, cache=False, converter=converter).run(rows))
+    assert all( r["price currency"] == "USD" for r in results )    # unconverted
+    assert refreshes == [("USD", datetime.date(2024, 4, 19))]       # misses and failed refreshes are memoized
+
+def test_timing_spans(tmp_path):
+    from huh import timing
+    from huh.huquq import HuququllahBatch, recordMany
+
+    with timing.span("ignored"):
+        pass
+    assert timing.active() is None
+
+    with timing.recording() as t:
+        with timing.span("stage"):
+            time.sleep(0.01)
+        HuququllahBatch([1000.0, 2000.0], 500.0)
+        recordMany([["a"] * 9, ["b"] * 9], tmp_path / "record.csv")
+        recordMany([["c"] * 9], tmp_path / "record.csv")
+
+    spans = t.asdict()["spans"]
+    assert list(spans) == ["stage", "calculate (batch)", "record"]
+    assert spans["stage"]["total"] >= 0.01
+    assert spans["record"]["count"] == 2
+    assert timing.active() is None
+    assert "record" in t.report()
+
+def test_sweep(tmp_path, monkeypatch):
+    from decimal import Decimal
+    from huh.sweep import columns, parseRange, priceBreakpoints, sweep, wealthBreakpoints, writeNpy
+
+    wealth, price = parseRange("0:20000:250"), parseRange("1500:2500:12.5")
+    assert (len(wealth), len(price), price[1]) == (81, 81, 1512.5)
+
+    grid = sweep(wealth, price, "toz")
+    for i in (0, 1234, len(grid) - 1):
+        huq = Huququllah(wealth[i // len(price)], price[i % len(price)], "toz")
+        assert (grid.basic[i], grid.remainder[i], grid.payable[i]) == (huq.basic, huq.remainder, huq.payable)
+
+    for p, k, w in wealthBreakpoints(price[:3], 0, 20000):
+        assert Huququllah(w, p, exact=True).wealth // Huququllah(w, p, exact=True).basic == k
+        assert Huququllah(w - Decimal("0.000001"), p, exact=True).wealth // Huququllah(w, p, exact=True).basic == k - 1
+    for w, k, p in priceBreakpoints(wealth[-3:], 1500, 2500):
+        assert 1500 <= p <= 2500 and Huququllah(w, p, exact=True).wealth // Huququllah(w, p, exact=True).basic >= k
+
+    from huh.__main__ import sweep_main
+    for argv in (["--wealth", "abc", "--price", "1:2:1"], ["--wealth", "0:100:50", "--price", "0:100:50", "--breakpoints"],
+                 ["--wealth", "0:100:50", "--price", "1:2:1", "--weight", "kg", "--breakpoints"], ["--wealth", "nan", "--price", "1"]):
+        with pytest.raises(SystemExit):                                 # a message, not a traceback
+            sweep_main(argv)
+
+    np = pytest.importorskip("numpy")
+    monkeypatch.setitem(__import__("sys").modules, "numpy", None)     # hand-written .npy
+    writeNpy(columns(grid), tmp_path / "grid.npy")
+    monkeypatch.undo()
+    assert np.array_equal(np.load(tmp_path / "grid.npy"), np.column_stack([ np.asarray(c, dtype=float) for c in columns(grid) ]))
+
+def test_solar_time_memoized(tmp_path):
+    pytest.importorskip("astral")
+    pytest.importorskip("timezonefinder")
+    import datetime
+    import huh.spacetime as st
+    from huh.cache import KeyValueCache
+
+    st.setSolarCache(KeyValueCache("solar", tmp_path / "cache.sqlite"))
+    try:
+        first = st.getSolarTime(date=datetime.date(2024, 4, 20))
+        assert st.getSolarTime(date=datetime.datetime(2024, 4, 20)) == first
+        assert st.timezoneFinder.cache_info().currsize <= 1
+
+        st._solarTime.cache_clear()
+        assert st.getSolarTime(date=datetime.date(2024, 4, 20)) == first      # read back from disk
+
+        class Table():
+            def lookup(self, lat, lon, date, period):
+                return first + datetime.timedelta(minutes=1)
+
+        st.setSolarTable(Table())                                             # memoized times are not served past a new table
+        assert st.getSolarTime(date=datetime.date(2024, 4, 20)) == first + datetime.timedelta(minutes=1)
+    finally:
+        st.setSolarTable(None)
+        st.setSolarCache(None)
+
+def test_address_offline(tmp_path):
+    pytest.importorskip("geopy")
+    import huh.spacetime as st
+    from huh.cache import KeyValueCache
+
+    places = tmp_path / "places.csv"
+    places.write_text("city,state,country,latitude,longitude\nHaifa,Haifa,Israel,32.794,34.9896\n")
+    gazetteer = KeyValueCache("gazetteer", tmp_path / "cache.sqlite")
+    geocode = KeyValueCache("geocode", tmp_path / "cache.sqlite")
+    geocode.put(st.normalizeAddress("Akka North Israel"), [32.93, 35.08])
+
+    assert st.importGazetteer(places, gazetteer) == 2
+    assert st.importGazetteer(places, gazetteer) == 0       # unchanged file is not imported again
+
+    st.setGeocodeCache(geocode, gazetteer)
+    try:
+        assert st.addressToLatLong("haifa  Haifa ISRAEL") == [32.794, 34.9896]
+        assert st.addressToLatLong("Akka North Israel") == [32.93, 35.08]
+    finally:
+        st.setGeocodeCache(None)
+
+def test_solar_table_matches_astral(tmp_path):
+    pytest.importorskip("astral")
+    pytest.importorskip("timezonefinder")
+    import datetime
+    import huh.spacetime as st
+    from huh.solartable import generateSolarTable, SolarTable
+
+    generateSolarTable(tmp_path / "solar.table", [(32.943608, 35.091979)], 2024, 2024)
+    table = SolarTable(tmp_path / "solar.table")
+    try:
+        for period in st.getSunPeriodTerms():
+            assert table.lookup(32.943608, 35.091979, datetime.date(2024, 4, 20), period) == st._solarTime(32.943608, 35.091979, datetime.date(2024, 4, 20), period)
+        assert table.lookup(32.943608, 35.091979, datetime.date(2025, 1, 1), "noon") is None
+        assert table.lookup(0.0, 0.0, datetime.date(2024, 4, 20), "noon") is None
+    finally:
+        table.close()
+
+def test_price_history(tmp_path):
+    import datetime, json
+    from huh.history import PriceHistory
+
+    dump = tmp_path / "chart.json"
+    dump.write_text(json.dumps({"chartData": {"USD": [[1000, 1.0], [5000, 5.0], [9000, None]], "EUR": [[1000, 0.9]]}}))
+    rows = tmp_path / "prices.csv"
+    rows.write_text("timestamp,price,currency\n3000,3.0,usd\n2024-04-20T19:00:00,2400.0,USD\n")
+
+    history = PriceHistory(tmp_path / "history.sqlite")
+    assert history.importFile(dump) == 3
+    assert history.importFile(rows) == 2
+
+    assert history.nearest(2100, "usd") == (3000, 3.0, "import")
+    assert history.nearest(4100, "USD") == (5000, 5.0, "import")
+    assert history.nearest(1, "EUR") == (1000, 0.9, "import")
+    assert history.nearest(1, "CAD") is None
+    assert [ r[0] for r in history.range(0, 5000) ] == [1000, 3000, 5000]
+
+    pytest.importorskip("requests")
+    from huh.metal import metal_price
+    target = datetime.datetime(2024, 4, 20, 19, 10)
+    m = metal_price(target, "USD", cache=False, history=history)     # answered without any API call
+    assert (m.price, m.source) == (2400.0, "import")
+
+IMPORT_BUDGET_MS = 150
+
+def test_price_path_import_time():
+    """ '--price' runs must not load the network/astronomy libraries and must start within the budget """
+    import subprocess, sys
+    from pathlib import Path
+
+    root = Path(__file__).resolve().parent.parent
+    run = subprocess.run([sys.executable, "-X", "importtime", "-m", "huh", "2000", "-p", "usd,2000,toz", "-n", "-f", "huh.ini"],
+                         cwd=root, capture_output=True, text=True)
+    assert run.returncode == 0, run.stderr
+
+    imported, total = set(), 0
+    for line in run.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line and "cumulative" not in line:
+            _, cumulative, name = line.split("|")
+            imported.add(name.strip().split(".")[0])
+            if not name.startswith("  ") and name.strip().split(".")[0] == "huh":
+                total += int(cumulative)
+
+    assert not imported & {"requests", "urllib3", "astral", "geopy", "timezonefinder", "numpy"}
+    assert total / 1000 < IMPORT_BUDGET_MS
+
+def test_price_run_records_target(tmp_path):
+    import csv, datetime, subprocess, sys
+    from pathlib import Path
+
+    root = Path(__file__).resolve().parent.parent
+    ini = (root / "huh.ini").read_text().replace("time = sunset", "time = 12:00").replace("[RECORD]", f"[RECORD]\nfile = {tmp_path / 'record.csv'}")
+    (tmp_path / "huh.ini").write_text(ini)
+
+    run = subprocess.run([sys.executable, "-m", "huh", "2000", "-p", "usd,2000,toz", "-n", "-f", tmp_path / "huh.ini"], cwd=root, capture_output=True, text=True)
+    assert run.returncode == 0, run.stderr
+    row = next(csv.reader(open(tmp_path / "record.csv")))
+    assert datetime.datetime.fromisoformat(row[1]).strftime("%m-%d %H:%M") == "04-20 12:00"     # the fiscal target is recorded
+
+def test_backfill(tmp_path, monkeypatch):
+    pytest.importorskip("astral")
+    pytest.importorskip("timezonefinder")
+    import datetime
+    from huh.backfill import backfill, clusters, fiscalInstants
+    from huh.history import PriceHistory
+    from huh.huquq import cents
+    import huh.spacetime as st
+
+    locations = [{"name": "Haifa", "latitude": 32.794, "longitude": 34.9896}, {"name": "Toronto", "latitude": 43.6532, "longitude": -79.3832}]
+    instants = fiscalInstants("04-20", "sunset", locations, 2020, 2022, processes=2)
+    assert instants == fiscalInstants("04-20", "sunset", locations, 2020, 2022, processes=0)
+
+    history = PriceHistory(tmp_path / "history.sqlite")
+    history.addRows(("USD", "oz", st.datetimeToEpoch(moment), 1000.0 + year, "import") for year, _, moment in instants)
+
+    rows = list(backfill("04-20", "sunset", locations, 2020, 2022, amount=10000.0, cache=False, history=history))
+    assert [ (r["year"], r["location"]) for r in rows ] == [ (y, l["name"]) for l in locations for y in (2020, 2021, 2022) ]
+    assert rows[0]["payable"] == cents(Huququllah(10000.0, 3020.0, "oz").payable)
+
+    class Halve():
+        def convert(self, m, currency):
+            return MetalPrice(m.price / 2, m.timestamp, currency, m.weight, source=m.source)
+    from huh.metal import MetalPrice
+    import huh.backfill
+    monkeypatch.setattr(huh.backfill, "metal_price", lambda *args, **kwargs: MetalPrice(3000.0, currency="USD"))   # provider fell back to USD
+    rows = list(backfill("04-20", "sunset", locations[:1], 2020, 2020, "CAD", amount=10000.0, cache=False, history=False, converter=Halve()))
+    assert (rows[0]["price currency"], rows[0]["gold price"]) == ("CAD", 1500.0)
+
+    for processes in (0, 2):                                        # both paths treat the fiscal date and time alike
+        for date, time_ in (("today", "sunset"), ("04-20", "now"), ("13-40", "sunset")):
+            with pytest.raises(ValueError):
+                fiscalInstants(date, time_, locations, 2020, 2021, processes=processes)
+        assert [ m for _, _, m in fiscalInstants("02-29", "sunset", locations, 2021, 2021, processes=processes) ] == [None, None]
+
+    t = datetime.datetime(2020, 4, 20, 19)
+    assert clusters([t + datetime.timedelta(hours=3), t, t + datetime.timedelta(minutes=1), t]) == [[t, t + datetime.timedelta(minutes=1)], [t + datetime.timedelta(hours=3)]]
+
+def test_serve(tmp_path):
+    import datetime, json, threading
+    from urllib.error import HTTPError
+    from urllib.request import urlopen
+    from huh.history import PriceHistory
+    from huh.server import Service, serve
+    import huh.spacetime as st
+
+    target = datetime.datetime.combine(st.setAndFixFiscalDate("04-20"), datetime.time(12, 0))
+    history = PriceHistory(tmp_path / "history.sqlite")
+    history.addRows([("USD", "oz", st.datetimeToEpoch(target), 2400.0, "import")])
+
+    server = serve(Service(date="04-20", time="12:00", cache=False, history=history), port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}"
+    get = lambda path: json.load(urlopen(url + path))
+    try:
+        assert get("/health") == {"status": "ok"}
+        assert get("/huquq?wealth=2000&price=500&weight=toz")["payable"] == Huququllah(2000.0, 500.0, "toz").payable
+        assert get("/price")["price"] == 2400.0
+        assert get("/huquq?wealth=10000")["payable"] == Huququllah(10000.0, 2400.0, "oz").payable
+        for bad in ("", "?wealth=2000&price=500&basic=0", "?wealth=2000&price=-5", "?wealth=2000&price=abc"):
+            with pytest.raises(HTTPError) as e:
+                urlopen(url + "/huquq" + bad)
+            assert e.value.code == 400 and "error" in json.load(e.value)
+
+        def exits(*args):
+            raise SystemExit(-1)
+        server.service.priceInfo = exits                    # library code that gives up still gets an answer
+        with pytest.raises(HTTPError) as e:
+            urlopen(url + "/price")
+        assert e.value.code == 500
+    finally:
+        server.shutdown()
+
+def test_prefetch_schedule(tmp_path):
+    import datetime
+    from huh.history import PriceHistory
+    from huh.metal import MetalPrice
+    from huh.prefetch import Prefetcher, fiscalMoment
+    import huh.spacetime as st
+
+    moment = fiscalMoment("04-20", "12:00", 2030)
+    assert moment == datetime.datetime(2030, 4, 20, 12, 0)
+
+    now = lambda curr: [MetalPrice(2400.0, st.datetimeToEpoch(moment), curr, source="stub")]
+    chart = lambda start, end, curr: [MetalPrice(2401.0, start, curr, source="stub")]
+    history = PriceHistory(tmp_path / "history.sqlite")
+    locations = [{ 'name': "Bahji", 'latitude': 32.943608, 'longitude': 35.091979 }]
+    prefetcher = Prefetcher("04-20", "12:00", locations, ["usd"], history, interval=600, forever=False, fetchNow=now, fetchRange=chart)
+
+    assert prefetcher.plan(after=moment - datetime.timedelta(minutes=10)) == [(moment, locations[0])]
+    events = prefetcher.scheduler.queue
+    assert len(events) == 7                 # polls every 10 minutes until 45 minutes after, then the chart
+    for event in events:
+        event.action(*event.argument)
+
+    assert history.nearest(st.datetimeToEpoch(moment), "USD")[1] == 2400.0
+    assert len(history.range(0, st.datetimeToEpoch(moment + datetime.timedelta(hours=1)))) == 2
+
+def test_metal_price_recent_history(tmp_path):
+    pytest.importorskip("requests")
+    import datetime
+    from huh.history import PriceHistory
+    from huh.metal import MetalPrice, metal_price, Provider, ProviderRegistry
+    import huh.spacetime as st
+
+    class Live(Provider):
+        name, live, calls = "live", True, 0
+
+        def fetch(self, times, currency="USD", timeout=1):
+            Live.calls += 1
+            return [MetalPrice(1.0, currency=currency, source=self.name)]
+
+    history = PriceHistory(tmp_path / "history.sqlite")
+    registry = ProviderRegistry([Live()])
+    now = datetime.datetime.now()
+    moment = now - datetime.timedelta(minutes=30)       # within the window metal_price searches, so not past
+    history.add([MetalPrice(2400.0, st.datetimeToEpoch(moment + datetime.timedelta(minutes=2)), "USD", source="prefetch")])
+
+    assert metal_price(moment, cache=False, history=history, registry=registry).price == 2400.0     # prefetched, no fetch
+    assert Live.calls == 0
+    assert metal_price(now, cache=False, history=history, registry=registry).price == 1.0           # a fresh quote is closer
+    assert Live.calls == 1
+
+    import importlib.util
+    if importlib.util.find_spec("aiohttp"):
+        import asyncio
+        from huh import aio
+        assert asyncio.run(aio.async_metal_price(moment, cache=False, history=history, registry=registry)).price == 2400.0
+        assert Live.calls == 1
+
+def test_provider_registry_hedged():
+    pytest.importorskip("requests")
+    from huh.metal import MetalPrice, Provider, ProviderRegistry
+
+    class Stub(Provider):
+        def __init__(self, name, delay, fail=False):
+            super().__init__()
+            self.name, self.delay, self.fail = name, delay, fail
+
+        def fetch(self, times, currency="USD", timeout=1):
+            time.sleep(self.delay)
+            if self.fail:
+                raise ValueError("down")
+            return [MetalPrice(1.0, times[0], currency, source=self.name)]
+
+    fast, slow, broken = Stub("fast", 0.01), Stub("slow", 1.0), Stub("broken", 0, fail=True)
+    registry = ProviderRegistry([slow, fast, broken], strategy="hedged")
+    slow.stats.latency = 0.05                       # usually quick, so it is hedged after 0.1s
+
+    start = time.perf_counter()
+    results = registry.fetch([slow, fast], (0, 1))
+    assert list(results) == [fast]
+    assert time.perf_counter() - start < 0.5
+
+    for _ in range(registry.MIN_CALLS):
+        with pytest.raises(ValueError):
+            broken((0, 1))
+    assert broken not in registry.ranked()          # unhealthy providers are dropped
+    assert registry.ranked()[0] is fast             # and the fastest ranks first
+
+    registry.enable("fast", False)
+    assert registry.ranked() == [slow]
+
+def test_async_metal_price(monkeypatch):
+    pytest.importorskip("aiohttp")
+    import asyncio, datetime, json, threading
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from huh import aio
+    from huh.metal import GoldOrg, MetalPrice, ProviderRegistry
+
+    class Stub(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        wbufsize = -1
+
+        def do_GET(self):
+            if self.path.startswith("/slow"):
+                time.sleep(1.0)
+            start, end = ( int(t) for t in self.path.rsplit("/", 1)[1].split(",") )
+            body = json.dumps({"chartData": {"USD": [[start, 2000.0], [end, 2100.0]]}}).encode()
+            self.send_response(200)
+            self.send_header("content-length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Stub)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}"
+    target = datetime.datetime(2020, 4, 20, 18, 0)
+    provider = GoldOrg()
+    registry = ProviderRegistry([provider])
+
+    async def price(**kwargs):
+        return await aio.async_metal_price(target, cache=False, history=False, registry=registry, **kwargs)
+
+    async def concurrent():
+        return await asyncio.gather(*[ price() for _ in range(5) ])
+
+    async def cancelled():
+        task = asyncio.ensure_future(price(timeout=5))
+        await asyncio.sleep(0.1)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    async def calculate():
+        return await aio.async_huququllah(10000, "04-20", "18:00", lat=0, lon=0, price=MetalPrice(2000.0, weight="oz"))
+
+    try:
+        monkeypatch.setattr(aio, "GOLDORG_URL", url + "/chart/{currency}/{weight}/{start},{end}")
+        prices = asyncio.run(concurrent())
+        assert all( m.source == "gold.org" and m.price in (2000.0, 2100.0) for m in prices )
+        assert provider.stats.calls == 5 and provider.stats.errorRate == 0
+
+        monkeypatch.setattr(aio, "GOLDORG_URL", url + "/slow/{currency}/{weight}/{start},{end}")
+        start = time.perf_counter()
+        assert asyncio.run(price(timeout=0.2)) is None          # timed out, counted as a failure
+        assert time.perf_counter() - start < 0.8
+        assert provider.stats.errorRate > 0
+        asyncio.run(cancelled())
+
+        huq, m = asyncio.run(calculate())
+        assert huq.price == 2000.0 and m.weight == "oz"
+    finally:
+        server.shutdown()
+
+def test_chart_parser_streaming():
+    import json, tracemalloc
+    from huh.metal import ChartParser, ChartReader, ErrorAcquireMetalData, ErrorMetalDataConvert
+
+    def parse(body: bytes, size: int):
+        chart = ChartReader("USD")
+        for i in range(0, len(body), size):
+            chart.feed(body[i:i + size])
+        return chart.result()
+
+    small = json.dumps({"note": "ḥuqúq \"chartData\"", "chartData": {"usd": [[3, 2000.004], [1, 1999.5], [2, 2001]]}, "x": 1}, ensure_ascii=False).encode()
+    for size in (1, 3, 7, len(small)):                  # cut through keys, numbers and multi-byte characters
+        series = parse(small, size)
+        assert list(series.timestamps) == [1, 2, 3] and list(series.prices) == [1999.5, 2001.0, 2000.0]
+        assert series.currency == "USD"
+
+    with pytest.raises(ErrorAcquireMetalData):
+        parse(b"{ }", 1)
+    with pytest.raises(ErrorMetalDataConvert):
+        parse(b'{"chartData": {"USD": [[1, 2], [3', 4)  # cut short
+    assert parse(b'{"chartData": {"dollars": [[1, 2]]}}', 5) == []
+    assert parse(b'{"chartData": {"USD": [[1, "n/a"], [2, 2000]]}}', 5) == []     # unusable points
+
+    series = parse(b'{"chartData": {"USD": [[1, 2000], [2, null], [3, 2001]]}, "tail": "' + b"x" * 1000 + b'"}', 4)
+    assert list(series.timestamps) == [1, 3]                      # points without a price are skipped, not the chart
+    parser = ChartParser()
+    parser.feed(b'{"chartData": {"USD": [[1, 2]]}, "tail": "')
+    for _ in range(100):
+        assert parser.feed(b"x" * 1000) == []
+    assert parser._buf == ""                                        # nothing kept once the series is complete
+
+    body = json.dumps({"chartData": {"USD": [ [1_600_000_000_000 + i * 60_000, 2000.123456 + i % 97] for i in range(200_000) ]}}).encode()
+    tracemalloc.start()
+    series = parse(body, 64 * 1024)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    assert len(series) == 200_000 and series.prices[-1] == round(2000.123456 + 199_999 % 97, 2)
+    assert peak < len(body)                             # json.loads alone would need several times the body
+
+def test_single_flight(tmp_path):
+    import datetime, multiprocessing, sys, threading
+    from huh.cache import PriceCache
+    from huh.metal import MetalPrice, metal_price, Provider, ProviderRegistry
+
+    calls = tmp_path / "calls"
+    class Slow(Provider):
+        name = "slow"
+
+        def fetch(self, times, currency="USD", timeout=1):
+            with open(calls, "a") as f:
+                f.write("x")
+            time.sleep(0.3)
+            return [MetalPrice(2000.0, times[0], currency, source=self.name)]
+
+    target = datetime.datetime(2020, 4, 20, 18, 0)
+    registry = ProviderRegistry([Slow()])
+
+    # Threads of one process share the one fetch in flight
+    prices = []
+    threads = [ threading.Thread(target=lambda: prices.append(metal_price(target, cache=False, history=False, registry=registry))) for _ in range(8) ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert calls.read_text() == "x" and len(prices) == 8 and all( m.price == 2000.0 for m in prices )
+
+    # Processes sharing a cache elect one leader; the others read its answer from the cache
+    if sys.platform.startswith("win"):
+        return
+    calls.unlink()
+    answers = tmp_path / "answers"
+    def run():
+        m = metal_price(target, cache=PriceCache(tmp_path / "cache.sqlite"), history=False, registry=registry)
+        with open(answers, "a") as f:
+            f.write(f"{m.price}\n")
+
+    ctx = multiprocessing.get_context("fork")
+    procs = [ ctx.Process(target=run) for _ in range(4) ]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join(10)
+    assert calls.read_text() == "x"
+    assert answers.read_text().split() == ["2000.0"] * 4
+
+def test_metal_price_one_deadline():
+    pytest.importorskip("requests")
+    import datetime
+    from huh.metal import MetalPrice, metal_price, Provider, ProviderRegistry
+
+    class Hanging(Provider):
+        def __init__(self, name, live):
+            super().__init__()
+            self.name, self.live = name, live
+
+        def fetch(self, times, currency="USD", timeout=1):
+            time.sleep(3)
+            return [MetalPrice(1.0, times[0], currency, source=self.name)]
+
+    target = datetime.datetime(2020, 4, 20, 18, 0)                 # past, so the live provider is only a fallback
+    for strategy in ("parallel", "hedged"):
+        registry = ProviderRegistry([Hanging("chart", False), Hanging("now", True)], strategy=strategy)
+        start = time.perf_counter()
+        assert metal_price(target, deadline=0.5, cache=False, history=False, registry=registry) is None
+        assert time.perf_counter() - start < 0.8                    # one deadline for every provider, not one each